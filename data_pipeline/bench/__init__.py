@@ -0,0 +1 @@
+# End-to-end benchmarks: fake provider APIs, a PostgREST stand-in and synthetic datasets
@@ -0,0 +1,273 @@
+"""
+Seeded synthetic datasets for benchmarks
+
+`SyntheticDataset` draws teams (five players each), finished and upcoming
+matches with per-map results, per-map player stats, match odds and player
+props from a seed. Everything is kept as compact arrays and materialised on
+demand, either as API payloads in each provider's shape (for the fake API
+servers) or as database rows (to seed the PostgREST stand-in).
+"""
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+
+SCALES = {
+    "small": {"teams": 200, "matches": 2_000, "odds_rows": 20_000, "stats_matches": 500},
+    "medium": {"teams": 2_000, "matches": 20_000, "odds_rows": 200_000, "stats_matches": 5_000},
+    "large": {"teams": 10_000, "matches": 100_000, "odds_rows": 1_000_000, "stats_matches": 20_000},
+}
+
+PLAYERS_PER_TEAM = 5
+UPCOMING_SHARE = 0.05
+MAPS = ("Ancient", "Anubis", "Dust2", "Inferno", "Mirage", "Nuke", "Train")
+BOOKMAKERS = ("pinnacle", "bet365", "betway", "ggbet", "thunderpick", "unibet", "1xbet", "rivalry")
+MARKETS = ("h2h", "spreads", "totals", "map1_winner", "map2_winner")
+PROP_BOOKS = ("pinnacle", "bet365")
+
+# Fixed clock so a seed always gives the same dataset
+REFERENCE_TIME = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class SyntheticDataset:
+    """A seeded CS2 world at a given scale"""
+
+    def __init__(self, scale: str = "small", seed: int = 7, **overrides):
+        self.scale = scale
+        self.size = {**SCALES[scale], **overrides}
+        rng = np.random.default_rng(seed)
+
+        n_teams, n_matches = self.size["teams"], self.size["matches"]
+        self.strength = rng.normal(0, 1, n_teams)
+        self.n_upcoming = max(int(n_matches * UPCOMING_SHARE), 1)
+        self.n_finished = n_matches - self.n_upcoming
+
+        # Matches 0..n_finished-1 are finished, oldest first; the rest upcoming
+        self.team1 = rng.integers(0, n_teams, n_matches)
+        self.team2 = (self.team1 + rng.integers(1, n_teams, n_matches)) % n_teams
+        self.best_of = rng.choice([1, 3, 3, 3, 5], n_matches)
+        now = REFERENCE_TIME.timestamp()
+        past = np.sort(rng.uniform(now - 730 * 86400, now - 3600, self.n_finished))
+        future = np.sort(rng.uniform(now + 3600, now + 7 * 86400, self.n_upcoming))
+        self.scheduled = np.concatenate([past, future])
+
+        # Per-map winners from team strength; series stop at maps_to_win
+        max_maps = int(self.best_of.max())
+        p_map = 1.0 / (1.0 + np.exp(-(self.strength[self.team1] - self.strength[self.team2])))
+        map_wins = rng.random((n_matches, max_maps)) < p_map[:, None]
+        # Distinct maps within a series, as after a veto
+        self.maps = np.argsort(rng.random((n_matches, len(MAPS))), axis=1)[:, :max_maps]
+        self.rounds = rng.integers(2, 12, (n_matches, max_maps))
+        need = self.best_of // 2 + 1
+        won1 = np.cumsum(map_wins, axis=1)
+        won2 = np.cumsum(~map_wins, axis=1)
+        done = (won1 >= need[:, None]) | (won2 >= need[:, None])
+        self.maps_played = np.argmax(done, axis=1) + 1
+        idx = np.arange(n_matches)
+        self.score1 = won1[idx, self.maps_played - 1]
+        self.score2 = won2[idx, self.maps_played - 1]
+        self.map_wins = map_wins
+
+        # Per-player kill rates for stats and props
+        self.kill_rate = rng.gamma(20.0, 0.9, n_teams * PLAYERS_PER_TEAM)
+
+    # ==================== IDS ====================
+    @staticmethod
+    def team_external(i: int) -> str:
+        return str(100_000 + int(i))
+
+    @staticmethod
+    def player_external(i: int) -> str:
+        return str(1_000_000 + int(i))
+
+    @staticmethod
+    def match_external(i: int) -> str:
+        return str(5_000_000 + int(i))
+
+    def finished(self, i: int) -> bool:
+        return i < self.n_finished
+
+    # ==================== API PAYLOADS ====================
+    def pandascore_team(self, i: int) -> dict:
+        return {"id": int(self.team_external(i)), "name": f"Team {i}", "slug": f"team-{i}",
+                "acronym": f"T{i}", "image_url": None, "location": "EU"}
+
+    def pandascore_player(self, i: int) -> dict:
+        return {"id": int(self.player_external(i)), "name": f"player{i}", "first_name": "Bench",
+                "last_name": str(i), "current_team": {"id": int(self.team_external(i // PLAYERS_PER_TEAM))},
+                "nationality": "EU", "age": 20 + i % 10, "role": "rifler", "image_url": None}
+
+    def pandascore_match(self, i: int) -> dict:
+        t1, t2 = int(self.team_external(self.team1[i])), int(self.team_external(self.team2[i]))
+        finished = self.finished(i)
+        games = []
+        if finished:
+            for g in range(self.maps_played[i]):
+                winner = t1 if self.map_wins[i, g] else t2
+                loser = t2 if winner == t1 else t1
+                games.append({
+                    "position": g + 1,
+                    "map": {"name": MAPS[self.maps[i, g]]},
+                    "winner": {"id": winner},
+                    "results": [{"team_id": winner, "score": 13}, {"team_id": loser, "score": 13 - int(self.rounds[i, g])}],
+                })
+        return {
+            "id": int(self.match_external(i)),
+            "league": {"id": 1, "name": "Bench League"},
+            "opponents": [{"opponent": {"id": t1}}, {"opponent": {"id": t2}}],
+            "results": [{"score": int(self.score1[i])}, {"score": int(self.score2[i])}] if finished else [],
+            "winner": {"id": t1 if self.score1[i] > self.score2[i] else t2} if finished else None,
+            "number_of_games": int(self.best_of[i]),
+            "status": "finished" if finished else "not_started",
+            "scheduled_at": _iso(self.scheduled[i]),
+            "begin_at": _iso(self.scheduled[i]) if finished else None,
+            "end_at": _iso(self.scheduled[i] + 7200) if finished else None,
+            "games": games,
+        }
+
+    def abios_team(self, i: int) -> dict:
+        return {"id": int(i), "name": f"Team {i}", "short_name": f"T{i}", "images": {}, "country": {"name": "EU"}}
+
+    def abios_player(self, i: int) -> dict:
+        return {"id": int(i), "nick_name": f"player{i}", "first_name": "Bench", "last_name": str(i),
+                "team": {"id": int(i // PLAYERS_PER_TEAM)}, "country": {"name": "EU"}, "images": {}}
+
+    def abios_series(self, i: int) -> dict:
+        t1, t2 = int(self.team1[i]), int(self.team2[i])
+        finished = self.finished(i)
+        return {
+            "id": int(i), "tournament": {"id": 1, "title": "Bench League"},
+            "rosters": [{"team": {"id": t1}}, {"team": {"id": t2}}],
+            "scores": {str(t1): int(self.score1[i]), str(t2): int(self.score2[i])} if finished else {},
+            "format": {"best_of": int(self.best_of[i])},
+            "lifecycle": "over" if finished else "upcoming",
+            "start": _iso(self.scheduled[i]),
+            "end": _iso(self.scheduled[i] + 7200) if finished else None,
+        }
+
+    def odds_events(self, bookmakers: List[str] = None) -> List[dict]:
+        """OddsPapi events for upcoming matches, about odds_rows outcomes in total"""
+        books = list(bookmakers or BOOKMAKERS)
+        n_events = min(self.n_upcoming, max(self.size["odds_rows"] // (len(BOOKMAKERS) * len(MARKETS) * 2), 1))
+        # Spread the requested rows over more markets per event when there are few events
+        repeats = max(self.size["odds_rows"] // (n_events * len(BOOKMAKERS) * len(MARKETS) * 2), 1)
+        events = []
+        for k in range(n_events):
+            i = self.n_finished + k
+            p = 1.0 / (1.0 + np.exp(-(self.strength[self.team1[i]] - self.strength[self.team2[i]])))
+            bookmaker_rows = []
+            for b, book in enumerate(books):
+                margin = 1.03 + 0.01 * (b % 4)
+                markets = []
+                for r in range(repeats):
+                    for market in MARKETS:
+                        line = None if market in ("h2h", "map1_winner", "map2_winner") else 1.5 + r
+                        markets.append({"key": market, "outcomes": [
+                            {"name": f"Team {self.team1[i]}", "price": round(1.0 / (p * margin), 3), "point": line},
+                            {"name": f"Team {self.team2[i]}", "price": round(1.0 / ((1 - p) * margin), 3),
+                             "point": -line if line is not None else None},
+                        ]})
+                bookmaker_rows.append({"key": book, "markets": markets})
+            events.append({
+                "event_id": self.match_external(i),
+                "home_team": f"Team {self.team1[i]}", "away_team": f"Team {self.team2[i]}",
+                "commence_time": _iso(self.scheduled[i]),
+                "bookmakers": bookmaker_rows,
+            })
+        return events
+
+    # ==================== DATABASE ROWS ====================
+    def seed_rows(self) -> Iterator[tuple]:
+        """(table, rows) in foreign-key order, with deterministic UUID-like ids"""
+        n_teams = self.size["teams"]
+        team_id = lambda i: f"00000000-0000-4000-8000-{int(i):012d}"
+        player_id = lambda i: f"00000000-0000-4000-9000-{int(i):012d}"
+        match_id = lambda i: f"00000000-0000-4000-a000-{int(i):012d}"
+
+        yield "cs2_teams", [
+            {"id": team_id(i), "external_id": self.team_external(i), "name": f"Team {i}", "source": "pandascore"}
+            for i in range(n_teams)
+        ]
+        yield "cs2_players", [
+            {"id": player_id(i), "external_id": self.player_external(i), "name": f"player{i}",
+             "team_id": team_id(i // PLAYERS_PER_TEAM), "source": "pandascore"}
+            for i in range(n_teams * PLAYERS_PER_TEAM)
+        ]
+
+        matches = []
+        for i in range(len(self.team1)):
+            finished = self.finished(i)
+            matches.append({
+                "id": match_id(i), "external_id": self.match_external(i),
+                "team1_id": team_id(self.team1[i]), "team2_id": team_id(self.team2[i]),
+                "winner_id": (team_id(self.team1[i]) if self.score1[i] > self.score2[i] else team_id(self.team2[i]))
+                if finished else None,
+                "team1_score": int(self.score1[i]) if finished else None,
+                "team2_score": int(self.score2[i]) if finished else None,
+                "best_of": int(self.best_of[i]),
+                "status": "finished" if finished else "upcoming",
+                "scheduled_at": _iso(self.scheduled[i]),
+                "ended_at": _iso(self.scheduled[i] + 7200) if finished else None,
+                "source": "pandascore",
+                "raw_data": self.pandascore_match(i) if finished else None,
+            })
+        yield "cs2_matches", matches
+
+        # Per-map stats for the most recent finished matches
+        stats = []
+        rng = np.random.default_rng(self.size["stats_matches"])
+        for i in range(max(self.n_finished - self.size["stats_matches"], 0), self.n_finished):
+            players = [t * PLAYERS_PER_TEAM + k for t in (self.team1[i], self.team2[i]) for k in range(PLAYERS_PER_TEAM)]
+            for g in range(self.maps_played[i]):
+                kills = rng.poisson(self.kill_rate[players])
+                deaths = rng.poisson(17.0, len(players))
+                for p, k, d in zip(players, kills.tolist(), deaths.tolist()):
+                    stats.append({
+                        "player_id": player_id(p), "match_id": match_id(i), "map_name": MAPS[self.maps[i, g]],
+                        "kills": k, "deaths": d, "assists": int(rng.integers(0, 8)),
+                        "adr": round(60 + 3.2 * k, 1), "rating": round(0.6 + k / (d + 10), 2),
+                        "headshot_percentage": 45.0, "source": "pandascore",
+                        "created_at": _iso(self.scheduled[i] + 600 * g),
+                    })
+        yield "cs2_player_stats", stats
+
+        # Kills props on every player of upcoming matches
+        props = []
+        fetched = _iso(REFERENCE_TIME.timestamp())
+        for i in range(self.n_finished, len(self.team1)):
+            for t in (self.team1[i], self.team2[i]):
+                for k in range(PLAYERS_PER_TEAM):
+                    p = t * PLAYERS_PER_TEAM + k
+                    line = float(np.floor(self.kill_rate[p] * 2)) + 0.5
+                    for book in PROP_BOOKS:
+                        props.append({
+                            "match_id": match_id(i), "player_id": player_id(p), "bookmaker": book,
+                            "prop_type": "kills", "line": line, "over_odds": 1.87, "under_odds": 1.93,
+                            "source": "oddspapi", "fetched_at": fetched,
+                        })
+        yield "cs2_player_props", props
+
+        yield "cs2_odds", [
+            {"match_id": match_id(int(event["event_id"]) - 5_000_000), "bookmaker": book["key"],
+             "market_type": market["key"], "selection": outcome["name"], "odds_decimal": outcome["price"],
+             "line": outcome["point"], "source": "oddspapi", "fetched_at": fetched}
+            for event in self.odds_events()
+            for book in event["bookmakers"]
+            for market in book["markets"]
+            for outcome in market["outcomes"]
+        ]
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "teams": self.size["teams"],
+            "players": self.size["teams"] * PLAYERS_PER_TEAM,
+            "matches": len(self.team1),
+            "upcoming": self.n_upcoming,
+            "stats_matches": min(self.size["stats_matches"], self.n_finished),
+            "odds_rows": self.size["odds_rows"],
+        }
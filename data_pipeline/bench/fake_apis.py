@@ -0,0 +1,188 @@
+"""
+Local stand-ins for the PandaScore, Abios and OddsPapi APIs
+
+One threaded HTTP server serves all three under path prefixes, from a
+SyntheticDataset, with each provider's pagination and a per-provider
+token-bucket rate limit that answers 429 with Retry-After when exceeded:
+
+    /pandascore   /csgo/teams|players|matches/past   page & per_page (max 100),
+                  X-Total / X-Page / X-Per-Page headers; /csgo/matches/upcoming
+                  and /running; /matches/<id> with per-map player stats
+    /abios        POST /oauth/access_token; /teams, /players, /series with
+                  filter[lifecycle], page & per_page (max 50), {"data", "last_page"}
+    /oddspapi     /odds/esports/cs2 (status, bookmakers) -> {"data": events}
+
+Point the fetchers at it with PANDASCORE_BASE_URL=<url>/pandascore and so on.
+"""
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+from bench.datasets import SyntheticDataset, PLAYERS_PER_TEAM
+
+
+DEFAULT_RATE_LIMIT = 50.0     # requests per second per provider
+DEFAULT_BURST = 10
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.rejected = 0
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            self.rejected += 1
+            return False
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; Nagle would hold the body for the delayed ACK
+    disable_nagle_algorithm = True
+    apis: "FakeApis" = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, payload, headers: Dict[str, str] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        url = urlsplit(self.path)
+        provider, _, path = url.path.lstrip("/").partition("/")
+        bucket = self.apis.buckets.get(provider)
+        if bucket is None:
+            return self._send(404, {"error": "unknown provider"})
+        if not bucket.take():
+            return self._send(429, {"error": "rate limited"}, {"Retry-After": "1"})
+        handler = getattr(self.apis, f"{provider}_{method}", None)
+        status, payload, headers = handler("/" + path, dict(parse_qsl(url.query)))
+        self._send(status, payload, headers)
+
+    def do_GET(self):
+        self._route("get")
+
+    def do_POST(self):
+        self._route("post")
+
+
+class FakeApis:
+    """PandaScore, Abios and OddsPapi over one dataset"""
+
+    def __init__(self, dataset: SyntheticDataset, rate_limit: float = DEFAULT_RATE_LIMIT, burst: int = DEFAULT_BURST):
+        self.data = dataset
+        self.buckets = {p: TokenBucket(rate_limit, burst) for p in ("pandascore", "abios", "oddspapi")}
+        self.server = None
+        self.url = None
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        handler = type("FakeApiHandler", (_Handler,), {"apis": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-apis", daemon=True).start()
+        self.url = f"http://{host}:{self.server.server_port}"
+        return self.url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    @staticmethod
+    def _page(total: int, params: dict, max_per_page: int) -> Tuple[range, int, int]:
+        per_page = min(int(params.get("per_page", max_per_page)), max_per_page)
+        page = max(int(params.get("page", 1)), 1)
+        start = (page - 1) * per_page
+        return range(start, min(start + per_page, total)), page, per_page
+
+    # ==================== PANDASCORE ====================
+    def pandascore_get(self, path: str, params: dict):
+        d = self.data
+        listings = {
+            "/csgo/teams": (d.size["teams"], d.pandascore_team),
+            "/csgo/players": (d.size["teams"] * PLAYERS_PER_TEAM, d.pandascore_player),
+            # Most recent first
+            "/csgo/matches/past": (d.n_finished, lambda k: d.pandascore_match(d.n_finished - 1 - k)),
+            "/csgo/matches/upcoming": (d.n_upcoming, lambda k: d.pandascore_match(d.n_finished + k)),
+            "/csgo/matches/running": (0, None),
+        }
+        if path in listings:
+            total, item = listings[path]
+            rows, page, per_page = self._page(total, params, 100)
+            headers = {"X-Total": str(total), "X-Page": str(page), "X-Per-Page": str(per_page)}
+            return 200, [item(k) for k in rows], headers
+
+        if path.startswith("/matches/"):
+            i = int(path.rsplit("/", 1)[1]) - 5_000_000
+            if not 0 <= i < d.n_finished:
+                return 404, {"error": "Not found"}, None
+            match = d.pandascore_match(i)
+            players = [t * PLAYERS_PER_TEAM + k for t in (d.team1[i], d.team2[i]) for k in range(PLAYERS_PER_TEAM)]
+            for game in match["games"]:
+                game["players"] = [
+                    {"player": {"id": int(d.player_external(p))}, "kills": int(d.kill_rate[p]),
+                     "deaths": 17, "assists": 4, "headshots": 8, "adr": 75.0}
+                    for p in players
+                ]
+            return 200, match, None
+        return 404, {"error": "Not found"}, None
+
+    # ==================== ABIOS ====================
+    def abios_post(self, path: str, params: dict):
+        if path == "/oauth/access_token":
+            return 200, {"access_token": "bench-token", "token_type": "bearer", "expires_in": 3600}, None
+        return 404, {"error": "Not found"}, None
+
+    def abios_get(self, path: str, params: dict):
+        d = self.data
+        if path == "/series":
+            lifecycle = params.get("filter[lifecycle]")
+            if lifecycle == "upcoming":
+                ids = range(d.n_finished, d.n_finished + d.n_upcoming)
+            elif lifecycle == "over":
+                ids = range(d.n_finished - 1, -1, -1)
+            else:
+                ids = range(0)
+            total, item = len(ids), lambda k: d.abios_series(ids[k])
+        elif path == "/teams":
+            total, item = d.size["teams"], d.abios_team
+        elif path == "/players":
+            total, item = d.size["teams"] * PLAYERS_PER_TEAM, d.abios_player
+        else:
+            return 404, {"error": "Not found"}, None
+        rows, page, per_page = self._page(total, params, 50)
+        return 200, {"data": [item(k) for k in rows], "page": page,
+                     "last_page": max((total + per_page - 1) // per_page, 1)}, None
+
+    # ==================== ODDSPAPI ====================
+    def oddspapi_get(self, path: str, params: dict):
+        if path != "/odds/esports/cs2":
+            return 404, {"error": "Not found"}, None
+        if params.get("status") == "live":
+            return 200, {"data": []}, None
+        books = params["bookmakers"].split(",") if params.get("bookmakers") else None
+        return 200, {"data": self.data.odds_events(books)}, None
@@ -0,0 +1,113 @@
+"""
+Import-time budget check for short pipeline runs
+
+Each case runs in a fresh interpreter, the way cron starts it. A case fails
+when it loads a module it should not need (the check that catches a heavy
+import creeping back in, independent of machine speed) or when its median
+wall time exceeds the budget. Budgets are about 1.3x the slowest medians
+measured on a dev machine (main --help 54-108 ms, sync 463-787 ms with
+supabase alone ~380 ms, predict 337-648 ms), so an extra heavy import
+fails the check. CI runs it on every push that touches the pipeline
+(.github/workflows/import-budgets.yml):
+
+    main --help         nothing beyond argparse and the local modules
+    sync imports        what `main.py --source pandascore` loads: supabase,
+                        httpx, numpy, but not pandas or any ML library
+    predict imports     what ml/predict.py loads before scoring: no training
+                        stack (sklearn, xgboost, lightgbm, scipy, train.py)
+
+    cd data_pipeline
+    python -m bench.imports
+    python -m bench.imports --repeat 10 --budget-scale 2   # slower CI runners
+
+Exits non-zero when any case fails; the slowest imports of a failing case
+are printed from -X importtime.
+"""
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from statistics import median
+from typing import Dict, List, Tuple
+
+
+PIPELINE_DIR = Path(__file__).resolve().parents[1]
+
+TRAINING_MODULES = ("sklearn", "xgboost", "lightgbm", "scipy", "train", "tuning")
+
+# name -> (working directory, interpreter arguments, budget ms, modules that must not load)
+CASES: Dict[str, Tuple[Path, List[str], float, Tuple[str, ...]]] = {
+    "main --help": (
+        PIPELINE_DIR, ["main.py", "--help"], 150,
+        ("supabase", "postgrest", "httpx", "tenacity", "dotenv", "numpy", "pandas") + TRAINING_MODULES,
+    ),
+    "sync imports": (
+        PIPELINE_DIR,
+        ["-c", "import main; from database import Database; from fetchers import PandaScoreFetcher; "
+               "from ml.online_features import OnlineFeatureStore; import supabase"],
+        1000,
+        ("pandas",) + TRAINING_MODULES,
+    ),
+    "predict imports": (
+        PIPELINE_DIR / "ml", ["-c", "import predict"], 850,
+        TRAINING_MODULES,
+    ),
+}
+
+
+def run_case(cwd: Path, argv: List[str], repeat: int) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """Median wall seconds over `repeat` runs, and (module, self us, cumulative us) from -X importtime"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *argv], cwd=cwd, capture_output=True, check=True)
+        times.append(time.perf_counter() - started)
+
+    traced = subprocess.run([sys.executable, "-X", "importtime", *argv], cwd=cwd,
+                            capture_output=True, text=True, check=True)
+    imports = []
+    for line in traced.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return median(times), imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import-time budgets for short runs")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (median is compared)")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Multiply every budget (slower machines)")
+    parser.add_argument("--only", nargs="+", choices=list(CASES), help="Run only these cases")
+    args = parser.parse_args()
+
+    failed = []
+    print(f"{'case':<18} {'median ms':>10} {'budget ms':>10}  result")
+    for name in args.only or CASES:
+        cwd, argv, budget, forbidden = CASES[name]
+        budget *= args.budget_scale
+        seconds, imports = run_case(cwd, argv, args.repeat)
+
+        loaded = {module for module, _, _ in imports}
+        unwanted = sorted(m for m in forbidden if m in loaded)
+        problems = []
+        if seconds * 1000 > budget:
+            problems.append("over budget")
+        if unwanted:
+            problems.append(f"imports {', '.join(unwanted)}")
+        print(f"{name:<18} {seconds * 1000:>10.1f} {budget:>10.0f}  {'; '.join(problems) or 'ok'}")
+
+        if problems:
+            failed.append(name)
+            slowest = sorted(((m, c) for m, _, c in imports), key=lambda x: -x[1])[:8]
+            for module, cumulative in slowest:
+                print(f"    {module:<40} {cumulative / 1000:>8.1f} ms")
+
+    if failed:
+        print(f"\nImport budget exceeded: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
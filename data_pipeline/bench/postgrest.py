@@ -0,0 +1,482 @@
+"""
+In-memory PostgREST stand-in for benchmarks
+
+Serves the subset of the PostgREST API that supabase-py issues from
+database.py and the ml modules, over tables read from
+supabase-cs2-schema.sql (columns, defaults, UNIQUE constraints and
+foreign keys):
+
+    GET    /rest/v1/<table>   select lists with aliases, ->/->> JSON paths and
+                              many-to-one embeds (alias:table!hint(cols),
+                              !inner); eq/neq/gt/gte/lt/lte/in/is filters
+                              (negated with not.), also on embedded columns;
+                              multi-column order; offset/limit paging
+    POST   /rest/v1/<table>   insert one row or a list; upsert with
+                              on_conflict and resolution=merge-duplicates
+    PATCH  /rest/v1/<table>   update the filtered rows
+    POST   /rest/v1/rpc/<fn>  the set-returning functions in FUNCTIONS, with
+                              the same select, filters, order and paging
+
+Equality filters use lazily built hash indexes, and a filtered, sorted
+result is cached until its tables change, so paging through a large read
+costs one scan like a database index would. Calls to other database
+functions return 404.
+"""
+import re
+import csv
+import json
+import uuid
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+
+SCHEMA_PATH = Path(__file__).resolve().parents[2] / "supabase-cs2-schema.sql"
+
+OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+RESERVED_PARAMS = {"select", "order", "offset", "limit", "on_conflict", "columns"}
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.body = {"code": code, "message": message, "details": None, "hint": None}
+
+
+# ==================== SCHEMA ====================
+class TableSchema:
+    def __init__(self, name: str):
+        self.name = name
+        self.columns: List[str] = []
+        # column -> callable producing the default value
+        self.defaults: Dict[str, object] = {}
+        self.unique: List[Tuple[str, ...]] = [("id",)]
+        # column -> referenced table
+        self.foreign_keys: Dict[str, str] = {}
+
+
+def _default(expression: str):
+    expression = expression.rstrip(",")
+    upper = expression.upper()
+    if upper.startswith("UUID_GENERATE_V4"):
+        return lambda: str(uuid.uuid4())
+    if upper.startswith("NOW"):
+        return lambda: datetime.now(timezone.utc).isoformat()
+    if upper in ("TRUE", "FALSE"):
+        return lambda: upper == "TRUE"
+    if expression.startswith("'"):
+        value = expression.strip("'")
+        return lambda: value
+    try:
+        value = float(expression)
+        value = int(value) if value.is_integer() else value
+        return lambda: value
+    except ValueError:
+        return None
+
+
+def load_schema(path: Path = SCHEMA_PATH) -> Dict[str, TableSchema]:
+    sql = Path(path).read_text()
+    tables = {}
+    for name, body in re.findall(r"CREATE TABLE public\.(\w+) \((.*?)\n\);", sql, re.S):
+        table = tables[name] = TableSchema(name)
+        for line in body.splitlines():
+            line = line.split("--")[0].strip()
+            if not line:
+                continue
+            composite = re.match(r"UNIQUE\s*\(([^)]*)\)", line)
+            if composite:
+                table.unique.append(tuple(c.strip() for c in composite.group(1).split(",")))
+                continue
+            if line.upper().startswith(("PRIMARY KEY", "CONSTRAINT", "CHECK", "FOREIGN KEY")):
+                continue
+            column = line.split()[0]
+            table.columns.append(column)
+            default = re.search(r"DEFAULT\s+(\S+(?:\(\))?)", line, re.I)
+            if default and _default(default.group(1)):
+                table.defaults[column] = _default(default.group(1))
+            if re.search(r"\bUNIQUE\b", line) and column != "id":
+                table.unique.append((column,))
+            reference = re.search(r"REFERENCES public\.(\w+)\(id\)", line)
+            if reference:
+                table.foreign_keys[column] = reference.group(1)
+    return tables
+
+
+# ==================== QUERY PARSING ====================
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, current = [], 0, []
+    for ch in text:
+        if ch == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        current.append(ch)
+    if current:
+        parts.append("".join(current).strip())
+    return [p for p in parts if p]
+
+
+def parse_select(text: str) -> List[dict]:
+    """Select items: {"kind": "all"|"column"|"embed", ...}"""
+    items = []
+    for item in _split_top_level(text or "*"):
+        if item == "*":
+            items.append({"kind": "all"})
+            continue
+        if "(" in item:
+            head, inner = item[:item.index("(")], item[item.index("(") + 1:-1]
+            alias, _, target = head.rpartition(":")
+            table, *hints = target.split("!")
+            items.append({
+                "kind": "embed", "alias": alias or table, "table": table,
+                "inner": "inner" in hints,
+                "hint": next((h for h in hints if h != "inner"), None),
+                "select": parse_select(inner),
+            })
+            continue
+        alias, _, expression = item.rpartition(":")
+        path = re.split(r"->>?", expression)
+        items.append({"kind": "column", "alias": alias or path[-1], "column": path[0], "path": path[1:]})
+    return items
+
+
+def parse_filter(value: str) -> Tuple[bool, str, object]:
+    """'not.is.null' -> (negated, operator, argument)"""
+    negated = value.startswith("not.")
+    if negated:
+        value = value[4:]
+    operator, _, argument = value.partition(".")
+    if operator == "in":
+        argument = next(csv.reader([argument.strip("()")], skipinitialspace=True), [])
+    return negated, operator, argument
+
+
+def _coerce(argument: str, sample):
+    """Filter argument as the type of the stored value"""
+    if isinstance(sample, bool):
+        return argument == "true"
+    if isinstance(sample, (int, float)):
+        try:
+            return float(argument)
+        except ValueError:
+            return argument
+    return argument
+
+
+def matches(value, negated: bool, operator: str, argument) -> bool:
+    if operator == "is":
+        result = value is None if argument == "null" else value is (argument == "true")
+    elif value is None:
+        return False
+    elif operator == "in":
+        result = value in {_coerce(a, value) for a in argument}
+    else:
+        try:
+            result = OPERATORS[operator](value, _coerce(argument, value))
+        except TypeError:
+            result = False
+    return result != negated
+
+
+# ==================== STORE ====================
+class Table:
+    def __init__(self, schema: TableSchema):
+        self.schema = schema
+        self.rows: List[dict] = []
+        self.by_id: Dict[str, dict] = {}
+        # column -> value -> rows, built on first equality filter
+        self.indexes: Dict[str, Dict[object, List[dict]]] = {}
+        self.unique: Dict[Tuple[str, ...], Dict[tuple, dict]] = {cols: {} for cols in schema.unique}
+        self.version = 0
+
+    def index(self, column: str) -> Dict[object, List[dict]]:
+        index = self.indexes.get(column)
+        if index is None:
+            index = self.indexes[column] = {}
+            for row in self.rows:
+                index.setdefault(row.get(column), []).append(row)
+        return index
+
+    def insert(self, values: dict) -> dict:
+        row = {column: default() for column, default in self.schema.defaults.items()}
+        row.update(values)
+        row.setdefault("id", str(uuid.uuid4()))
+        keys = [(cols, tuple(row.get(c) for c in cols)) for cols in self.unique]
+        for cols, key in keys:
+            if None not in key and key in self.unique[cols]:
+                raise PostgrestError(409, "23505", f'duplicate key value violates unique constraint on {self.schema.name} {cols}')
+        for cols, key in keys:
+            if None not in key:
+                self.unique[cols][key] = row
+        self.rows.append(row)
+        self.by_id[row["id"]] = row
+        for column, index in self.indexes.items():
+            index.setdefault(row.get(column), []).append(row)
+        self.version += 1
+        return row
+
+    def update(self, row: dict, values: dict) -> dict:
+        for cols, unique in self.unique.items():
+            if any(c in values for c in cols):
+                unique.pop(tuple(row.get(c) for c in cols), None)
+        row.update(values)
+        for cols, unique in self.unique.items():
+            key = tuple(row.get(c) for c in cols)
+            if None not in key:
+                unique[key] = row
+        # Indexes on changed columns are rebuilt on next use
+        for column in values:
+            self.indexes.pop(column, None)
+        self.version += 1
+        return row
+
+
+class Store:
+    """All tables plus the read cache"""
+
+    def __init__(self, schema_path: Path = SCHEMA_PATH):
+        self.tables = {name: Table(schema) for name, schema in load_schema(schema_path).items()}
+        self.lock = threading.Lock()
+        # (table, filters, order, select) -> (versions, rows)
+        self.cache: Dict[tuple, Tuple[tuple, List[dict]]] = {}
+
+    def table(self, name: str) -> Table:
+        table = self.tables.get(name)
+        if table is None:
+            raise PostgrestError(404, "42P01", f'relation "public.{name}" does not exist')
+        return table
+
+    def load(self, name: str, rows: List[dict]):
+        """Bulk-load rows (benchmark seeding), defaults applied"""
+        table = self.table(name)
+        for row in rows:
+            table.insert(row)
+
+    # ==================== READS ====================
+    def _embed_key(self, table: Table, item: dict) -> str:
+        if item["hint"]:
+            return item["hint"]
+        columns = [c for c, target in table.schema.foreign_keys.items() if target == item["table"]]
+        if len(columns) != 1:
+            raise PostgrestError(300, "PGRST201", f"Could not embed {item['table']} from {table.schema.name} unambiguously")
+        return columns[0]
+
+    def _project(self, table: Table, row: dict, select: List[dict]) -> dict:
+        out = {}
+        for item in select:
+            if item["kind"] == "all":
+                out.update(row)
+            elif item["kind"] == "column":
+                value = row.get(item["column"])
+                for i, key in enumerate(item["path"]):
+                    value = value.get(key) if isinstance(value, dict) else None
+                if item["path"] and value is not None and not isinstance(value, str):
+                    value = json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+                out[item["alias"]] = value
+            else:
+                target = self.table(item["table"])
+                parent = target.by_id.get(row.get(self._embed_key(table, item)))
+                out[item["alias"]] = None if parent is None else self._project(target, parent, item["select"])
+        return out
+
+    def select(self, name: str, params: List[Tuple[str, str]]) -> List[dict]:
+        return self._read(self.table(name), name, params, lambda: None)
+
+    def call(self, name: str, params: List[Tuple[str, str]], args: Optional[dict]) -> List[dict]:
+        """Rows of a set-returning function, then select/filter/order/page like a table"""
+        function = FUNCTIONS.get(name)
+        if function is None:
+            raise PostgrestError(404, "PGRST202", f"Function {name} is not emulated")
+        table_name, rows = function
+        args = args or {}
+        key = f"rpc/{name}:{json.dumps(args, sort_keys=True)}"
+        return self._read(self.table(table_name), key, params, lambda: rows(self, **args))
+
+    def _read(self, table: "Table", name: str, params: List[Tuple[str, str]], candidates) -> List[dict]:
+        query = dict(params)
+        select = parse_select(query.get("select", "*"))
+        filters = [(k, parse_filter(v)) for k, v in params if k not in RESERVED_PARAMS]
+        embeds = {item["alias"]: item for item in select if item["kind"] == "embed"}
+
+        versions = (table.version,) + tuple(self.table(e["table"]).version for e in embeds.values())
+        key = (name, tuple(sorted((k, v) for k, v in params if k not in RESERVED_PARAMS)),
+               query.get("order"), query.get("select"))
+        cached = self.cache.get(key)
+        if cached is None or cached[0] != versions:
+            rows = self._filter(table, select, filters, embeds, candidates())
+            cached = (versions, self._order(rows, query.get("order")))
+            # Only paged reads come back for the next page; one-off lookups are not kept
+            if "limit" in query:
+                self.cache[key] = cached
+
+        rows = cached[1]
+        offset = int(query.get("offset", 0))
+        limit = int(query["limit"]) if "limit" in query else None
+        return rows[offset:offset + limit if limit is not None else None]
+
+    def _filter(self, table: Table, select: List[dict], filters, embeds: Dict[str, dict],
+                candidates: Optional[List[dict]] = None) -> List[dict]:
+        # Narrow with a hash index on the first equality / IN filter (table
+        # reads; a function's rows are already narrowed)
+        if candidates is None:
+            candidates = table.rows
+            for column, (negated, operator, argument) in filters:
+                if "." in column or negated or operator not in ("eq", "in"):
+                    continue
+                index = table.index(column)
+                sample = next((v for v in index if v is not None), None)
+                wanted = [argument] if operator == "eq" else argument
+                candidates = [row for value in {_coerce(a, sample) for a in wanted} for row in index.get(value, ())]
+                break
+
+        out = []
+        for row in candidates:
+            projected = self._project(table, row, select)
+            keep = True
+            for column, (negated, operator, argument) in filters:
+                if "." in column:
+                    alias, field = column.split(".", 1)
+                    embedded = projected.get(alias)
+                    if embedded is None:
+                        keep = not embeds.get(alias, {}).get("inner")
+                        if not keep:
+                            break
+                        continue
+                    if not matches(embedded.get(field), negated, operator, argument):
+                        if embeds.get(alias, {}).get("inner"):
+                            keep = False
+                            break
+                        projected[alias] = None
+                elif not matches(row.get(column), negated, operator, argument):
+                    keep = False
+                    break
+            if keep:
+                out.append((row, projected))
+        return out
+
+    @staticmethod
+    def _order(rows: List[Tuple[dict, dict]], order: Optional[str]) -> List[dict]:
+        for term in reversed((order or "").split(",") if order else []):
+            column, *modifiers = term.split(".")
+            desc = "desc" in modifiers
+            nulls_first = "nullsfirst" in modifiers or (desc and "nullslast" not in modifiers)
+            present = [r for r in rows if r[0].get(column) is not None]
+            missing = [r for r in rows if r[0].get(column) is None]
+            present.sort(key=lambda r: r[0][column], reverse=desc)
+            rows = missing + present if nulls_first else present + missing
+        return [projected for _, projected in rows]
+
+    # ==================== WRITES ====================
+    def insert(self, name: str, body, on_conflict: Optional[str], merge: bool) -> List[dict]:
+        table = self.table(name)
+        rows = body if isinstance(body, list) else [body]
+        conflict = tuple(c.strip() for c in on_conflict.split(",")) if on_conflict else ("id",)
+        out = []
+        for values in rows:
+            existing = None
+            if merge:
+                key = tuple(values.get(c) for c in conflict)
+                existing = table.unique.get(conflict, {}).get(key)
+            out.append(table.update(existing, values) if existing is not None else table.insert(values))
+        return [dict(row) for row in out]
+
+    def update(self, name: str, params: List[Tuple[str, str]], body: dict) -> List[dict]:
+        table = self.table(name)
+        rows = self.select(name, [("select", "id")] + [(k, v) for k, v in params if k not in RESERVED_PARAMS])
+        return [dict(table.update(table.by_id[r["id"]], body)) for r in rows]
+
+
+# ==================== FUNCTIONS ====================
+def _recent_player_stats(store: Store, player_ids: Optional[List[str]] = None, per_player: int = 30) -> List[dict]:
+    """recent_cs2_player_stats: each player's newest per_player rows"""
+    table = store.table("cs2_player_stats")
+    if player_ids is None:
+        by_player: Dict[str, List[dict]] = {}
+        for row in table.rows:
+            by_player.setdefault(row["player_id"], []).append(row)
+    else:
+        index = table.index("player_id")
+        by_player = {p: index.get(p, []) for p in set(player_ids)}
+    out = []
+    for rows in by_player.values():
+        out.extend(sorted(rows, key=lambda r: (r.get("created_at") or "", r["id"]), reverse=True)[:per_player])
+    return out
+
+
+# Emulated set-returning functions: name -> (result table, rows)
+FUNCTIONS = {
+    "recent_cs2_player_stats": ("cs2_player_stats", _recent_player_stats),
+}
+
+
+# ==================== HTTP ====================
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; Nagle would hold the body for the delayed ACK
+    disable_nagle_algorithm = True
+    store: Store = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, payload):
+        body = json.dumps(payload, default=str).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, handler):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        if not url.path.startswith("/rest/v1/"):
+            return self._send(404, {"message": "not found"})
+        name = url.path[len("/rest/v1/"):]
+        try:
+            with self.store.lock:
+                status, payload = handler(name, parse_qsl(url.query, keep_blank_values=True), body)
+            self._send(status, payload)
+        except PostgrestError as e:
+            self._send(e.status, e.body)
+        except Exception as e:
+            self._send(500, {"code": "XX000", "message": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        self._dispatch(lambda name, params, body: (200, self.store.select(name, params)))
+
+    def do_POST(self):
+        prefer = self.headers.get("Prefer", "")
+
+        def post(name, params, body):
+            if name.startswith("rpc/"):
+                return 200, self.store.call(name[4:], params, body)
+            return 201, self.store.insert(name, body, dict(params).get("on_conflict"), "merge-duplicates" in prefer)
+        self._dispatch(post)
+
+    def do_PATCH(self):
+        self._dispatch(lambda name, params, body: (200, self.store.update(name, params, body)))
+
+
+def serve(store: Store, host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the stand-in on a background thread; returns (server, base URL)"""
+    handler = type("PostgrestHandler", (_Handler,), {"store": store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="postgrest", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
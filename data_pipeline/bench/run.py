@@ -0,0 +1,328 @@
+"""
+End-to-end pipeline benchmark
+
+Seeds the PostgREST stand-in from a SyntheticDataset, starts the fake
+provider APIs, points config at both and times the real code per stage:
+
+    sync          the main.py stage graph for all three sources (full sync, default workers)
+    features      bulk prop read, PlayerStatsCache load and prop features for the slate
+    train_kills   train.train_kills_model: training matrix rebuild and fit (temporary cache and registry)
+    train_match   match winner model on the replayed match history
+    predict       Predictor.predict_player_props on a fresh slate (every prop scored)
+    predict_warm  the same slate again (unchanged props reuse stored predictions)
+
+Each run appends throughput and latency per stage, with the git commit and
+dataset scale, to bench/results/history.jsonl and is compared with the
+latest run at the same scale from another commit (or --compare <commit>):
+
+    cd data_pipeline
+    python -m bench.run --scale small
+    python -m bench.run --scale large --only sync predict --fail-threshold 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bench.datasets import SyntheticDataset, SCALES
+from bench.fake_apis import FakeApis, DEFAULT_RATE_LIMIT
+from bench.postgrest import Store, serve
+
+
+PIPELINE_DIR = Path(__file__).resolve().parents[1]
+RESULTS_PATH = Path(__file__).resolve().parent / "results" / "history.jsonl"
+STAGES = ("sync", "features", "train_kills", "train_match", "predict", "predict_warm")
+
+
+def configure(postgrest_url: str, api_url: str, api_rate: float):
+    """Point config at the stand-ins; must run before config is first imported"""
+    os.environ.update({
+        "SUPABASE_URL": postgrest_url,
+        "SUPABASE_SERVICE_KEY": "bench-key",
+        "PANDASCORE_BASE_URL": f"{api_url}/pandascore",
+        "ABIOS_BASE_URL": f"{api_url}/abios",
+        "ODDSPAPI_BASE_URL": f"{api_url}/oddspapi",
+        "PANDASCORE_API_KEY": "bench-key",
+        "ABIOS_CLIENT_ID": "bench",
+        "ABIOS_CLIENT_SECRET": "bench",
+        "ODDSPAPI_API_KEY": "bench-key",
+        # Client-side pacing at the fake APIs' limit, as against the real ones
+        "API_RATE_LIMIT_DELAY": str(1.0 / api_rate),
+    })
+    # The ml modules import their siblings directly
+    sys.path.append(str(PIPELINE_DIR / "ml"))
+
+
+def git_commit() -> Dict[str, object]:
+    def git(*args) -> str:
+        try:
+            return subprocess.run(["git", *args], cwd=PIPELINE_DIR, capture_output=True, text=True).stdout.strip()
+        except OSError:
+            return ""
+    return {"commit": git("rev-parse", "--short", "HEAD") or None,
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def stage_result(seconds: float, rows: int, latencies: List[float] = None, **extra) -> Dict:
+    """Throughput and (when per-item timings exist) latency quantiles for a stage"""
+    result = {"seconds": round(seconds, 4), "rows": int(rows),
+              "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None}
+    if latencies:
+        result["p50_ms"] = round(float(np.percentile(latencies, 50)) * 1000, 3)
+        result["p95_ms"] = round(float(np.percentile(latencies, 95)) * 1000, 3)
+    result.update(extra)
+    return result
+
+
+# ==================== STAGES ====================
+def bench_sync(db) -> Dict:
+    from main import build_stages
+    from pipeline import select_stages, run_stages
+    from instrumentation import METRICS
+
+    stages = select_stages(build_stages(db, full_sync=True), ["pandascore.*", "abios.*", "oddspapi.*"])
+    mark = METRICS.snapshot()
+    started = time.perf_counter()
+    timings = run_stages(stages)
+    seconds = time.perf_counter() - started
+    run = METRICS.since(mark)
+
+    requests = sum(s["requests"] for s in run.requests.values())
+    request_seconds = sum(s["seconds"] for s in run.requests.values())
+    network_seconds = sum(s["network_seconds"] for s in run.requests.values())
+    return stage_result(
+        seconds, sum(t["records"] or 0 for name, t in timings.items() if name.endswith(".log")),
+        requests=requests,
+        retries=sum(s["retries"] for s in run.requests.values()),
+        errors=sum(t["status"] != "success" for t in timings.values()),
+        stage_overlap=round(sum(t["seconds"] for t in timings.values()) / seconds, 2),
+        request_mean_ms=round(request_seconds / max(requests, 1) * 1000, 3),
+        network_mean_ms=round(network_seconds / max(requests, 1) * 1000, 3),
+        rows_written=sum(s["rows"] for s in run.writes.values()),
+        write_seconds=round(sum(s["seconds"] for s in run.writes.values()), 4),
+    )
+
+
+def bench_features(db) -> Dict:
+    from features import FeatureEngineer
+    from stats_cache import PlayerStatsCache
+
+    started = time.perf_counter()
+    props = list(db.get_latest_player_props())
+    read = time.perf_counter() - started
+    feature_eng = FeatureEngineer(db)
+    feature_eng.stats_cache = PlayerStatsCache.load(db, list({p["player_id"] for p in props}))
+    loaded = time.perf_counter() - started
+
+    latencies = []
+    for prop in props:
+        t = time.perf_counter()
+        feature_eng.get_player_prop_features(prop["player_id"], prop["prop_type"], prop["line"])
+        latencies.append(time.perf_counter() - t)
+    return stage_result(time.perf_counter() - started, len(props), latencies,
+                        read_seconds=round(read, 4), cache_seconds=round(loaded - read, 4))
+
+
+def bench_train_kills(db, registry, cache_dir: Path) -> Dict:
+    """The production train_kills_model: full cache rebuild and fit, registered in `registry`"""
+    from features import FeatureEngineer
+    from train import train_kills_model
+
+    args = argparse.Namespace(rebuild_cache=True, incremental=False, tune=False,
+                              threads_per_worker=1, save_model=True, challenger=False)
+    started = time.perf_counter()
+    train_kills_model(db, FeatureEngineer(db), args, registry=registry, cache_dir=cache_dir)
+    seconds = time.perf_counter() - started
+
+    version = registry.resolve("kills")
+    if version is None:
+        raise RuntimeError("train_kills_model registered no model (too little training data?)")
+    entry = registry.entry("kills", version)
+    return stage_result(seconds, entry["data_window"]["rows"],
+                        roc_auc=round(entry["metrics"]["roc_auc"], 4))
+
+
+def bench_train_match(db) -> Dict:
+    from train import MatchWinnerModel, build_match_training_dataset
+
+    started = time.perf_counter()
+    df = build_match_training_dataset(db)
+    built = time.perf_counter() - started
+    model = MatchWinnerModel()
+    fit_started = time.perf_counter()
+    metrics = model.train(model.prepare_features(df), df["team1_won"].values)
+    return stage_result(time.perf_counter() - started, len(df),
+                        dataset_seconds=round(built, 4), fit_seconds=round(time.perf_counter() - fit_started, 4),
+                        roc_auc=round(float(metrics["roc_auc"]), 4))
+
+
+def bench_predict(registry) -> Dict[str, Dict]:
+    from predict import Predictor
+    from online_features import OnlineFeatureStore
+
+    predictor = Predictor()
+    # Start from empty online state and the benchmark's own model registry
+    predictor.online_store = predictor.db.feature_state = predictor.feature_eng.online_store = OnlineFeatureStore()
+    predictor.registry = registry
+
+    results = {}
+    for stage in ("predict", "predict_warm"):
+        started = time.perf_counter()
+        predictions = predictor.predict_player_props()
+        results[stage] = stage_result(time.perf_counter() - started, len(predictions))
+    return results
+
+
+# ==================== HISTORY ====================
+def load_history(path: Path = RESULTS_PATH) -> List[Dict]:
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def baseline_for(record: Dict, history: List[Dict], commit: str = None) -> Optional[Dict]:
+    """Latest earlier run on the same dataset from another (or the given) commit"""
+    for previous in reversed(history):
+        if previous["dataset"] != record["dataset"] or previous["seed"] != record["seed"]:
+            continue
+        if commit is not None:
+            if previous["commit"] and previous["commit"].startswith(commit):
+                return previous
+        elif previous["commit"] != record["commit"]:
+            return previous
+    return None
+
+
+def compare(record: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Print throughput and latency deltas per stage; returns stages slower than `threshold`"""
+    print(f"\n=== Compared with {baseline['commit']} ({baseline['timestamp']}) ===")
+    print(f"{'stage':<14} {'metric':<13} {'before':>11} {'after':>11} {'change':>8}")
+    regressions = []
+    for stage, result in record["stages"].items():
+        before = baseline["stages"].get(stage)
+        if not before:
+            continue
+        for metric, higher_is_better in (("rows_per_sec", True), ("p50_ms", False), ("p95_ms", False)):
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            slower = -change if higher_is_better else change
+            flag = "  REGRESSION" if slower > threshold else ""
+            print(f"{stage:<14} {metric:<13} {old:>11.3f} {new:>11.3f} {change:>+8.1%}{flag}")
+            if flag and stage not in regressions:
+                regressions.append(stage)
+    return regressions
+
+
+# ==================== MAIN ====================
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--teams", type=int, help="Override the scale's team count")
+    parser.add_argument("--matches", type=int, help="Override the scale's match count")
+    parser.add_argument("--odds-rows", type=int, help="Override the scale's odds row count")
+    parser.add_argument("--only", nargs="+", choices=STAGES, help="Run only these stages")
+    parser.add_argument("--api-rate", type=float, default=DEFAULT_RATE_LIMIT,
+                        help="Fake API rate limit (requests/s per provider); the fetchers pace to it")
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH, help="History file to append to")
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to the history")
+    parser.add_argument("--compare", metavar="COMMIT", help="Compare with the latest run of this commit")
+    parser.add_argument("--fail-threshold", type=float, default=None,
+                        help="Exit non-zero when a stage is slower than the baseline by more than this fraction")
+    args = parser.parse_args()
+
+    overrides = {k: v for k, v in (("teams", args.teams), ("matches", args.matches),
+                                   ("odds_rows", args.odds_rows)) if v}
+    stages = args.only or STAGES
+
+    print(f"Building {args.scale} dataset (seed {args.seed})...")
+    started = time.perf_counter()
+    dataset = SyntheticDataset(args.scale, seed=args.seed, **overrides)
+    store = Store()
+    for table, rows in dataset.seed_rows():
+        store.load(table, rows)
+    seed_seconds = time.perf_counter() - started
+    print(f"  {dataset.summary()} in {seed_seconds:.1f}s")
+
+    postgrest, postgrest_url = serve(store)
+    apis = FakeApis(dataset, rate_limit=args.api_rate)
+    configure(postgrest_url, apis.start(), args.api_rate)
+
+    from database import Database
+    from online_features import OnlineFeatureStore
+    from registry import ModelRegistry
+
+    db = Database(feature_state=OnlineFeatureStore())
+    models_dir = tempfile.TemporaryDirectory(prefix="bench-models-")
+    registry = ModelRegistry(Path(models_dir.name))
+    # The training matrix cache starts empty too, so every run rebuilds it
+    cache_dir = tempfile.TemporaryDirectory(prefix="bench-cache-")
+    results: Dict[str, Dict] = {}
+    try:
+        if "sync" in stages:
+            results["sync"] = bench_sync(db)
+        if "features" in stages:
+            results["features"] = bench_features(db)
+        if "train_kills" in stages or {"predict", "predict_warm"} & set(stages):
+            # Prediction needs a registered kills model
+            results["train_kills"] = bench_train_kills(db, registry, Path(cache_dir.name))
+        if "train_match" in stages:
+            results["train_match"] = bench_train_match(db)
+        if {"predict", "predict_warm"} & set(stages):
+            results.update(bench_predict(registry))
+    finally:
+        apis.stop()
+        postgrest.shutdown()
+        models_dir.cleanup()
+        cache_dir.cleanup()
+
+    record = {
+        **git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "scale": args.scale,
+        "seed": args.seed,
+        "dataset": dataset.summary(),
+        "seed_seconds": round(seed_seconds, 2),
+        "rate_limited": {name: bucket.rejected for name, bucket in apis.buckets.items()},
+        "stages": results,
+    }
+
+    print("\n=== Benchmark ===")
+    print(f"{'stage':<14} {'rows':>9} {'seconds':>9} {'rows/s':>11} {'p50 ms':>9} {'p95 ms':>9}")
+    for stage, result in results.items():
+        p50, p95 = result.get("p50_ms"), result.get("p95_ms")
+        print(f"{stage:<14} {result['rows']:>9} {result['seconds']:>9.2f} {result['rows_per_sec'] or 0:>11.1f} "
+              f"{p50 if p50 is not None else '-':>9} {p95 if p95 is not None else '-':>9}")
+
+    history = load_history(args.output)
+    baseline = baseline_for(record, history, args.compare)
+    regressions = []
+    if baseline:
+        regressions = compare(record, baseline, args.fail_threshold if args.fail_threshold is not None else 0.1)
+    else:
+        print("\nNo earlier run of this dataset from another commit to compare with")
+
+    if not args.no_save:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"Appended results to {args.output}")
+
+    if regressions and args.fail_threshold is not None:
+        print(f"Regressions beyond {args.fail_threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
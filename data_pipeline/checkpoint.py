@@ -0,0 +1,138 @@
+"""
+Checkpoint state for resumable full syncs
+
+A full sync records every stage and history page it completes in a local
+JSON file, written atomically after each one. When the run is interrupted
+(network outage, expired token, rate-limit ban), the next `--full-sync`
+resumes from there: completed stages are dropped from the graph and
+completed pages are not fetched again. Pages that still fail after the
+fetcher's retries go to a dead-letter list instead of aborting the
+backfill, and are retried with `--retry-dead-letters`.
+
+    checkpoint = Checkpoint.load()
+    if not checkpoint.page_done("pandascore.past", 3):
+        ...
+        checkpoint.complete_page("pandascore.past", 3)
+
+The checkpoint is cleared when a full sync finishes without failed stages;
+dead letters are kept until they are retried successfully.
+"""
+import os
+import json
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+DEFAULT_CHECKPOINT_PATH = Path(__file__).parent / "state" / "sync_checkpoint.json"
+
+
+class Checkpoint:
+    """Completed stages and pages of a full sync, plus its dead-letter pages"""
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path or DEFAULT_CHECKPOINT_PATH)
+        self.started_at: Optional[str] = None
+        self.stages: Dict[str, Optional[int]] = {}
+        self.pages: Dict[str, List[int]] = {}
+        self.dead_letters: List[dict] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path = None) -> "Checkpoint":
+        """Load the saved checkpoint; returns an empty one if none exists"""
+        checkpoint = cls(path)
+        if not checkpoint.path.exists():
+            return checkpoint
+
+        with open(checkpoint.path) as f:
+            data = json.load(f)
+        checkpoint.started_at = data.get("started_at")
+        checkpoint.stages = data.get("stages", {})
+        checkpoint.pages = {stage: list(pages) for stage, pages in data.get("pages", {}).items()}
+        checkpoint.dead_letters = data.get("dead_letters", [])
+        return checkpoint
+
+    @property
+    def in_progress(self) -> bool:
+        """Whether an interrupted sync left completed work to resume from"""
+        return bool(self.stages or self.pages)
+
+    def save(self):
+        """
+        Write to a temporary file and rename, so a crash never leaves a torn
+        checkpoint; the file is removed once nothing is left in it
+        """
+        with self._lock:
+            if not (self.in_progress or self.dead_letters):
+                if self.path.exists():
+                    self.path.unlink()
+                return
+            data = {
+                "started_at": self.started_at,
+                "stages": self.stages,
+                "pages": self.pages,
+                "dead_letters": self.dead_letters,
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w") as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp, self.path)
+
+    def start(self):
+        """Begin a new sync (keeps dead letters from earlier ones)"""
+        with self._lock:
+            self.started_at = datetime.now().isoformat()
+            self.stages = {}
+            self.pages = {}
+        self.save()
+
+    def clear(self):
+        """Forget completed work after a sync that finished"""
+        with self._lock:
+            self.started_at = None
+            self.stages = {}
+            self.pages = {}
+        self.save()
+
+    # ==================== STAGES ====================
+    def complete_stage(self, stage: str, records: Optional[int] = None):
+        with self._lock:
+            self.stages[stage] = records
+        self.save()
+
+    # ==================== PAGES ====================
+    def page_done(self, stage: str, page: int) -> bool:
+        with self._lock:
+            return page in self.pages.get(stage, [])
+
+    def complete_page(self, stage: str, page: int):
+        """Record a page as done and drop it from the dead letters"""
+        with self._lock:
+            self.pages.setdefault(stage, []).append(page)
+            self._drop_dead_letter(stage, page)
+        self.save()
+
+    def resolve_dead_letter(self, stage: str, page: int):
+        """Drop a dead-lettered page that has now been fetched"""
+        with self._lock:
+            self._drop_dead_letter(stage, page)
+        self.save()
+
+    def _drop_dead_letter(self, stage: str, page: int):
+        self.dead_letters = [d for d in self.dead_letters if (d["stage"], d["page"]) != (stage, page)]
+
+    def dead_letter(self, stage: str, page: int, error: str):
+        """Record a page that failed after retries (one entry per page, latest error)"""
+        with self._lock:
+            attempts = 1 + sum(d["attempts"] for d in self.dead_letters if (d["stage"], d["page"]) == (stage, page))
+            self._drop_dead_letter(stage, page)
+            self.dead_letters.append({"stage": stage, "page": page, "error": error,
+                                      "attempts": attempts, "failed_at": datetime.now().isoformat()})
+        self.save()
+
+    def dead_pages(self, stage: str) -> List[int]:
+        with self._lock:
+            return sorted(d["page"] for d in self.dead_letters if d["stage"] == stage)
@@ -16,10 +16,10 @@ ABIOS_CLIENT_ID = os.getenv("ABIOS_CLIENT_ID")
 ABIOS_CLIENT_SECRET = os.getenv("ABIOS_CLIENT_SECRET")
 ODDSPAPI_API_KEY = os.getenv("ODDSPAPI_API_KEY")
 
-# API Endpoints
-PANDASCORE_BASE_URL = "https://api.pandascore.co"
-ABIOS_BASE_URL = "https://api.abiosgaming.com/v3"
-ODDSPAPI_BASE_URL = "https://api.oddspapi.io/v1"
+# API Endpoints (overridable, e.g. to point at the benchmark's fake APIs)
+PANDASCORE_BASE_URL = os.getenv("PANDASCORE_BASE_URL", "https://api.pandascore.co")
+ABIOS_BASE_URL = os.getenv("ABIOS_BASE_URL", "https://api.abiosgaming.com/v3")
+ODDSPAPI_BASE_URL = os.getenv("ODDSPAPI_BASE_URL", "https://api.oddspapi.io/v1")
 
 # Rate limiting
 API_RATE_LIMIT_DELAY = float(os.getenv("API_RATE_LIMIT_DELAY", "1.0"))
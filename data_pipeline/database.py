@@ -2,20 +2,44 @@
 Database operations for CS2 data pipeline
 Uses Supabase client for PostgreSQL operations
 """
-from typing import List, Optional, Dict, Any
+import math
+import numbers
+from typing import List, Optional, Dict, Any, TYPE_CHECKING
 from datetime import datetime
-from supabase import create_client, Client
 
 from config import SUPABASE_URL, SUPABASE_SERVICE_KEY
+from instrumentation import timed_write
+from profiling import span
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+
+def _json_safe(value):
+    """Replace NaN/inf (e.g. the std of a single match) with None; JSON has no encoding for them"""
+    if isinstance(value, numbers.Real) and not isinstance(value, numbers.Integral):
+        value = float(value)
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
 
 
 class Database:
     """Database operations handler"""
     
-    def __init__(self):
-        self.client: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    def __init__(self, feature_state=None):
+        # supabase (auth, realtime, storage and postgrest clients) is the
+        # slowest import in the pipeline; only pay for it when connecting
+        from supabase import create_client
+        self.client: "Client" = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+        # Optional ml.online_features.OnlineFeatureStore kept current on ingest
+        self.feature_state = feature_state
     
     # ==================== TEAMS ====================
+    @timed_write
     def upsert_teams(self, teams: List[dict]) -> tuple[int, int]:
         """Insert or update teams, returns (inserted, updated)"""
         if not teams:
@@ -44,10 +68,12 @@ class Database:
         if not external_ids:
             return {}
         
-        result = self.client.table("cs2_teams").select("id, external_id").in_("external_id", external_ids).execute()
+        with span("resolve_ids"):
+            result = self.client.table("cs2_teams").select("id, external_id").in_("external_id", external_ids).execute()
         return {r["external_id"]: r["id"] for r in result.data}
     
     # ==================== PLAYERS ====================
+    @timed_write
     def upsert_players(self, players: List[dict]) -> tuple[int, int]:
         """Insert or update players"""
         if not players:
@@ -85,10 +111,12 @@ class Database:
         if not external_ids:
             return {}
         
-        result = self.client.table("cs2_players").select("id, external_id").in_("external_id", external_ids).execute()
+        with span("resolve_ids"):
+            result = self.client.table("cs2_players").select("id, external_id").in_("external_id", external_ids).execute()
         return {r["external_id"]: r["id"] for r in result.data}
     
     # ==================== MATCHES ====================
+    @timed_write
     def upsert_matches(self, matches: List[dict]) -> tuple[int, int]:
         """Insert or update matches"""
         if not matches:
@@ -141,10 +169,12 @@ class Database:
         if not external_ids:
             return {}
         
-        result = self.client.table("cs2_matches").select("id, external_id").in_("external_id", external_ids).execute()
+        with span("resolve_ids"):
+            result = self.client.table("cs2_matches").select("id, external_id").in_("external_id", external_ids).execute()
         return {r["external_id"]: r["id"] for r in result.data}
     
     # ==================== PLAYER STATS ====================
+    @timed_write
     def insert_player_stats(self, stats: List[dict]) -> int:
         """Insert player match stats (with conflict handling)"""
         if not stats:
@@ -174,12 +204,19 @@ class Database:
                     on_conflict="player_id,match_id,map_name"
                 ).execute()
                 inserted += 1
+                
+                if self.feature_state is not None:
+                    self.feature_state.update(
+                        stat["player_id"], stat,
+                        key=f"{stat['match_id']}:{stat.get('map_name')}"
+                    )
             except Exception as e:
                 print(f"Error inserting stat: {e}")
         
         return inserted
     
     # ==================== ODDS ====================
+    @timed_write
     def insert_odds(self, odds: List[dict]) -> int:
         """Insert odds data"""
         if not odds:
@@ -213,11 +250,13 @@ class Database:
         return inserted
     
     # ==================== LOGGING ====================
+    @timed_write
     def log_fetch(self, log_data: dict):
         """Log a fetch operation"""
         self.client.table("data_fetch_log").insert(log_data).execute()
     
     # ==================== AGGREGATES ====================
+    @timed_write
     def update_player_aggregates(self, player_id: str, time_period: str, stats: dict):
         """Update or insert player aggregates"""
         data = {
@@ -233,19 +272,348 @@ class Database:
         ).execute()
     
     # ==================== ML PREDICTIONS ====================
+    @timed_write
     def insert_prediction(self, prediction: dict) -> str:
         """Insert an ML prediction and return its ID"""
         result = self.client.table("cs2_predictions").insert(prediction).execute()
         return result.data[0]["id"] if result.data else None
     
+    @timed_write
+    def insert_predictions(self, predictions: List[dict], chunk_size: int = 500) -> int:
+        """
+        Bulk insert ML predictions, one request per chunk; returns rows
+        inserted. Every chunk is attempted, then a RuntimeError is raised if
+        any failed, so callers never treat unstored predictions as stored.
+        """
+        inserted = 0
+        failed = []
+        for start in range(0, len(predictions), chunk_size):
+            # One non-finite feature value would otherwise fail the whole chunk
+            chunk = [_json_safe(p) for p in predictions[start:start + chunk_size]]
+            try:
+                result = self.client.table("cs2_predictions").insert(chunk).execute()
+                inserted += len(result.data)
+            except Exception as e:
+                print(f"Error inserting predictions {start}-{start + len(chunk) - 1}: {e}")
+                failed.append(e)
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} prediction chunk(s) failed to insert "
+                f"({inserted} of {len(predictions)} rows stored): {failed[0]}"
+            )
+        return inserted
+    
+    def get_unsettled_predictions(
+        self,
+        updated_since: Optional[str] = None,
+        page_size: int = 1000
+    ) -> List[dict]:
+        """
+        Predictions not yet settled whose match has finished, with the match
+        result and the prop line/type pulled out of features_used.
+        `updated_since` limits them to matches whose row was written since
+        then, so predictions that never settle stop being re-read.
+        """
+        columns = (
+            "id, match_id, player_id, prediction_type, predicted_value, model_version, "
+            "line:features_used->>line, prop_type:features_used->>prop_type, "
+            "match:cs2_matches!inner(status, team1_id, winner_id, updated_at)"
+        )
+        
+        # Collected before any settlement is written, so offsets stay stable
+        rows = []
+        start = 0
+        while True:
+            query = self.client.table("cs2_predictions").select(columns).is_(
+                "evaluated_at", "null"
+            ).eq("match.status", "finished")
+            if updated_since:
+                query = query.gte("match.updated_at", updated_since)
+            result = query.order("id").range(start, start + page_size - 1).execute()
+            
+            rows.extend(result.data)
+            if len(result.data) < page_size:
+                break
+            start += page_size
+        return rows
+    
+    @timed_write
+    def settle_predictions(self, settlements: List[dict], chunk_size: int = 1000) -> int:
+        """
+        Write settlements ({id, actual_result, was_correct, log_loss, brier})
+        with one set-based RPC per chunk, which also updates the per-model
+        running totals; returns rows settled
+        """
+        settled = 0
+        for start in range(0, len(settlements), chunk_size):
+            chunk = settlements[start:start + chunk_size]
+            try:
+                result = self.client.rpc("settle_cs2_predictions", {"settlements": chunk}).execute()
+                settled += int(result.data or 0)
+            except Exception as e:
+                print(f"Error settling predictions: {e}")
+        return settled
+    
+    def get_model_performance(self) -> List[dict]:
+        """Running settlement totals per model version and prediction type"""
+        result = self.client.table("cs2_model_performance").select("*").order(
+            "updated_at", desc=True
+        ).execute()
+        return result.data
+    
+    def get_prediction_fingerprints(self, match_ids: List[str], page_size: int = 1000):
+        """
+        Stream fingerprinted predictions for the given matches, newest first,
+        for incremental re-prediction
+        """
+        if not match_ids:
+            return
+        
+        start = 0
+        while True:
+            result = self.client.table("cs2_predictions").select(
+                "fingerprint, predicted_value, model_version, created_at"
+            ).in_("match_id", match_ids).not_.is_("fingerprint", "null").order(
+                "created_at", desc=True
+            ).range(start, start + page_size - 1).execute()
+            
+            yield from result.data
+            if len(result.data) < page_size:
+                break
+            start += page_size
+    
+    def get_prop_predictions(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        page_size: int = 1000
+    ):
+        """
+        Stream player prop predictions in creation order, with the line and
+        prop type pulled out of features_used (for backtesting)
+        """
+        columns = (
+            "id, match_id, player_id, prediction_type, predicted_value, model_version, created_at, "
+            "line:features_used->>line, prop_type:features_used->>prop_type"
+        )
+        
+        start = 0
+        while True:
+            query = self.client.table("cs2_predictions").select(columns).not_.is_("player_id", "null")
+            if since:
+                query = query.gte("created_at", since)
+            if until:
+                query = query.lt("created_at", until)
+            result = query.order("created_at").order("id").range(
+                start, start + page_size - 1
+            ).execute()
+            
+            yield from result.data
+            if len(result.data) < page_size:
+                break
+            start += page_size
+    
     def get_player_stats_for_ml(self, player_id: str, limit: int = 20) -> List[dict]:
         """Get recent player stats for ML feature generation"""
         result = self.client.table("cs2_player_stats").select("*").eq(
             "player_id", player_id
-        ).order("created_at", desc=True).limit(limit).execute()
+        ).order("created_at", desc=True).order("id", desc=True).limit(limit).execute()
         
         return result.data
     
+    def get_recent_player_stats_bulk(
+        self,
+        player_ids: Optional[List[str]] = None,
+        columns: Optional[List[str]] = None,
+        per_player: int = 30,
+        page_size: int = 1000,
+        id_chunk: int = 200
+    ):
+        """
+        Stream each player's newest `per_player` stats rows (all players or
+        the given ones), ordered by player then newest first. The limit is
+        applied in the database (recent_cs2_player_stats), so long careers
+        are not streamed just to be dropped. Yields rows page by page so
+        callers can build compact arrays without holding the whole result
+        as dicts.
+        """
+        select = ", ".join(["id", "player_id", "created_at"] + list(columns or ["*"]))
+        id_chunks = [None]
+        if player_ids is not None:
+            ids = sorted(set(player_ids))
+            id_chunks = [ids[i:i + id_chunk] for i in range(0, len(ids), id_chunk)]
+        
+        for chunk in id_chunks:
+            start = 0
+            while True:
+                # id breaks created_at ties, so pages never overlap or skip rows
+                result = self.client.rpc(
+                    "recent_cs2_player_stats", {"player_ids": chunk, "per_player": per_player}
+                ).select(select).order("player_id").order(
+                    "created_at", desc=True
+                ).order("id", desc=True).range(start, start + page_size - 1).execute()
+                
+                yield from result.data
+                if len(result.data) < page_size:
+                    break
+                start += page_size
+    
+    def get_player_stats_history(
+        self,
+        player_ids: Optional[List[str]] = None,
+        since: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+        page_size: int = 1000,
+        id_chunk: int = 200
+    ):
+        """
+        Stream every stats row (for all players or the given ones) with its
+        match's scheduled_at, for assembling training rows. `since` keeps
+        rows ingested at or after that time (created_at, inclusive).
+        """
+        select = ", ".join(
+            ["id", "player_id", "match_id", "map_name", "created_at"]
+            + list(columns if columns is not None else ["kills", "deaths", "assists"])
+            + ["match:cs2_matches!inner(scheduled_at)"]
+        )
+        id_chunks = [None]
+        if player_ids is not None:
+            ids = sorted(set(player_ids))
+            id_chunks = [ids[i:i + id_chunk] for i in range(0, len(ids), id_chunk)]
+
+        for chunk in id_chunks:
+            start = 0
+            while True:
+                query = self.client.table("cs2_player_stats").select(select)
+                if chunk is not None:
+                    query = query.in_("player_id", chunk)
+                if since:
+                    query = query.gte("created_at", since)
+                result = query.order("id").range(start, start + page_size - 1).execute()
+
+                for row in result.data:
+                    row["scheduled_at"] = (row.pop("match") or {}).get("scheduled_at")
+                    yield row
+                if len(result.data) < page_size:
+                    break
+                start += page_size
+
+    def get_player_match_stats(
+        self,
+        match_ids: List[str],
+        columns: Optional[List[str]] = None,
+        page_size: int = 1000,
+        id_chunk: int = 200
+    ):
+        """Stream per-map stats rows for the given matches"""
+        select = ", ".join(["match_id", "player_id"] + list(columns or ["kills", "deaths", "assists"]))
+        ids = sorted(set(match_ids))
+        
+        for i in range(0, len(ids), id_chunk):
+            chunk = ids[i:i + id_chunk]
+            start = 0
+            while True:
+                result = self.client.table("cs2_player_stats").select(select).in_(
+                    "match_id", chunk
+                ).order("id").range(start, start + page_size - 1).execute()
+                
+                yield from result.data
+                if len(result.data) < page_size:
+                    break
+                start += page_size
+    
+    def get_finished_matches(
+        self, 
+        since: Optional[str] = None, 
+        page_size: int = 1000,
+        include_raw: bool = False,
+        updated_since: Optional[str] = None
+    ):
+        """
+        Stream finished matches in chronological order, for rating replays.
+        `since` filters on ended_at and `updated_since` on when the row was
+        last written (to catch up on newly ingested results); raw_data
+        (per-map results) is only selected when `include_raw` is set.
+        """
+        columns = (
+            "id, team1_id, team2_id, winner_id, team1_score, team2_score, "
+            "best_of, scheduled_at, started_at, ended_at, updated_at"
+        )
+        if include_raw:
+            columns += ", raw_data"
+        
+        start = 0
+        while True:
+            query = self.client.table("cs2_matches").select(columns).eq("status", "finished")
+            if since:
+                query = query.gte("ended_at", since)
+            if updated_since:
+                query = query.gte("updated_at", updated_since)
+            result = query.order("scheduled_at").order("id").range(
+                start, start + page_size - 1
+            ).execute()
+            
+            yield from result.data
+            if len(result.data) < page_size:
+                break
+            start += page_size
+    
+    def get_latest_player_props(
+        self,
+        match_ids: Optional[List[str]] = None,
+        page_size: int = 1000
+    ):
+        """
+        Stream prop lines for upcoming matches (or the given matches), newest
+        fetch first, selecting only the pricing columns
+        """
+        columns = "match_id, player_id, prop_type, bookmaker, line, over_odds, under_odds, fetched_at"
+        
+        start = 0
+        while True:
+            if match_ids:
+                query = self.client.table("cs2_player_props").select(columns).in_("match_id", match_ids)
+            else:
+                query = self.client.table("cs2_player_props").select(
+                    columns + ", match:cs2_matches!inner(status)"
+                ).eq("match.status", "upcoming")
+            result = query.order("fetched_at", desc=True).order("id").range(
+                start, start + page_size - 1
+            ).execute()
+            
+            yield from result.data
+            if len(result.data) < page_size:
+                break
+            start += page_size
+    
+    def get_latest_odds(
+        self,
+        match_ids: Optional[List[str]] = None,
+        page_size: int = 1000
+    ):
+        """
+        Stream match odds for upcoming matches (or the given matches), newest
+        fetch first, selecting only the pricing columns
+        """
+        columns = "match_id, bookmaker, market_type, selection, line, odds_decimal, fetched_at"
+        
+        start = 0
+        while True:
+            if match_ids:
+                query = self.client.table("cs2_odds").select(columns).in_("match_id", match_ids)
+            else:
+                query = self.client.table("cs2_odds").select(
+                    columns + ", match:cs2_matches!inner(status)"
+                ).eq("match.status", "upcoming")
+            result = query.order("fetched_at", desc=True).order("id").range(
+                start, start + page_size - 1
+            ).execute()
+            
+            yield from result.data
+            if len(result.data) < page_size:
+                break
+            start += page_size
+    
     def get_upcoming_matches(self) -> List[dict]:
         """Get upcoming matches for predictions"""
         result = self.client.table("cs2_matches").select(
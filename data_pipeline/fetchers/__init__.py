@@ -1,5 +1,17 @@
-from .pandascore import PandaScoreFetcher
-from .abios import AbiosFetcher
-from .oddspapi import OddsPapiFetcher
+import importlib
+
+# Fetcher classes are imported on first access (PEP 562), so importing the
+# package does not pull in httpx, tenacity or config for the other sources
+_FETCHERS = {
+    'PandaScoreFetcher': '.pandascore',
+    'AbiosFetcher': '.abios',
+    'OddsPapiFetcher': '.oddspapi',
+}
 
 __all__ = ['PandaScoreFetcher', 'AbiosFetcher', 'OddsPapiFetcher']
+
+
+def __getattr__(name):
+    if name in _FETCHERS:
+        return getattr(importlib.import_module(_FETCHERS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -28,7 +28,7 @@ class AbiosFetcher(BaseFetcher):
         """Get OAuth access token"""
         import httpx
         
-        auth_url = "https://api.abiosgaming.com/v3/oauth/access_token"
+        auth_url = f"{ABIOS_BASE_URL}/oauth/access_token"
         response = httpx.post(auth_url, data={
             "grant_type": "client_credentials",
             "client_id": ABIOS_CLIENT_ID,
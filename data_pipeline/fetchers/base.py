@@ -2,6 +2,7 @@
 Base class for API fetchers with common functionality
 """
 import time
+import threading
 import httpx
 from typing import Any, Optional
 from datetime import datetime
@@ -10,6 +11,14 @@ from tenacity import retry, stop_after_attempt, wait_exponential
 import sys
 sys.path.append('..')
 from config import API_RATE_LIMIT_DELAY
+from instrumentation import METRICS
+from profiling import span
+
+
+def _record_retry(retry_state):
+    """tenacity before_sleep hook: count the retry and its backoff per endpoint"""
+    fetcher, endpoint = retry_state.args[0], retry_state.args[1]
+    METRICS.record_retry(fetcher.source_name, endpoint, retry_state.next_action.sleep)
 
 
 class BaseFetcher:
@@ -20,16 +29,22 @@ class BaseFetcher:
         self.api_key = api_key
         self.source_name = source_name
         self.last_request_time = 0
+        # Pipeline stages of one source share the fetcher (and its rate limit) across threads
+        self._rate_lock = threading.Lock()
         self.client = httpx.Client(timeout=30.0)
     
-    def _rate_limit(self):
-        """Enforce rate limiting between requests"""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < API_RATE_LIMIT_DELAY:
-            time.sleep(API_RATE_LIMIT_DELAY - elapsed)
-        self.last_request_time = time.time()
+    def _rate_limit(self) -> float:
+        """Enforce rate limiting between requests; returns seconds slept"""
+        with self._rate_lock:
+            elapsed = time.time() - self.last_request_time
+            slept = 0.0
+            if elapsed < API_RATE_LIMIT_DELAY:
+                slept = API_RATE_LIMIT_DELAY - elapsed
+                time.sleep(slept)
+            self.last_request_time = time.time()
+        return slept
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10))
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=10), before_sleep=_record_retry)
     def _make_request(
         self, 
         endpoint: str, 
@@ -37,22 +52,45 @@ class BaseFetcher:
         params: Optional[dict] = None,
         headers: Optional[dict] = None
     ) -> dict:
-        """Make HTTP request with retry logic"""
-        self._rate_limit()
+        """Make HTTP request with retry logic, recording each attempt in METRICS"""
+        started = time.perf_counter()
+        with span("rate_limit"):
+            slept = self._rate_limit()
         
         url = f"{self.base_url}{endpoint}"
         default_headers = self._get_auth_headers()
         if headers:
             default_headers.update(headers)
         
-        response = self.client.request(
-            method=method,
-            url=url,
-            params=params,
-            headers=default_headers
-        )
-        response.raise_for_status()
-        return response.json()
+        network = parse = 0.0
+        size = 0
+        sent = time.perf_counter()
+        try:
+            with span("fetch"):
+                response = self.client.request(
+                    method=method,
+                    url=url,
+                    params=params,
+                    headers=default_headers
+                )
+            network = time.perf_counter() - sent
+            size = len(response.content)
+            response.raise_for_status()
+            
+            parsing = time.perf_counter()
+            with span("parse"):
+                data = response.json()
+            parse = time.perf_counter() - parsing
+        except Exception:
+            # Timeouts and connection errors count their wait as latency
+            network = network or time.perf_counter() - sent
+            METRICS.record_request(self.source_name, endpoint, time.perf_counter() - started,
+                                   slept, network, parse, size, error=True)
+            raise
+        
+        METRICS.record_request(self.source_name, endpoint, time.perf_counter() - started,
+                               slept, network, parse, size)
+        return data
     
     def _get_auth_headers(self) -> dict:
         """Override in subclass to provide auth headers"""
@@ -73,6 +111,25 @@ class FetchResult:
         self.records_updated = 0
         self.error_message = None
         self.start_time = datetime.now()
+        # Requests and writes from here on belong to this run
+        self.metrics_mark = METRICS.snapshot()
+    
+    def metrics_summary(self, source: str = None) -> dict:
+        """Per-endpoint request and per-method write metrics for this run, with throughput"""
+        summary = METRICS.since(self.metrics_mark).summary(source)
+        seconds = (datetime.now() - self.start_time).total_seconds()
+        summary["records_per_sec"] = round(self.records_fetched / seconds, 1) if seconds > 0 else None
+        return summary
+    
+    def print_metrics(self, source: str = None):
+        summary = self.metrics_summary(source)
+        for r in summary["requests"]:
+            print(f"  {r['endpoint']}: {r['requests']} requests ({r['errors']} errors, {r['retries']} retries), "
+                  f"p50 {r['p50_ms'] or '>30000'}ms, {r['bytes'] / 1024:.0f} KiB, "
+                  f"network {r['network_seconds']:.2f}s, sleep {r['sleep_seconds']:.2f}s, "
+                  f"parse {r['parse_seconds']:.3f}s")
+        for w in summary["writes"]:
+            print(f"  {w['method']}: {w['rows']} rows in {w['seconds']:.2f}s ({w['rows_per_sec'] or 0} rows/s)")
     
     def to_log_dict(self, source: str, endpoint: str) -> dict:
         """Convert to dict for logging to database"""
@@ -85,5 +142,6 @@ class FetchResult:
             "records_inserted": self.records_inserted,
             "records_updated": self.records_updated,
             "error_message": self.error_message,
-            "duration_ms": int(duration)
+            "duration_ms": int(duration),
+            "metrics": self.metrics_summary(source)
         }
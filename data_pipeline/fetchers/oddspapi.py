@@ -58,6 +58,7 @@ class OddsPapiFetcher(BaseFetcher):
                             "market_type": market.get("key"),
                             "selection": outcome.get("name"),
                             "odds_decimal": outcome.get("price"),
+                            "line": outcome.get("point"),  # For handicaps/totals
                             "is_live": event_type == "live",
                             "source": self.source_name,
                             "fetched_at": datetime.utcnow().isoformat()
@@ -112,8 +113,11 @@ class OddsPapiFetcher(BaseFetcher):
             return 0
         return 1 / odds_decimal
     
-    def calculate_vig(self, odds1: float, odds2: float) -> float:
-        """Calculate bookmaker vig/margin from two-way odds"""
-        prob1 = self.calculate_implied_probability(odds1)
-        prob2 = self.calculate_implied_probability(odds2)
-        return (prob1 + prob2 - 1) * 100  # Return as percentage
+    def calculate_vig(self, *odds: float) -> float:
+        """
+        Calculate bookmaker vig/margin from the odds of every outcome in a
+        market (two-way or more). Whole snapshots are better de-vigged at
+        once with ml/pricing.py.
+        """
+        total = sum(self.calculate_implied_probability(o) for o in odds)
+        return (total - 1) * 100  # Return as percentage
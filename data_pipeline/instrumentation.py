@@ -0,0 +1,300 @@
+"""
+Request and write instrumentation for the data pipeline
+
+`METRICS` is the process-wide registry. `BaseFetcher._make_request` records
+every API call into it (per source and endpoint: a latency histogram over
+network and JSON parsing time, time spent in rate-limit sleeps, bytes
+received, HTTP errors and retries), the `Database` write methods record calls, rows
+and time per method, and the stage executor (pipeline.py) records runs,
+failures and time per stage. All values are counters, so a run's share is
+the difference between two snapshots:
+
+    mark = METRICS.snapshot()
+    ...                              # fetch and write
+    run = METRICS.since(mark)        # this run only
+    run.summary()                    # JSON summary stored in data_fetch_log.metrics
+    METRICS.to_prometheus()          # text exposition format, process totals
+"""
+import os
+import re
+import copy
+import time
+import functools
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from profiling import span
+
+
+# Upper bounds (seconds) of the request latency histogram buckets (network +
+# parse time; the client's own rate-limit pacing is counted separately)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Numeric ids and UUIDs in endpoint paths, collapsed so labels stay bounded
+_ID_SEGMENT = re.compile(r"/(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27})(?=/|$)")
+
+REQUEST_FIELDS = ("requests", "errors", "retries", "seconds", "latency_seconds", "sleep_seconds",
+                  "network_seconds", "parse_seconds", "bytes")
+WRITE_FIELDS = ("calls", "errors", "rows", "seconds")
+STAGE_FIELDS = ("runs", "failures", "seconds")
+
+
+def endpoint_label(endpoint: str) -> str:
+    """'/matches/12345' -> '/matches/{id}'"""
+    return _ID_SEGMENT.sub("/{id}", endpoint)
+
+
+class RunMetrics:
+    """Counters per (source, endpoint) request, database write method and pipeline stage"""
+
+    def __init__(self):
+        # (source, endpoint) -> {field: value, "buckets": [count per bucket, +Inf last]}
+        self.requests: Dict[Tuple[str, str], Dict] = {}
+        # method -> {field: value}
+        self.writes: Dict[str, Dict[str, float]] = {}
+        # stage -> {field: value}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        # Start of the period the counters cover
+        self.started = time.time()
+        # Stages record from worker threads
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        with self._lock:
+            mark = RunMetrics()
+            mark.requests = copy.deepcopy(self.requests, memo)
+            mark.writes = copy.deepcopy(self.writes, memo)
+            mark.stages = copy.deepcopy(self.stages, memo)
+            mark.started = self.started
+        return mark
+
+    def _endpoint(self, source: str, endpoint: str) -> Dict:
+        key = (source, endpoint_label(endpoint))
+        stats = self.requests.get(key)
+        if stats is None:
+            stats = self.requests[key] = {field: 0 for field in REQUEST_FIELDS}
+            stats["buckets"] = [0] * (len(LATENCY_BUCKETS) + 1)
+        return stats
+
+    # ==================== RECORDING ====================
+    def record_request(
+        self,
+        source: str,
+        endpoint: str,
+        seconds: float,
+        sleep_seconds: float = 0.0,
+        network_seconds: float = 0.0,
+        parse_seconds: float = 0.0,
+        size: int = 0,
+        error: bool = False
+    ):
+        """
+        One request attempt. `seconds` is wall time including the rate-limit
+        sleep; the latency histogram covers network and parse time only
+        """
+        latency = network_seconds + parse_seconds
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+        with self._lock:
+            stats = self._endpoint(source, endpoint)
+            stats["requests"] += 1
+            stats["errors"] += int(error)
+            stats["seconds"] += seconds
+            stats["latency_seconds"] += latency
+            stats["sleep_seconds"] += sleep_seconds
+            stats["network_seconds"] += network_seconds
+            stats["parse_seconds"] += parse_seconds
+            stats["bytes"] += size
+            stats["buckets"][bucket] += 1
+
+    def record_retry(self, source: str, endpoint: str, wait_seconds: float):
+        """A failed attempt about to be retried after `wait_seconds` of backoff"""
+        with self._lock:
+            stats = self._endpoint(source, endpoint)
+            stats["retries"] += 1
+            stats["sleep_seconds"] += wait_seconds
+
+    def record_write(self, method: str, rows: int, seconds: float, error: bool = False):
+        with self._lock:
+            stats = self.writes.get(method)
+            if stats is None:
+                stats = self.writes[method] = {field: 0 for field in WRITE_FIELDS}
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["rows"] += rows
+            stats["seconds"] += seconds
+
+    def record_stage(self, stage: str, seconds: float, failed: bool = False):
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = {field: 0 for field in STAGE_FIELDS}
+            stats["runs"] += 1
+            stats["failures"] += int(failed)
+            stats["seconds"] += seconds
+
+    # ==================== SNAPSHOTS ====================
+    def snapshot(self) -> "RunMetrics":
+        mark = copy.deepcopy(self)
+        mark.started = time.time()
+        return mark
+
+    def since(self, mark: "RunMetrics") -> "RunMetrics":
+        """Counters accumulated after `mark` (a snapshot of this registry)"""
+        run = RunMetrics()
+        run.started = mark.started
+        # Consistent copy: other threads may be recording
+        current = copy.deepcopy(self)
+        for key, stats in current.requests.items():
+            before = mark.requests.get(key)
+            delta = {field: stats[field] - (before[field] if before else 0) for field in REQUEST_FIELDS}
+            delta["buckets"] = [n - (before["buckets"][i] if before else 0) for i, n in enumerate(stats["buckets"])]
+            if delta["requests"] or delta["retries"]:
+                run.requests[key] = delta
+        for method, stats in current.writes.items():
+            before = mark.writes.get(method)
+            delta = {field: stats[field] - (before[field] if before else 0) for field in WRITE_FIELDS}
+            if delta["calls"]:
+                run.writes[method] = delta
+        for stage, stats in current.stages.items():
+            before = mark.stages.get(stage)
+            delta = {field: stats[field] - (before[field] if before else 0) for field in STAGE_FIELDS}
+            if delta["runs"]:
+                run.stages[stage] = delta
+        return run
+
+    # ==================== EXPORT ====================
+    def latency_quantile(self, stats: Dict, q: float) -> Optional[float]:
+        """Upper bucket bound containing quantile q (None beyond the last bucket)"""
+        total = sum(stats["buckets"])
+        if not total:
+            return None
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+            seen += count
+            if seen >= q * total:
+                return bound
+        return None
+
+    def summary(self, source: str = None) -> Dict:
+        """
+        JSON-serialisable per-endpoint, per-write-method and per-stage summary.
+        With `source`, only that source's requests and stages (`<source>.*`);
+        writes are not attributed to sources and cover the whole period.
+        """
+        endpoints = []
+        for (request_source, endpoint), stats in sorted(self.requests.items()):
+            if source and request_source != source:
+                continue
+            requests = stats["requests"] or 1
+            endpoints.append({
+                "source": request_source,
+                "endpoint": endpoint,
+                **{field: round(stats[field], 4) for field in REQUEST_FIELDS},
+                "mean_ms": round(stats["latency_seconds"] / requests * 1000, 1),
+                "p50_ms": _ms(self.latency_quantile(stats, 0.5)),
+                "p95_ms": _ms(self.latency_quantile(stats, 0.95)),
+            })
+
+        writes = []
+        for method, stats in sorted(self.writes.items()):
+            writes.append({
+                "method": method,
+                **{field: round(stats[field], 4) for field in WRITE_FIELDS},
+                "rows_per_sec": round(stats["rows"] / stats["seconds"], 1) if stats["seconds"] else None,
+            })
+
+        stages = [
+            {"stage": stage, **{field: round(stats[field], 4) for field in STAGE_FIELDS}}
+            for stage, stats in sorted(self.stages.items())
+            if not source or stage.startswith(f"{source}.")
+        ]
+        return {"requests": endpoints, "writes": writes, "stages": stages}
+
+    def to_prometheus(self, prefix: str = "cs2_pipeline") -> str:
+        """Prometheus text exposition format (e.g. for a node_exporter textfile collector)"""
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        family("request_duration_seconds", "histogram", "API request latency (network and parsing, excluding rate-limit sleeps)")
+        for (source, endpoint), stats in sorted(self.requests.items()):
+            labels = f'source="{source}",endpoint="{endpoint}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+                cumulative += count
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["requests"]}')
+            lines.append(f"{prefix}_request_duration_seconds_sum{{{labels}}} {stats['latency_seconds']:.6f}")
+            lines.append(f"{prefix}_request_duration_seconds_count{{{labels}}} {stats['requests']}")
+
+        request_counters = (
+            ("request_errors_total", "errors", "Failed API request attempts"),
+            ("request_seconds_total", "seconds", "Wall time in API requests, including rate-limit sleeps"),
+            ("request_retries_total", "retries", "API request attempts retried"),
+            ("request_sleep_seconds_total", "sleep_seconds", "Time in rate-limit sleeps and retry backoff"),
+            ("request_network_seconds_total", "network_seconds", "Time waiting on the network"),
+            ("request_parse_seconds_total", "parse_seconds", "Time parsing JSON responses"),
+            ("response_bytes_total", "bytes", "Response bytes received"),
+        )
+        for name, field, help_text in request_counters:
+            family(name, "counter", help_text)
+            for (source, endpoint), stats in sorted(self.requests.items()):
+                lines.append(f'{prefix}_{name}{{source="{source}",endpoint="{endpoint}"}} {stats[field]}')
+
+        write_counters = (
+            ("db_write_calls_total", "calls", "Database write method calls"),
+            ("db_write_errors_total", "errors", "Database write method calls that raised"),
+            ("db_write_rows_total", "rows", "Rows passed to database write methods"),
+            ("db_write_seconds_total", "seconds", "Time in database write methods"),
+        )
+        for name, field, help_text in write_counters:
+            family(name, "counter", help_text)
+            for method, stats in sorted(self.writes.items()):
+                lines.append(f'{prefix}_{name}{{method="{method}"}} {stats[field]}')
+
+        stage_counters = (
+            ("stage_runs_total", "runs", "Pipeline stage runs"),
+            ("stage_failures_total", "failures", "Pipeline stage runs that raised"),
+            ("stage_seconds_total", "seconds", "Time in pipeline stages"),
+        )
+        for name, field, help_text in stage_counters:
+            family(name, "counter", help_text)
+            for stage, stats in sorted(self.stages.items()):
+                lines.append(f'{prefix}_{name}{{stage="{stage}"}} {stats[field]}')
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Write the exposition atomically, as textfile collectors expect"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else seconds * 1000
+
+
+# Process-wide registry
+METRICS = RunMetrics()
+
+
+def timed_write(method):
+    """Record a Database write method's time and row count (length of its first argument)"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        rows = args[0] if args else None
+        rows = len(rows) if isinstance(rows, (list, tuple)) else 1
+        started = time.perf_counter()
+        try:
+            with span(f"write {method.__name__}"):
+                result = method(self, *args, **kwargs)
+        except Exception:
+            METRICS.record_write(method.__name__, rows, time.perf_counter() - started, error=True)
+            raise
+        METRICS.record_write(method.__name__, rows, time.perf_counter() - started)
+        return result
+    return wrapper
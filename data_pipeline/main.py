@@ -1,200 +1,389 @@
 """
 Main data pipeline orchestrator
 Run this script to fetch data from all sources and sync to database
+
+The sync is a DAG of stages (see pipeline.py) run with as much overlap as
+the foreign keys allow: every source's fetches start at once, teams are
+written before that source's players and matches, and odds and
+settlement wait for the match writes.
+
+Full syncs are checkpointed (checkpoint.py): an interrupted backfill
+resumes where it stopped, and history pages that keep failing are
+dead-lettered for --retry-dead-letters instead of aborting the source.
 """
 import sys
+import time
 import argparse
+import threading
 from datetime import datetime
+from typing import Callable, List, TYPE_CHECKING
 
-from database import Database
-from fetchers import PandaScoreFetcher, AbiosFetcher, OddsPapiFetcher
-from fetchers.base import FetchResult
+from instrumentation import METRICS
+from profiling import add_profile_arguments, profiled
+from pipeline import Stage, DEFAULT_WORKERS, validate, select_stages, resume_stages, run_stages, print_timings
+from checkpoint import Checkpoint
 
+# supabase, httpx, numpy and pandas are imported by the code paths that use
+# them, so --help and single-source cron runs only load what they need
+if TYPE_CHECKING:
+    from database import Database
 
-def fetch_pandascore(db: Database, full_sync: bool = False):
-    """Fetch data from PandaScore"""
-    print("\n=== PandaScore Sync ===")
-    fetcher = PandaScoreFetcher()
-    result = FetchResult()
-    
-    try:
-        # Fetch teams
-        print("Fetching teams...")
-        teams = fetcher.fetch_teams()
-        result.records_fetched += len(teams)
-        inserted, updated = db.upsert_teams(teams)
-        result.records_inserted += inserted
-        result.records_updated += updated
-        print(f"  Teams: {inserted} inserted, {updated} updated")
-        
-        # Fetch players
-        print("Fetching players...")
-        players = fetcher.fetch_players()
-        result.records_fetched += len(players)
-        inserted, updated = db.upsert_players(players)
-        result.records_inserted += inserted
-        result.records_updated += updated
-        print(f"  Players: {inserted} inserted, {updated} updated")
-        
-        # Fetch upcoming matches
-        print("Fetching upcoming matches...")
-        matches = fetcher.fetch_upcoming_matches()
-        result.records_fetched += len(matches)
-        inserted, updated = db.upsert_matches(matches)
-        result.records_inserted += inserted
-        result.records_updated += updated
-        print(f"  Upcoming matches: {inserted} inserted, {updated} updated")
-        
-        # Fetch live matches
-        print("Fetching live matches...")
-        live_matches = fetcher.fetch_running_matches()
-        result.records_fetched += len(live_matches)
-        inserted, updated = db.upsert_matches(live_matches)
-        result.records_inserted += inserted
-        result.records_updated += updated
-        print(f"  Live matches: {inserted} inserted, {updated} updated")
-        
-        # Full sync: also fetch historical data
-        if full_sync:
-            print("Fetching historical matches (full sync)...")
-            for page in range(1, 6):  # Fetch 5 pages of history
-                past_matches = fetcher.fetch_past_matches(page=page)
-                if not past_matches:
+# Pages of match history fetched by a full sync
+HISTORY_PAGES = 5
+
+# History pages failing in a row (after the fetcher's retries) before the
+# stage gives up: one bad page is dead-lettered, a run of them is an outage
+MAX_CONSECUTIVE_PAGE_FAILURES = 3
+
+# --source shorthands as stage patterns (run without upstream stages of other sources)
+SOURCE_PATTERNS = {
+    "all": ["*"],
+    "pandascore": ["pandascore.*"],
+    "abios": ["abios.*"],
+    "odds": ["oddspapi.*"],
+    "settle": ["settle"],
+}
+
+
+class SourceSync:
+    """One source's fetcher, fetched payloads and FetchResult, shared by its stages"""
+
+    def __init__(self, source: str, make_fetcher: Callable, db: "Database", mode: str):
+        from fetchers.base import FetchResult
+
+        self.source = source
+        self.db = db
+        self.mode = mode
+        self.result = FetchResult()
+        self.payloads = {}
+        self._make_fetcher = make_fetcher
+        self._fetcher = None
+        self._lock = threading.Lock()
+
+    @property
+    def fetcher(self):
+        # Created by the first stage that needs it (Abios authenticates here)
+        with self._lock:
+            if self._fetcher is None:
+                self._fetcher = self._make_fetcher()
+        return self._fetcher
+
+    def step(self, func: Callable) -> Callable:
+        """Stage body that marks this source's run as failed when it raises"""
+        def run():
+            try:
+                return func()
+            except Exception as e:
+                with self._lock:
+                    self.result.status = "error"
+                    self.result.error_message = str(e)
+                raise
+        return run
+
+    def fetch(self, key: str, func: Callable[[], list]) -> Callable:
+        """Stage body that fetches a payload for a later write stage"""
+        def run():
+            records = func()
+            self.payloads[key] = records
+            with self._lock:
+                self.result.records_fetched += len(records)
+            return len(records)
+        return self.step(run)
+
+    def write(self, key: str, label: str, method: str) -> Callable:
+        """Stage body that upserts a fetched payload with a Database method"""
+        def run():
+            if key not in self.payloads:
+                raise RuntimeError(f"no {key} fetched (run {self.source}.{key}.fetch first)")
+            records = self.payloads.pop(key)
+            inserted, updated = getattr(self.db, method)(records)
+            self.count(inserted, updated)
+            print(f"  [{self.source}] {label}: {inserted} inserted, {updated} updated")
+            return len(records)
+        return self.step(run)
+
+    def count(self, inserted: int, updated: int = 0):
+        with self._lock:
+            self.result.records_inserted += inserted
+            self.result.records_updated += updated
+
+    def finish(self) -> int:
+        """Print this source's metrics and log the run (always runs, after its other stages)"""
+        try:
+            self.result.print_metrics(self.source)
+            mode = self.mode if self.result.status == "success" else "error"
+            self.db.log_fetch(self.result.to_log_dict(self.source, mode))
+        finally:
+            if self._fetcher is not None:
+                self._fetcher.close()
+        return self.result.records_fetched
+
+
+def entity_stages(sync: SourceSync, entity: str, label: str, fetch: Callable, write: str,
+                  deps: List[str] = ()) -> List[Stage]:
+    """`<source>.<entity>.fetch` (no dependencies) and the write `<source>.<entity>` after `deps`"""
+    prefix = f"{sync.source}.{entity}"
+    return [
+        Stage(f"{prefix}.fetch", sync.fetch(entity, fetch), checkpoint=False),
+        Stage(prefix, sync.write(entity, label, write), [f"{prefix}.fetch", *deps]),
+    ]
+
+
+# ==================== SOURCES ====================
+def pandascore_stages(db: "Database", full_sync: bool = False, checkpoint: Checkpoint = None,
+                      history_pages: int = HISTORY_PAGES, retry_dead_letters: bool = False) -> List[Stage]:
+    """
+    PandaScore: teams, then players, upcoming, live and (full sync) past
+    matches. With a checkpoint, past pages already done are skipped and
+    failed pages are dead-lettered; retry_dead_letters fetches only those.
+    """
+    from fetchers import PandaScoreFetcher
+
+    sync = SourceSync("pandascore", PandaScoreFetcher, db, "full_sync" if full_sync else "regular")
+    teams = ["pandascore.teams"]
+    stages = [
+        *entity_stages(sync, "teams", "Teams", lambda: sync.fetcher.fetch_teams(), "upsert_teams"),
+        *entity_stages(sync, "players", "Players", lambda: sync.fetcher.fetch_players(), "upsert_players", teams),
+        # Match writes stay in the order upcoming, live, past: a match that
+        # moved between lists must end up with its latest state, and
+        # concurrent upserts of a new external_id would both insert
+        *entity_stages(sync, "upcoming", "Upcoming matches",
+                       lambda: sync.fetcher.fetch_upcoming_matches(), "upsert_matches", teams),
+        *entity_stages(sync, "live", "Live matches",
+                       lambda: sync.fetcher.fetch_running_matches(), "upsert_matches", ["pandascore.upcoming"]),
+    ]
+
+    if full_sync:
+        def history():
+            from tenacity import RetryError
+
+            stage = "pandascore.past"
+            pages = checkpoint.dead_pages(stage) if retry_dead_letters else range(1, history_pages + 1)
+            fetched = failures = 0
+            for page in pages:
+                if checkpoint is not None and not retry_dead_letters and checkpoint.page_done(stage, page):
+                    continue
+                try:
+                    past_matches = sync.fetcher.fetch_past_matches(page=page)
+                    inserted, updated = db.upsert_matches(past_matches) if past_matches else (0, 0)
+                except Exception as e:
+                    if checkpoint is None:
+                        raise
+                    error = e.last_attempt.exception() if isinstance(e, RetryError) else e
+                    error = str(error).splitlines()[0]
+                    checkpoint.dead_letter(stage, page, error)
+                    print(f"  [pandascore] History page {page}: FAILED ({error}), dead-lettered")
+                    failures += 1
+                    if failures >= MAX_CONSECUTIVE_PAGE_FAILURES:
+                        raise RuntimeError(f"{failures} history pages failed in a row, last: {error}")
+                    continue
+
+                failures = 0
+                if checkpoint is not None:
+                    if retry_dead_letters:
+                        checkpoint.resolve_dead_letter(stage, page)
+                    else:
+                        checkpoint.complete_page(stage, page)
+                if not past_matches and not retry_dead_letters:
                     break
-                result.records_fetched += len(past_matches)
-                inserted, updated = db.upsert_matches(past_matches)
-                result.records_inserted += inserted
-                result.records_updated += updated
-                print(f"    Page {page}: {inserted} inserted, {updated} updated")
-        
-        db.log_fetch(result.to_log_dict("pandascore", "full_sync" if full_sync else "regular"))
-        
-    except Exception as e:
-        result.status = "error"
-        result.error_message = str(e)
-        db.log_fetch(result.to_log_dict("pandascore", "error"))
-        print(f"  ERROR: {e}")
-    
-    finally:
-        fetcher.close()
-    
-    return result
-
-
-def fetch_abios(db: Database, full_sync: bool = False):
-    """Fetch data from Abios"""
-    print("\n=== Abios Sync ===")
-    fetcher = AbiosFetcher()
-    result = FetchResult()
-    
-    try:
-        # Fetch teams
-        print("Fetching teams...")
-        teams = fetcher.fetch_teams()
-        result.records_fetched += len(teams)
-        inserted, updated = db.upsert_teams(teams)
-        result.records_inserted += inserted
-        result.records_updated += updated
-        print(f"  Teams: {inserted} inserted, {updated} updated")
-        
-        # Fetch players
-        print("Fetching players...")
-        players = fetcher.fetch_players()
-        result.records_fetched += len(players)
-        inserted, updated = db.upsert_players(players)
-        result.records_inserted += inserted
-        result.records_updated += updated
-        print(f"  Players: {inserted} inserted, {updated} updated")
-        
-        # Fetch upcoming matches
-        print("Fetching upcoming matches...")
-        matches = fetcher.fetch_matches(status="upcoming")
-        result.records_fetched += len(matches)
-        inserted, updated = db.upsert_matches(matches)
-        result.records_inserted += inserted
-        result.records_updated += updated
-        print(f"  Upcoming: {inserted} inserted, {updated} updated")
-        
-        # Fetch live matches
-        print("Fetching live matches...")
-        live = fetcher.fetch_matches(status="live")
-        result.records_fetched += len(live)
-        inserted, updated = db.upsert_matches(live)
-        result.records_inserted += inserted
-        result.records_updated += updated
-        print(f"  Live: {inserted} inserted, {updated} updated")
-        
-        db.log_fetch(result.to_log_dict("abios", "full_sync" if full_sync else "regular"))
-        
-    except Exception as e:
-        result.status = "error"
-        result.error_message = str(e)
-        db.log_fetch(result.to_log_dict("abios", "error"))
-        print(f"  ERROR: {e}")
-    
-    finally:
-        fetcher.close()
-    
-    return result
-
-
-def fetch_odds(db: Database):
-    """Fetch odds data"""
-    print("\n=== OddsPapi Sync ===")
-    fetcher = OddsPapiFetcher()
-    result = FetchResult()
-    
-    try:
-        # Fetch upcoming odds
-        print("Fetching odds...")
-        odds = fetcher.fetch_cs2_odds("upcoming")
-        result.records_fetched += len(odds)
-        inserted = db.insert_odds(odds)
-        result.records_inserted += inserted
-        print(f"  Odds: {inserted} inserted")
-        
-        # Fetch Pinnacle sharp lines
-        print("Fetching Pinnacle lines...")
-        pinnacle = fetcher.fetch_pinnacle_odds()
-        result.records_fetched += len(pinnacle)
-        inserted = db.insert_odds(pinnacle)
-        result.records_inserted += inserted
-        print(f"  Pinnacle: {inserted} inserted")
-        
-        db.log_fetch(result.to_log_dict("oddspapi", "regular"))
-        
-    except Exception as e:
-        result.status = "error"
-        result.error_message = str(e)
-        db.log_fetch(result.to_log_dict("oddspapi", "error"))
-        print(f"  ERROR: {e}")
-    
-    finally:
-        fetcher.close()
-    
-    return result
+                fetched += len(past_matches)
+                with sync._lock:
+                    sync.result.records_fetched += len(past_matches)
+                sync.count(inserted, updated)
+                print(f"  [pandascore] History page {page}: {inserted} inserted, {updated} updated")
+            return fetched
+        stages.append(Stage("pandascore.past", sync.step(history), ["pandascore.live"]))
+
+    stages.append(Stage("pandascore.log", sync.finish, [s.name for s in stages], always=True))
+    return stages
+
+
+def abios_stages(db: "Database", full_sync: bool = False) -> List[Stage]:
+    """Abios: teams, then players, upcoming and live series"""
+    from fetchers import AbiosFetcher
+
+    sync = SourceSync("abios", AbiosFetcher, db, "full_sync" if full_sync else "regular")
+    teams = ["abios.teams"]
+    stages = [
+        *entity_stages(sync, "teams", "Teams", lambda: sync.fetcher.fetch_teams(), "upsert_teams"),
+        *entity_stages(sync, "players", "Players", lambda: sync.fetcher.fetch_players(), "upsert_players", teams),
+        # Match writes in order, as for PandaScore
+        *entity_stages(sync, "upcoming", "Upcoming",
+                       lambda: sync.fetcher.fetch_matches(status="upcoming"), "upsert_matches", teams),
+        *entity_stages(sync, "live", "Live",
+                       lambda: sync.fetcher.fetch_matches(status="live"), "upsert_matches", ["abios.upcoming"]),
+    ]
+    stages.append(Stage("abios.log", sync.finish, [s.name for s in stages], always=True))
+    return stages
+
+
+def odds_stages(db: "Database", matches: List[str]) -> List[Stage]:
+    """OddsPapi: odds and Pinnacle lines, inserted once the `matches` stages are done"""
+    from fetchers import OddsPapiFetcher
+
+    sync = SourceSync("oddspapi", OddsPapiFetcher, db, "regular")
+
+    def fetch():
+        from ml.pricing import fair_prices
+
+        odds = sync.fetcher.fetch_cs2_odds("upcoming")
+        pinnacle = sync.fetcher.fetch_pinnacle_odds()
+        sync.payloads["odds"], sync.payloads["pinnacle"] = odds, pinnacle
+        with sync._lock:
+            sync.result.records_fetched += len(odds) + len(pinnacle)
+
+        # Margins per bookmaker across the whole snapshot (before inserting,
+        # which swaps external match ids for internal ones)
+        books = fair_prices(odds + pinnacle)["books"]
+        for book in books.itertuples(index=False):
+            print(f"  [oddspapi] {book.bookmaker}: {book.mean_margin:.2%} mean margin over {book.markets} markets")
+        return len(odds) + len(pinnacle)
+
+    def insert():
+        total = 0
+        for key, label in (("odds", "Odds"), ("pinnacle", "Pinnacle")):
+            inserted = db.insert_odds(sync.payloads.pop(key))
+            sync.count(inserted)
+            total += inserted
+            print(f"  [oddspapi] {label}: {inserted} inserted")
+        return total
+
+    stages = [
+        Stage("oddspapi.fetch", sync.step(fetch), checkpoint=False),
+        Stage("oddspapi.insert", sync.step(insert), ["oddspapi.fetch", *matches]),
+    ]
+    stages.append(Stage("oddspapi.log", sync.finish, [s.name for s in stages], always=True))
+    return stages
+
+
+def build_stages(db: "Database", full_sync: bool = False, checkpoint: Checkpoint = None,
+                 history_pages: int = HISTORY_PAGES, retry_dead_letters: bool = False) -> List[Stage]:
+    """The whole sync graph: all sources, then settlement of finished matches"""
+    stages = pandascore_stages(db, full_sync, checkpoint, history_pages, retry_dead_letters)
+    stages += abios_stages(db, full_sync)
+    # Odds wait for the current matches only, not for a (possibly
+    # multi-page) history backfill
+    matches = [s.name for s in stages if s.name.split(".")[-1] in ("upcoming", "live")]
+    stages += odds_stages(db, matches)
+
+    def settle_stage():
+        from ml.settlement import settle, print_performance
+
+        print("\n=== Prediction Settlement ===")
+        settled = settle(db)
+        print_performance(db)
+        return settled
+
+    # Finished matches from this sync settle their predictions, including
+    # those a full sync backfills
+    settle_deps = matches + [s.name for s in stages if s.name == "pandascore.past"]
+    stages.append(Stage("settle", settle_stage, settle_deps))
+    validate(stages)
+    return stages
 
 
 def main():
     parser = argparse.ArgumentParser(description="CS2 Data Pipeline")
-    parser.add_argument("--full-sync", action="store_true", help="Perform full historical sync")
-    parser.add_argument("--source", choices=["all", "pandascore", "abios", "odds"], default="all")
+    parser.add_argument("--full-sync", action="store_true",
+                        help="Perform full historical sync (checkpointed; resumes an interrupted one)")
+    parser.add_argument("--history-pages", type=int, default=HISTORY_PAGES,
+                        help="Pages of past matches fetched by a full sync")
+    parser.add_argument("--restart", action="store_true",
+                        help="With --full-sync, discard the checkpoint of an interrupted sync and start over")
+    parser.add_argument("--retry-dead-letters", action="store_true",
+                        help="Only refetch the history pages that failed in earlier full syncs")
+    parser.add_argument("--source", choices=list(SOURCE_PATTERNS), default="all")
+    parser.add_argument("--stages", nargs="+", metavar="PATTERN",
+                        help="Run the stages matching these globs (e.g. 'pandascore.*' oddspapi.insert) "
+                             "and their upstream stages; overrides --source")
+    parser.add_argument("--no-deps", action="store_true", help="With --stages, do not add upstream stages")
+    parser.add_argument("--list-stages", action="store_true", help="Print the stage graph and exit")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Stages run at once (1 runs them in order, with per-stage --profile spans)")
+    parser.add_argument("--metrics-file", help="Write request/write metrics in Prometheus text format "
+                                               "(e.g. into a node_exporter textfile collector directory)")
+    add_profile_arguments(parser)
     args = parser.parse_args()
-    
+
+    if args.list_stages:
+        checkpoint = Checkpoint.load() if args.retry_dead_letters else None
+        for stage in selected_stages(args, db=None, checkpoint=checkpoint):
+            print(f"{stage.name:<28} <- {', '.join(stage.deps) or '-'}")
+        return
+
+    if args.profile is not None and args.workers > 1:
+        # Spans and the stack sampler only follow the main thread
+        print("--profile: running stages one at a time (--workers 1)")
+        args.workers = 1
+
+    with profiled(args, "sync"):
+        run(args)
+
+
+def selected_stages(args, db: "Database", checkpoint: Checkpoint = None) -> List[Stage]:
+    stages = build_stages(db, args.full_sync or args.retry_dead_letters, checkpoint,
+                          args.history_pages, args.retry_dead_letters)
+    if args.retry_dead_letters:
+        return select_stages(stages, sorted({d["stage"] for d in checkpoint.dead_letters}), with_deps=False)
+    if args.stages:
+        return select_stages(stages, args.stages, with_deps=not args.no_deps)
+    return select_stages(stages, SOURCE_PATTERNS[args.source], with_deps=False)
+
+
+def run(args):
+    from database import Database
+    from ml.online_features import OnlineFeatureStore
+
     print(f"Starting data pipeline at {datetime.now().isoformat()}")
-    print(f"Mode: {'Full Sync' if args.full_sync else 'Regular Sync'}")
-    
-    db = Database()
-    
-    if args.source in ["all", "pandascore"]:
-        fetch_pandascore(db, full_sync=args.full_sync)
-    
-    if args.source in ["all", "abios"]:
-        fetch_abios(db, full_sync=args.full_sync)
-    
-    if args.source in ["all", "odds"]:
-        fetch_odds(db)
-    
+    mode = "Full Sync" if args.full_sync else "Dead-Letter Retry" if args.retry_dead_letters else "Regular Sync"
+    print(f"Mode: {mode}")
+
+    # Incremental player features, updated as player stats are ingested
+    feature_state = OnlineFeatureStore.load()
+    db = Database(feature_state=feature_state)
+
+    # Full syncs resume from (and record progress in) the local checkpoint
+    checkpoint = Checkpoint.load() if args.full_sync or args.retry_dead_letters else None
+    if args.retry_dead_letters and not checkpoint.dead_letters:
+        print("No dead-lettered pages to retry")
+        return
+
+    try:
+        stages = selected_stages(args, db, checkpoint)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(2)
+
+    if args.full_sync:
+        if checkpoint.in_progress and not args.restart:
+            stages, resumed = resume_stages(stages, checkpoint.stages)
+            pages = sum(len(p) for p in checkpoint.pages.values())
+            print(f"Resuming the full sync started {checkpoint.started_at}: "
+                  f"{len(resumed)} stages and {pages} history pages already done")
+        else:
+            checkpoint.start()
+
+    started = time.perf_counter()
+    timings = run_stages(stages, max_workers=args.workers, checkpoint=checkpoint if args.full_sync else None)
+    print_timings(timings, time.perf_counter() - started)
+
+    if args.full_sync:
+        if all(t["status"] == "success" for t in timings.values()):
+            checkpoint.clear()
+        else:
+            print(f"Full sync incomplete; checkpoint kept in {checkpoint.path} (rerun --full-sync to resume)")
+    if checkpoint is not None and checkpoint.dead_letters:
+        print(f"{len(checkpoint.dead_letters)} dead-lettered pages in {checkpoint.path} "
+              f"(retry with --retry-dead-letters)")
+
+    if feature_state.dirty:
+        feature_state.save()
+        print(f"Saved online feature state for {len(feature_state)} players")
+
+    if args.metrics_file:
+        METRICS.write_prometheus(args.metrics_file)
+        print(f"Wrote metrics to {args.metrics_file}")
+
     print(f"\nPipeline completed at {datetime.now().isoformat()}")
 
 
@@ -0,0 +1,402 @@
+"""
+Vectorized backtesting of prop predictions against historical odds
+
+Historical prop predictions, every stored odds snapshot (cs2_player_props)
+and match results are joined once into columnar arrays: one candidate row
+per odds snapshot, paired with the latest prediction made before that price
+was seen (no look-ahead), plus the outcome and the closing fair price of the
+market. A strategy is then a handful of array masks and sorts:
+
+    min_edge      required model probability minus implied probability
+    staking       "flat" (1 unit) or "kelly" (fraction of a 100-unit bankroll)
+    bookmakers    books allowed (None = all)
+    hours_before  bet with the latest price at least this long before kickoff
+    model_version predictions from one model version only (None = all)
+
+Reports ROI, closing-line value (CLV), drawdown and calibration. Strategy
+variants run in a process pool that receives the arrays once per worker.
+
+Usage:
+    python backtest.py --since 2025-01-01 --workers 8
+    python backtest.py --refresh --output results.csv
+"""
+import os
+import sys
+import time
+import argparse
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from pricing import devig
+
+sys.path.append('..')
+from database import Database
+
+
+CACHE_DIR = Path(__file__).parent / "cache"
+CACHE_PATH = CACHE_DIR / "backtest.npz"
+
+REFERENCE_BOOK = "pinnacle"
+# Kelly stakes are fractions of a fixed (non-compounding) bankroll in units
+KELLY_BANKROLL = 100.0
+MAX_KELLY_STAKE = 0.05
+CALIBRATION_BINS = 10
+
+# Matches per odds read (PostgREST filters travel in the URL)
+MATCH_CHUNK = 200
+
+DEFAULT_GRID = {
+    "min_edge": [0.02, 0.05, 0.08],
+    "staking": ["flat", "kelly"],
+    "bookmakers": [None, (REFERENCE_BOOK,)],
+    "hours_before": [0.0, 2.0, 12.0],
+}
+
+STRATEGY_DEFAULTS = {
+    "min_edge": 0.05,
+    "staking": "flat",
+    "kelly_fraction": 0.25,
+    "bookmakers": None,
+    "hours_before": 0.0,
+    "model_version": None,
+}
+
+# Market a price belongs to; odds snapshots are joined to predictions on it
+MARKET_KEY = ["match_id", "player_id", "prop_type", "line"]
+
+ARRAYS = (
+    "market", "book", "version", "created", "fetched", "hours", "kickoff",
+    "p_over", "over_odds", "under_odds", "close_over", "actual", "line",
+)
+
+# Shared by all tasks in a worker, set once by the pool initializer
+_DATA: Optional["BacktestData"] = None
+
+
+def _epoch(values) -> np.ndarray:
+    """Timestamps as float seconds since the epoch (NaN when missing)"""
+    stamps = pd.to_datetime(pd.Series(values), utc=True, errors="coerce")
+    seconds = (stamps - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+    return seconds.to_numpy(dtype=np.float64)
+
+
+class BacktestData:
+    """Columnar candidate bets: one row per pre-kickoff odds snapshot"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], bookmakers: List[str], versions: List[str]):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.bookmakers = list(bookmakers)
+        self.versions = list(versions)
+
+    def __len__(self) -> int:
+        return len(self.market)
+
+    # ==================== BUILD ====================
+    @classmethod
+    def build(
+        cls,
+        predictions: List[dict],
+        odds: List[dict],
+        stats: List[dict],
+        matches: List[dict]
+    ) -> "BacktestData":
+        """
+        Join prop predictions, prop odds snapshots, per-map stats and
+        finished matches (rows as returned by the Database stream methods)
+        """
+        preds = pd.DataFrame(predictions, columns=MARKET_KEY + ["predicted_value", "model_version", "created_at"])
+        snaps = pd.DataFrame(odds, columns=MARKET_KEY + ["bookmaker", "over_odds", "under_odds", "fetched_at"])
+        for frame in (preds, snaps):
+            frame["line"] = np.round(pd.to_numeric(frame["line"], errors="coerce").astype(np.float64), 2)
+        preds["created"] = _epoch(preds["created_at"])
+        snaps["fetched"] = _epoch(snaps["fetched_at"])
+
+        kickoff = pd.DataFrame(matches, columns=["id", "scheduled_at"]).rename(columns={"id": "match_id"})
+        kickoff["kickoff"] = _epoch(kickoff["scheduled_at"])
+        snaps = snaps.merge(kickoff[["match_id", "kickoff"]], on="match_id", how="inner")
+        snaps["hours"] = (snaps["kickoff"] - snaps["fetched"]) / 3600.0
+        # Pre-kickoff prices only
+        snaps = snaps[(snaps["hours"] >= 0) & snaps["line"].notna()]
+
+        # Match totals per player and stat, long format to join on prop_type
+        totals = pd.DataFrame(stats, columns=["match_id", "player_id", "kills", "deaths", "assists"])
+        totals = totals.groupby(["match_id", "player_id"], as_index=False)[["kills", "deaths", "assists"]].sum()
+        totals = totals.melt(["match_id", "player_id"], var_name="prop_type", value_name="actual")
+
+        # Closing price per market: last pre-kickoff snapshot per book, from
+        # the reference book where it priced the market
+        last = snaps.sort_values("fetched").drop_duplicates(MARKET_KEY + ["bookmaker"], keep="last")
+        is_reference = last["bookmaker"] == REFERENCE_BOOK
+        has_reference = is_reference.groupby([last[k] for k in MARKET_KEY]).transform("max")
+        last = last[~has_reference | is_reference]
+        fair = devig(last[["over_odds", "under_odds"]].to_numpy(dtype=np.float64), "multiplicative")
+        closing = last.assign(close_over=fair[:, 0]).groupby(MARKET_KEY, as_index=False)["close_over"].mean()
+
+        # Each price paired with the latest prediction made before it was seen
+        snaps = snaps.dropna(subset=["fetched"]).sort_values("fetched")
+        preds = preds.dropna(subset=["created", "line"]).sort_values("created")
+        joined = pd.merge_asof(
+            snaps, preds[MARKET_KEY + ["created", "predicted_value", "model_version"]],
+            left_on="fetched", right_on="created", by=MARKET_KEY, direction="backward"
+        ).dropna(subset=["predicted_value"])
+        joined = joined.merge(closing, on=MARKET_KEY, how="left")
+        joined = joined.merge(totals, on=["match_id", "player_id", "prop_type"], how="inner")
+
+        market_codes = joined.groupby(MARKET_KEY, sort=False).ngroup().to_numpy()
+        book_codes, bookmakers = pd.factorize(joined["bookmaker"])
+        version_codes, versions = pd.factorize(joined["model_version"])
+
+        arrays = {
+            "market": market_codes.astype(np.int64),
+            "book": book_codes.astype(np.int64),
+            "version": version_codes.astype(np.int64),
+            "created": joined["created"].to_numpy(dtype=np.float64),
+            "fetched": joined["fetched"].to_numpy(dtype=np.float64),
+            "hours": joined["hours"].to_numpy(dtype=np.float64),
+            "kickoff": joined["kickoff"].to_numpy(dtype=np.float64),
+            "p_over": pd.to_numeric(joined["predicted_value"]).to_numpy(dtype=np.float64),
+            "over_odds": pd.to_numeric(joined["over_odds"], errors="coerce").to_numpy(dtype=np.float64),
+            "under_odds": pd.to_numeric(joined["under_odds"], errors="coerce").to_numpy(dtype=np.float64),
+            "close_over": joined["close_over"].to_numpy(dtype=np.float64),
+            "actual": joined["actual"].to_numpy(dtype=np.float64),
+            "line": joined["line"].to_numpy(dtype=np.float64),
+        }
+        return cls(arrays, list(bookmakers), list(versions))
+
+    @classmethod
+    def from_database(cls, db: Database, since: str = None, until: str = None) -> "BacktestData":
+        """Read predictions, the odds history of their matches, results and kickoffs"""
+        print("Loading predictions...")
+        predictions = list(db.get_prop_predictions(since=since, until=until))
+        match_ids = sorted({p["match_id"] for p in predictions if p.get("match_id")})
+        print(f"  {len(predictions)} predictions over {len(match_ids)} matches")
+
+        print("Loading odds history and results...")
+        odds = []
+        for i in range(0, len(match_ids), MATCH_CHUNK):
+            odds.extend(db.get_latest_player_props(match_ids[i:i + MATCH_CHUNK]))
+        stats = list(db.get_player_match_stats(match_ids))
+        wanted = set(match_ids)
+        matches = [m for m in db.get_finished_matches(since=since) if m["id"] in wanted]
+        print(f"  {len(odds)} odds snapshots, {len(matches)} finished matches")
+
+        return cls.build(predictions, odds, stats, matches)
+
+    # ==================== CACHE ====================
+    def save(self, path: Path = CACHE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            bookmakers=np.array(self.bookmakers, dtype=str),
+            versions=np.array(self.versions, dtype=str),
+            **{name: getattr(self, name) for name in ARRAYS}
+        )
+
+    @classmethod
+    def load(cls, path: Path = CACHE_PATH) -> "BacktestData":
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in ARRAYS}
+            return cls(arrays, data["bookmakers"].tolist(), data["versions"].tolist())
+
+
+# ==================== REPLAY ====================
+def _first_per_group(groups: np.ndarray, sort_key: np.ndarray) -> np.ndarray:
+    """Position of the row with the smallest sort_key in each group"""
+    order = np.lexsort((sort_key, groups))
+    _, first = np.unique(groups[order], return_index=True)
+    return order[first]
+
+
+def replay(data: BacktestData, strategy: Dict) -> Dict:
+    """Bets a strategy would have placed, and their results"""
+    strategy = {**STRATEGY_DEFAULTS, **strategy}
+
+    mask = data.hours >= strategy["hours_before"]
+    if strategy["bookmakers"]:
+        allowed = [data.bookmakers.index(b) for b in strategy["bookmakers"] if b in data.bookmakers]
+        mask &= np.isin(data.book, allowed)
+    if strategy["model_version"]:
+        version = data.versions.index(strategy["model_version"]) if strategy["model_version"] in data.versions else -1
+        mask &= data.version == version
+    rows = np.flatnonzero(mask)
+
+    # Latest eligible price per (market, book)
+    market_book = data.market[rows] * (len(data.bookmakers) + 1) + data.book[rows]
+    rows = rows[_first_per_group(market_book, -data.fetched[rows])]
+
+    # Both sides of every price, then the best price per (market, side)
+    n = len(rows)
+    side_over = np.r_[np.ones(n, dtype=bool), np.zeros(n, dtype=bool)]
+    rows = np.r_[rows, rows]
+    odds = np.where(side_over, data.over_odds[rows], data.under_odds[rows])
+    valid = odds > 1.0
+    rows, side_over, odds = rows[valid], side_over[valid], odds[valid]
+    best = _first_per_group(data.market[rows] * 2 + side_over, -odds)
+    rows, side_over, odds = rows[best], side_over[best], odds[best]
+
+    prob = np.where(side_over, data.p_over[rows], 1.0 - data.p_over[rows])
+    edge = prob - 1.0 / odds
+    bet = edge >= strategy["min_edge"]
+    rows, side_over, odds, prob, edge = rows[bet], side_over[bet], odds[bet], prob[bet], edge[bet]
+
+    if strategy["staking"] == "kelly":
+        kelly = (prob * odds - 1.0) / (odds - 1.0)
+        stake = KELLY_BANKROLL * np.clip(strategy["kelly_fraction"] * kelly, 0.0, MAX_KELLY_STAKE)
+    else:
+        stake = np.ones(len(rows))
+
+    actual, line = data.actual[rows], data.line[rows]
+    push = actual == line
+    won = np.where(side_over, actual > line, actual < line)
+    profit = np.where(won, stake * (odds - 1.0), np.where(push, 0.0, -stake))
+
+    # Expected value of the price taken at the closing fair probability
+    close = np.where(side_over, data.close_over[rows], 1.0 - data.close_over[rows])
+    clv = odds * close - 1.0
+
+    order = np.argsort(data.kickoff[rows], kind="stable")
+    return {
+        "stake": stake[order], "profit": profit[order], "won": won[order], "push": push[order],
+        "edge": edge[order], "clv": clv[order], "odds": odds[order],
+    }
+
+
+def summarize(bets: Dict) -> Dict:
+    """ROI, hit rate, CLV and drawdown for replayed bets"""
+    staked = float(bets["stake"].sum())
+    cumulative = np.cumsum(bets["profit"])
+    drawdown = np.maximum.accumulate(np.r_[0.0, cumulative])[1:] - cumulative if len(cumulative) else np.zeros(1)
+    decided = ~bets["push"]
+    clv = bets["clv"][~np.isnan(bets["clv"])]
+
+    return {
+        "bets": int(len(bets["stake"])),
+        "staked": staked,
+        "profit": float(cumulative[-1]) if len(cumulative) else 0.0,
+        "roi": float(cumulative[-1] / staked) if staked else 0.0,
+        "hit_rate": float(bets["won"][decided].mean()) if decided.any() else float("nan"),
+        "mean_odds": float(bets["odds"].mean()) if len(bets["odds"]) else float("nan"),
+        "mean_edge": float(bets["edge"].mean()) if len(bets["edge"]) else float("nan"),
+        "mean_clv": float(clv.mean()) if len(clv) else float("nan"),
+        "beat_close_rate": float((clv > 0).mean()) if len(clv) else float("nan"),
+        "max_drawdown": float(drawdown.max()),
+    }
+
+
+def calibration(data: BacktestData, model_version: str = None, bins: int = CALIBRATION_BINS) -> Dict:
+    """Brier score, log loss and a reliability table of over probabilities"""
+    # Each stored prediction once (it pairs with every later snapshot);
+    # pushes carry no label
+    _, rows = np.unique(np.stack([data.market, data.created]), axis=1, return_index=True)
+    if model_version:
+        version = data.versions.index(model_version) if model_version in data.versions else -1
+        rows = rows[data.version[rows] == version]
+    rows = rows[data.actual[rows] != data.line[rows]]
+
+    p = np.clip(data.p_over[rows], 1e-6, 1 - 1e-6)
+    y = (data.actual[rows] > data.line[rows]).astype(np.float64)
+    if not len(p):
+        return {"predictions": 0}
+
+    bucket = np.minimum((p * bins).astype(np.int64), bins - 1)
+    counts = np.bincount(bucket, minlength=bins)
+    seen = counts > 0
+    mean_p = np.bincount(bucket, weights=p, minlength=bins)[seen] / counts[seen]
+    rate = np.bincount(bucket, weights=y, minlength=bins)[seen] / counts[seen]
+
+    return {
+        "predictions": int(len(p)),
+        "brier": float(np.mean((p - y) ** 2)),
+        "log_loss": float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))),
+        # Expected calibration error
+        "ece": float(np.sum(counts[seen] * np.abs(mean_p - rate)) / len(p)),
+        "reliability": [
+            {"bin": int(b), "count": int(c), "mean_prob": float(m), "actual_rate": float(r)}
+            for b, c, m, r in zip(np.flatnonzero(seen), counts[seen], mean_p, rate)
+        ],
+    }
+
+
+# ==================== STRATEGY SWEEP ====================
+def strategy_grid(grid: Dict[str, List] = None, **fixed) -> List[Dict]:
+    """Every combination of the grid's values, plus fixed settings"""
+    grid = grid or DEFAULT_GRID
+    keys = list(grid)
+    return [{**fixed, **dict(zip(keys, values))} for values in product(*(grid[k] for k in keys))]
+
+
+def _init_worker(data: BacktestData):
+    """Pool initializer: receive the arrays once"""
+    global _DATA
+    _DATA = data
+
+
+def _evaluate(strategy: Dict) -> Dict:
+    return {**strategy, **summarize(replay(_DATA, strategy))}
+
+
+def run_backtests(data: BacktestData, strategies: List[Dict], max_workers: int = None) -> pd.DataFrame:
+    """Summaries for many strategies, in a process pool when there are several"""
+    workers = min(max_workers or os.cpu_count() or 1, len(strategies))
+    if workers <= 1:
+        results = [{**s, **summarize(replay(data, s))} for s in strategies]
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(data,)
+        ) as pool:
+            chunk = max(len(strategies) // (workers * 4), 1)
+            results = list(pool.map(_evaluate, strategies, chunksize=chunk))
+    return pd.DataFrame(results).sort_values("roi", ascending=False, kind="stable")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest prop strategies against historical odds")
+    parser.add_argument("--since", help="Predictions created on or after (ISO date)")
+    parser.add_argument("--until", help="Predictions created before (ISO date)")
+    parser.add_argument("--model-version", help="Only this model version's predictions")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--refresh", action="store_true", help="Rebuild the cached arrays")
+    parser.add_argument("--output", help="Write the strategy table to this CSV")
+    args = parser.parse_args()
+
+    if args.refresh or not CACHE_PATH.exists() or args.since or args.until:
+        data = BacktestData.from_database(Database(), args.since, args.until)
+        data.save()
+    else:
+        data = BacktestData.load()
+    print(f"{len(data)} candidate prices across {len(data.bookmakers)} bookmakers")
+
+    started = time.perf_counter()
+    strategies = strategy_grid(model_version=args.model_version)
+    results = run_backtests(data, strategies, args.workers)
+    print(f"Ran {len(strategies)} strategies in {time.perf_counter() - started:.2f}s\n")
+
+    columns = ["min_edge", "staking", "bookmakers", "hours_before", "bets", "roi",
+               "mean_clv", "beat_close_rate", "max_drawdown"]
+    print(results[columns].head(10).to_string(index=False))
+
+    cal = calibration(data, args.model_version)
+    if cal["predictions"]:
+        print(f"\nCalibration over {cal['predictions']} predictions: "
+              f"Brier {cal['brier']:.4f}, log loss {cal['log_loss']:.4f}, ECE {cal['ece']:.4f}")
+        for row in cal["reliability"]:
+            print(f"  {row['mean_prob']:.2f} predicted vs {row['actual_rate']:.2f} actual ({row['count']})")
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
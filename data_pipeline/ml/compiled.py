@@ -0,0 +1,346 @@
+"""
+Compiled tree-ensemble export for fast, dependency-free inference
+
+A trained PlayerKillsModel (XGBoost or LightGBM booster plus StandardScaler)
+is flattened into plain node arrays - feature, threshold, children, default
+direction, leaf value - and saved either as a single .npz or as a directory
+of .npy files that can be memory-mapped. `CompiledModel` scores batches with
+NumPy alone and reproduces the original model's probabilities. Rows are
+scored in cache-sized blocks, stepping every (row, tree) pair one level at
+a time; trees are ordered deepest first, so each level only steps the
+trees that are still descending.
+
+Throughput is bounded by NumPy's per-level gathers, not by Python: about
+350 rows/ms for 100 depth-5 XGBoost trees and about 50 rows/ms for 200
+leaf-wise LightGBM trees (31 leaves, up to depth 18). That is well short
+of thousands of rows per millisecond, which would need a compiled
+evaluator (the boosters' own predict, or native code).
+
+Only compile_model() touches the training objects; loading and scoring need
+nothing beyond NumPy.
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+FORMAT_VERSION = 3
+
+# Rows scored per block; keeps the (rows x trees) node arrays cache-resident
+BLOCK_ROWS = 256
+
+# Missing-value handling per node (LightGBM `missing_type`)
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+
+# LightGBM's zero threshold for MISSING_ZERO splits
+K_ZERO_THRESHOLD = 1e-35
+
+
+class _Nodes:
+    """Accumulates flattened nodes across trees"""
+
+    def __init__(self):
+        self.feature: List[int] = []
+        self.threshold: List[float] = []
+        self.left: List[int] = []
+        self.right: List[int] = []
+        self.default_left: List[bool] = []
+        self.missing: List[int] = []
+        self.value: List[float] = []
+        self.roots: List[int] = []
+
+    def add(self, feature=-1, threshold=0.0, default_left=False, missing=MISSING_NAN, value=0.0) -> int:
+        self.feature.append(feature)
+        self.threshold.append(threshold)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.default_left.append(default_left)
+        self.missing.append(missing)
+        self.value.append(value)
+        return len(self.feature) - 1
+
+
+# Inverse link per supported objective
+XGBOOST_LINKS = {"binary:logistic": "logistic", "count:poisson": "exp"}
+
+
+def _compile_xgboost(booster, nodes: _Nodes) -> Dict:
+    """Flatten an XGBoost booster (binary:logistic or count:poisson)"""
+    config = json.loads(booster.save_raw("json"))
+    learner = config["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in XGBOOST_LINKS:
+        raise ValueError(f"Unsupported objective: {objective}")
+    link = XGBOOST_LINKS[objective]
+
+    base_score = float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+    trees = learner["gradient_booster"]["model"]["trees"]
+
+    # Honour early stopping the same way predict_proba does
+    best_iteration = booster.attr("best_iteration")
+    if best_iteration is not None:
+        indptr = learner["gradient_booster"]["model"]["iteration_indptr"]
+        trees = trees[:indptr[int(best_iteration) + 1]]
+
+    for tree in trees:
+        offset = len(nodes.feature)
+        nodes.roots.append(offset)
+        left, right = tree["left_children"], tree["right_children"]
+        for i in range(len(left)):
+            is_leaf = left[i] == -1
+            node = nodes.add(
+                feature=-1 if is_leaf else tree["split_indices"][i],
+                # XGBoost compares float32 inputs against float32 splits (x < split)
+                threshold=float(np.float32(tree["split_conditions"][i])),
+                default_left=bool(tree["default_left"][i]),
+                value=tree["split_conditions"][i] if is_leaf else 0.0,
+            )
+            if not is_leaf:
+                nodes.left[node] = offset + left[i]
+                nodes.right[node] = offset + right[i]
+
+    # base_score is stored in output space
+    if link == "exp":
+        base_margin = float(np.log(base_score))
+    else:
+        base_margin = float(np.log(base_score / (1.0 - base_score)))
+    return {
+        "base_margin": base_margin,
+        "sigmoid_scale": 1.0,
+        "input_dtype": "float32",
+        "link": link,
+    }
+
+
+def _compile_lightgbm(booster, nodes: _Nodes) -> Dict:
+    """Flatten a LightGBM booster (binary objective)"""
+    dump = booster.dump_model()
+    objective = dump.get("objective", "")
+    if not objective.startswith("binary"):
+        raise ValueError(f"Unsupported objective: {objective}")
+    sigmoid = 1.0
+    for part in objective.split():
+        if part.startswith("sigmoid:"):
+            sigmoid = float(part.split(":")[1])
+
+    missing_types = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+    def walk(tree: dict) -> int:
+        if "leaf_value" in tree:
+            return nodes.add(value=tree["leaf_value"])
+        if tree.get("decision_type", "<=") != "<=":
+            raise ValueError("Categorical splits are not supported")
+        node = nodes.add(
+            feature=tree["split_feature"],
+            # LightGBM tests x <= threshold in double; x < nextafter(threshold) is equivalent
+            threshold=float(np.nextafter(tree["threshold"], np.inf)),
+            default_left=bool(tree.get("default_left", True)),
+            missing=missing_types.get(tree.get("missing_type", "None"), MISSING_NONE),
+        )
+        nodes.left[node] = walk(tree["left_child"])
+        nodes.right[node] = walk(tree["right_child"])
+        return node
+
+    for info in dump["tree_info"]:
+        nodes.roots.append(walk(info["tree_structure"]))
+
+    return {"base_margin": 0.0, "sigmoid_scale": sigmoid, "input_dtype": "float64", "link": "logistic"}
+
+
+def compile_model(model) -> "CompiledModel":
+    """
+    Compile a trained PlayerKillsModel (or anything with .model, .scaler,
+    .feature_columns and .version) into a CompiledModel. Values from the
+    model's optional export_meta() become attributes of the compiled model.
+    """
+    estimator = model.model
+    nodes = _Nodes()
+    if hasattr(estimator, "get_booster"):
+        params = _compile_xgboost(estimator.get_booster(), nodes)
+    elif hasattr(estimator, "booster_"):
+        params = _compile_lightgbm(estimator.booster_, nodes)
+    else:
+        raise TypeError(f"Cannot compile {type(estimator).__name__}")
+
+    # Traversal tables: leaves loop back to themselves so every row can take
+    # the same number of steps; children[2 * node + go_right]
+    feature = np.array(nodes.feature, dtype=np.int32)
+    leaf = feature < 0
+    index = np.arange(len(feature), dtype=np.int32)
+    left = np.where(leaf, index, np.array(nodes.left, dtype=np.int32))
+    right = np.where(leaf, index, np.array(nodes.right, dtype=np.int32))
+    missing = np.array(nodes.missing, dtype=np.int8)
+
+    arrays = {
+        "feature": feature,
+        "split_feature": np.where(leaf, 0, feature).astype(np.int32),
+        "threshold": np.array(nodes.threshold, dtype=np.float64),
+        "children": np.stack([left, right], axis=1).ravel(),
+        "default_left": np.array(nodes.default_left, dtype=bool),
+        "missing": missing,
+        "value": np.array(nodes.value, dtype=np.float64),
+        "roots": np.array(nodes.roots, dtype=np.int32),
+        "scaler_mean": np.asarray(model.scaler.mean_, dtype=np.float64),
+        "scaler_scale": np.asarray(model.scaler.scale_, dtype=np.float64),
+    }
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "version": model.version,
+        "feature_columns": list(model.feature_columns),
+        "has_zero_missing": bool(np.any((missing == MISSING_ZERO) & ~leaf)),
+        "extra": model.export_meta() if hasattr(model, "export_meta") else {},
+        **params,
+    }
+    return CompiledModel(arrays, meta)
+
+
+class ArrayScaler:
+    """StandardScaler stand-in backed by two arrays"""
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X) -> np.ndarray:
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+class CompiledModel:
+    """
+    Array-backed tree ensemble with the same predict() interface as
+    PlayerKillsModel (including a `.scaler` with transform())
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict):
+        self.arrays = arrays
+        self.meta = meta
+        self.version = meta["version"]
+        self.feature_columns = meta["feature_columns"]
+        self.scaler = ArrayScaler(arrays["scaler_mean"], arrays["scaler_scale"])
+        for name in ("threshold", "default_left", "missing", "value"):
+            setattr(self, f"_{name}", arrays[name])
+        # Index tables as intp, so gathers need no conversion per level
+        self._split_feature = np.asarray(arrays["split_feature"], dtype=np.intp)
+        self._children = np.asarray(arrays["children"], dtype=np.intp)
+        self._roots, self._level_trees = self._tree_levels(arrays["feature"], np.asarray(arrays["roots"], dtype=np.intp))
+        self._has_zero_missing = meta["has_zero_missing"]
+        self._base_margin = meta["base_margin"]
+        self._sigmoid_scale = meta["sigmoid_scale"]
+        self._input_dtype = np.dtype(meta["input_dtype"])
+        self._link = meta.get("link", "logistic")
+        for name, value in meta.get("extra", {}).items():
+            setattr(self, name, value)
+
+    def _tree_levels(self, feature: np.ndarray, roots: np.ndarray):
+        """
+        Roots ordered deepest tree first, and per level the number of trees
+        (a prefix of that order) that still have splits at that level
+        """
+        depth = np.zeros(len(roots), dtype=np.int64)
+        frontier, tree = roots, np.arange(len(roots))
+        level = 0
+        while len(frontier):
+            split = feature[frontier] >= 0
+            frontier, tree = frontier[split], tree[split]
+            level += 1
+            depth[tree] = level
+            frontier = self._children[2 * frontier[:, None] + np.array([0, 1])].ravel()
+            tree = np.repeat(tree, 2)
+        order = np.argsort(-depth, kind="stable")
+        level_trees = [int(np.count_nonzero(depth > d)) for d in range(int(depth.max(initial=0)))]
+        return roots[order], level_trees
+
+    # ==================== SCORING ====================
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        """Raw margin for already-scaled rows"""
+        X = np.ascontiguousarray(np.asarray(X).astype(self._input_dtype), dtype=np.float64)
+        margin = np.empty(len(X))
+        for start in range(0, len(X), BLOCK_ROWS):
+            margin[start:start + BLOCK_ROWS] = self._block_margin(X[start:start + BLOCK_ROWS])
+        return margin + self._base_margin
+
+    def _block_margin(self, X: np.ndarray) -> np.ndarray:
+        """Summed leaf values for one block of rows"""
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_offset = (np.arange(n_rows, dtype=np.intp) * n_features)[:, None]
+        node = np.empty((n_rows, len(self._roots)), dtype=np.intp)
+        node[:] = self._roots
+        # Exact missing-value semantics only when they can matter
+        slow = self._has_zero_missing or bool(np.isnan(flat).any())
+
+        # Rows that reach a leaf early stay on it (leaves are their own children)
+        for trees in self._level_trees:
+            current = node[:, :trees]
+            x = flat[row_offset + self._split_feature[current]]
+            if slow:
+                go_right = self._go_right_missing(current, x)
+            else:
+                go_right = x >= self._threshold[current]
+            node[:, :trees] = self._children[2 * current + go_right]
+
+        return self._value[node].sum(axis=1)
+
+    def _go_right_missing(self, node: np.ndarray, x: np.ndarray) -> np.ndarray:
+        """Split direction with per-node missing-value handling"""
+        missing = self._missing[node]
+        is_nan = np.isnan(x)
+        is_missing = np.where(
+            missing == MISSING_ZERO, is_nan | (np.abs(x) <= K_ZERO_THRESHOLD),
+            np.where(missing == MISSING_NAN, is_nan, False)
+        )
+        # MISSING_NONE: NaN is treated as zero
+        x = np.where(is_nan & (missing == MISSING_NONE), 0.0, x)
+        return np.where(is_missing, ~self._default_left[node], x >= self._threshold[node])
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probability of the positive class (over) for scaled rows"""
+        if self._link != "logistic":
+            raise TypeError("predict_proba needs a classifier export; use predict_mean")
+        return 1.0 / (1.0 + np.exp(-self._sigmoid_scale * self.decision_function(X)))
+
+    def predict_mean(self, X: np.ndarray) -> np.ndarray:
+        """Expected value for scaled rows (the mean count for Poisson exports)"""
+        if self._link == "exp":
+            return np.exp(self.decision_function(X))
+        return self.predict_proba(X)
+
+    def predict(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return predictions and probabilities (same as PlayerKillsModel.predict)"""
+        probas = self.predict_proba(X)
+        return (probas > 0.5).astype(np.int64), probas
+
+    # ==================== PERSISTENCE ====================
+    def save(self, path: Path):
+        """Write a single .npz, or a directory of .npy files for any other path"""
+        path = Path(path)
+        if path.suffix == ".npz":
+            path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(path, meta=np.array(json.dumps(self.meta)), **self.arrays)
+            return
+        path.mkdir(parents=True, exist_ok=True)
+        for name, array in self.arrays.items():
+            np.save(path / f"{name}.npy", np.asarray(array))
+        with open(path / "meta.json", "w") as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path: Path, mmap_mode: Optional[str] = None) -> "CompiledModel":
+        """
+        Load an export. Directory exports honour `mmap_mode` ("r" maps the
+        node arrays instead of reading them into memory).
+        """
+        path = Path(path)
+        if path.is_dir():
+            with open(path / "meta.json") as f:
+                meta = json.load(f)
+            arrays = {p.stem: np.load(p, mmap_mode=mmap_mode) for p in path.glob("*.npy")}
+        else:
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                arrays = {name: data[name] for name in data.files if name != "meta"}
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled model format: {meta.get('format_version')}")
+        return cls(arrays, meta)
@@ -4,24 +4,51 @@ Feature engineering for CS2 ML models
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+from ratings import map_win_probability, series_win_probability, parse_timestamp
+from online_features import ewma_weights
 
 
 class FeatureEngineer:
     """Generate features for CS2 predictions"""
     
-    def __init__(self, db):
+    def __init__(self, db, online_store=None, stats_cache=None, ratings=None, team_index=None):
         self.db = db
+        # Optional OnlineFeatureStore; when set, features are read from the
+        # incrementally maintained state instead of recomputed from history
+        self.online_store = online_store
+        # Optional PlayerStatsCache bulk-loaded for a slate of players
+        self.stats_cache = stats_cache
+        # Optional TeamRatingEngine for match-level features
+        self.ratings = ratings
+        # Optional TeamStrengthIndex (head-to-head, form, map pool)
+        self.team_index = team_index
     
     def get_player_features(self, player_id: str, as_of_date: datetime = None) -> Dict:
         """
         Generate features for a player's predicted performance
         """
+        # A slate's bulk cache was read for this run, so it wins over online
+        # state seeded up to max_seed_age ago
+        if self.stats_cache is not None and player_id in self.stats_cache:
+            return self.stats_cache.get_player_features(player_id)
+        
+        if self.online_store is not None and self.online_store.is_seeded(player_id):
+            return self.online_store.get_features(player_id)
+        
         stats = self.db.get_player_stats_for_ml(player_id, limit=30)
         
         if not stats:
             return None
         
+        if self.online_store is not None:
+            # Seed from the full history (replacing rows ingested before the
+            # player was first read); later rows arrive through
+            # Database.insert_player_stats until the seed expires
+            self.online_store.seed(player_id, stats)
+            return self.online_store.get_features(player_id)
+        
         df = pd.DataFrame(stats)
         
         # Basic stats
@@ -30,20 +57,29 @@ class FeatureEngineer:
             # Recent form (last 5 matches)
             "last5_avg_kills": df.head(5)["kills"].mean(),
             "last5_avg_deaths": df.head(5)["deaths"].mean(),
+            "last5_avg_assists": df.head(5)["assists"].mean() if "assists" in df else None,
             "last5_avg_rating": df.head(5)["rating"].mean() if "rating" in df else None,
             "last5_avg_adr": df.head(5)["adr"].mean() if "adr" in df else None,
             
             # Medium term (last 10 matches)
             "last10_avg_kills": df.head(10)["kills"].mean(),
             "last10_avg_deaths": df.head(10)["deaths"].mean(),
+            "last10_avg_assists": df.head(10)["assists"].mean() if "assists" in df else None,
             "last10_avg_rating": df.head(10)["rating"].mean() if "rating" in df else None,
             
             # Volatility (standard deviation)
             "kills_std": df.head(10)["kills"].std(),
+            "deaths_std": df.head(10)["deaths"].std(),
+            "assists_std": df.head(10)["assists"].std() if "assists" in df else None,
             "rating_std": df.head(10)["rating"].std() if "rating" in df else None,
             
             # Trend (are they improving?)
             "kills_trend": self._calculate_trend(df.head(10)["kills"]),
+            "deaths_trend": self._calculate_trend(df.head(10)["deaths"]),
+            "assists_trend": self._calculate_trend(df.head(10)["assists"]) if "assists" in df else 0,
+            
+            # Smoothed form (fast and slow EWMA over the last 30 maps)
+            **self._calculate_ewma(df["kills"]),
             
             # Consistency
             "matches_count": len(df),
@@ -58,9 +94,17 @@ class FeatureEngineer:
         
         return features
     
-    def get_match_features(self, team1_id: str, team2_id: str, match_id: str = None) -> Dict:
+    def get_match_features(
+        self, 
+        team1_id: str, 
+        team2_id: str, 
+        match_id: str = None,
+        best_of: int = None,
+        as_of: datetime = None
+    ) -> Dict:
         """
         Generate features for match prediction
+        as_of: use ratings and index results from before this time (for training rows)
         """
         # Get players for each team
         # This would need team roster info
@@ -69,13 +113,36 @@ class FeatureEngineer:
             "match_id": match_id,
             "team1_id": team1_id,
             "team2_id": team2_id,
-            # Team-level features would go here
-            # - Team win rate
-            # - Head-to-head record
-            # - Recent form
-            # - Map pool strength
+            "best_of": best_of or 1,
         }
         
+        if self.ratings is not None:
+            if as_of is not None:
+                r1 = self.ratings.rating_at(team1_id, as_of)
+                r2 = self.ratings.rating_at(team2_id, as_of)
+            else:
+                r1 = self.ratings.rating(team1_id)
+                r2 = self.ratings.rating(team2_id)
+            p_map = float(map_win_probability(r1 - r2))
+            features.update({
+                "team1_rating": r1,
+                "team2_rating": r2,
+                "rating_diff": r1 - r2,
+                "elo_win_prob": float(series_win_probability(p_map, best_of or 1)),
+                "team1_matches": self.ratings.matches_before(team1_id, as_of),
+                "team2_matches": self.ratings.matches_before(team2_id, as_of),
+            })
+        
+        if self.team_index is not None:
+            now = (as_of or datetime.now(timezone.utc))
+            if isinstance(now, datetime):
+                now = now.timestamp()
+            elif isinstance(now, str):
+                now = parse_timestamp(now)
+            features.update(self.team_index.match_features(
+                team1_id, team2_id, now, as_of=now if as_of is not None else None
+            ))
+        
         return features
     
     def get_player_prop_features(
@@ -102,6 +169,18 @@ class FeatureEngineer:
         }
         
         # Calculate historical over/under rate
+        if self.stats_cache is not None and player_id in self.stats_cache:
+            over_rate = self.stats_cache.over_rate(player_id, prop_type, line, n=20)
+            if over_rate is not None:
+                features["historical_over_rate"] = over_rate
+            return features
+        
+        if self.online_store is not None and self.online_store.is_seeded(player_id):
+            over_rate = self.online_store.over_rate(player_id, prop_type, line, n=20)
+            if over_rate is not None:
+                features["historical_over_rate"] = over_rate
+            return features
+        
         stats = self.db.get_player_stats_for_ml(player_id, limit=20)
         if stats and prop_type in pd.DataFrame(stats).columns:
             df = pd.DataFrame(stats)
@@ -109,6 +188,15 @@ class FeatureEngineer:
         
         return features
     
+    def _calculate_ewma(self, series: pd.Series) -> Dict:
+        """kills_ewma and kills_ewma_trend (fast minus slow) of a newest-first series"""
+        values = series.to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        weights = ewma_weights(np.arange(len(values))) * valid
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fast, slow = weights @ np.where(valid, values, 0.0) / weights.sum(axis=1)
+        return {"kills_ewma": fast, "kills_ewma_trend": fast - slow}
+    
     def _calculate_trend(self, series: pd.Series) -> float:
         """
         Calculate linear trend coefficient
@@ -0,0 +1,71 @@
+"""
+Prediction fingerprints for incremental re-prediction
+
+A fingerprint is "<market>:<content>". The market part identifies one prop
+market (match, player, prop type, bookmaker, line), and the content part hashes
+everything a stored prediction depends on: model version, model feature
+vector, line and odds. A prop whose fingerprint equals the latest stored
+one for its market can reuse that prediction instead of being re-scored and
+re-inserted.
+"""
+import json
+import hashlib
+from typing import Dict, List, Optional
+
+# Feature values are rounded before hashing so float noise doesn't count as a change
+FEATURE_DECIMALS = 6
+
+HASH_LENGTH = 16
+
+
+def _digest(payload) -> str:
+    data = json.dumps(payload, separators=(",", ":"), default=str)
+    return hashlib.sha1(data.encode()).hexdigest()[:HASH_LENGTH]
+
+
+def _number(value) -> Optional[float]:
+    if value is None:
+        return None
+    value = float(value)
+    return None if value != value else round(value, FEATURE_DECIMALS)
+
+
+def market_key(prop: Dict) -> str:
+    """Stable key for a prop market, independent of price (alternate lines are separate markets)"""
+    return _digest([
+        prop.get("match_id"), prop.get("player_id"),
+        prop.get("prop_type"), prop.get("bookmaker"),
+        _number(prop.get("line")),
+    ])
+
+
+def prediction_fingerprint(
+    prop: Dict,
+    features: Dict,
+    feature_columns: List[str],
+    model_version: str
+) -> str:
+    """Fingerprint of a prop prediction's inputs"""
+    content = _digest([
+        model_version,
+        # Missing features are scored as 0, so hash them that way too
+        [_number(features.get(col)) or 0.0 for col in feature_columns],
+        _number(prop.get("line")),
+        _number(prop.get("over_odds")),
+        _number(prop.get("under_odds")),
+    ])
+    return f"{market_key(prop)}:{content}"
+
+
+def latest_by_market(rows) -> Dict[str, Dict]:
+    """
+    Latest stored prediction per market from rows ordered newest first
+    (each with a `fingerprint`)
+    """
+    latest = {}
+    for row in rows:
+        fingerprint = row.get("fingerprint")
+        if not fingerprint:
+            continue
+        latest.setdefault(fingerprint.split(":", 1)[0], row)
+    return latest
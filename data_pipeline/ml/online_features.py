@@ -0,0 +1,398 @@
+"""
+Incremental (online) player feature state
+
+Keeps a small fixed-size state per player that is updated in O(1) whenever a
+new map row is ingested, so rolling features never need a recompute over the
+player's history.
+"""
+import hashlib
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# Columns tracked per map row (order matters for the persisted arrays)
+STAT_COLUMNS = ("kills", "deaths", "assists", "adr", "rating", "headshot_percentage")
+COL = {name: i for i, name in enumerate(STAT_COLUMNS)}
+
+# Rows of raw history kept per player (matches FeatureEngineer's limit=30)
+HISTORY_SIZE = 30
+
+# Rolling windows maintained incrementally
+WINDOWS = (5, 10)
+
+# EWMA smoothing factors for the kills trend, applied over the held history
+EWMA_FAST = 0.3
+EWMA_SLOW = 0.1
+EWMA_DECAY = 1 - np.array([EWMA_FAST, EWMA_SLOW])
+
+# Seconds seeded state is trusted before readers reseed it from the DB. New
+# rows only reach the store through Database.insert_player_stats, so stats
+# written by any other process would otherwise never show up
+SEED_MAX_AGE = 15 * 60
+
+DEFAULT_STATE_PATH = Path(__file__).parent / "state" / "player_features.npz"
+
+
+def _row_key(key: str) -> int:
+    """Hash a row key (match_id:map_name) to a compact int64"""
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class _WindowStats:
+    """
+    Running mean/variance over the last `size` rows for every stat column.
+
+    Uses Welford updates with removal, so pushing a row is O(1) regardless of
+    window size. Missing values (NaN) are skipped like pandas does.
+    """
+
+    __slots__ = ("size", "n", "mean", "m2", "rows", "sy", "sxy")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        ncols = len(STAT_COLUMNS)
+        self.n = np.zeros(ncols)
+        self.mean = np.zeros(ncols)
+        self.m2 = np.zeros(ncols)
+        self.rows = 0
+        # Linear-regression sums for the trends (x = 0 for oldest row)
+        self.sy = np.zeros(ncols)
+        self.sxy = np.zeros(ncols)
+
+    def push(self, row: np.ndarray, evicted: Optional[np.ndarray]):
+        """Add a row, removing `evicted` (the row leaving the window) if given"""
+        filled = np.nan_to_num(row)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if evicted is not None:
+                mask = ~np.isnan(evicted)
+                n_new = self.n - mask
+                mean_new = np.where(n_new > 0, (self.n * self.mean - evicted) / n_new, 0.0)
+                m2_new = np.where(n_new > 0, self.m2 - (evicted - self.mean) * (evicted - mean_new), 0.0)
+                self.mean = np.where(mask, mean_new, self.mean)
+                self.m2 = np.where(mask, np.maximum(m2_new, 0.0), self.m2)
+                self.n = n_new
+
+                self.sy = self.sy - np.nan_to_num(evicted)
+                self.sxy = self.sxy - self.sy
+                self.rows -= 1
+
+            mask = ~np.isnan(row)
+            n_new = self.n + mask
+            delta = row - self.mean
+            mean_new = self.mean + delta / n_new
+            self.m2 = np.where(mask, self.m2 + delta * (row - mean_new), self.m2)
+            self.mean = np.where(mask, mean_new, self.mean)
+            self.n = n_new
+
+        self.sxy = self.sxy + self.rows * filled
+        self.sy = self.sy + filled
+        self.rows += 1
+
+    def avg(self, col: str) -> float:
+        i = COL[col]
+        return float(self.mean[i]) if self.n[i] > 0 else float("nan")
+
+    def total(self, col: str) -> float:
+        i = COL[col]
+        return float(self.mean[i] * self.n[i])
+
+    def std(self, col: str) -> float:
+        """Sample standard deviation (ddof=1, same as pandas)"""
+        i = COL[col]
+        if self.n[i] < 2:
+            return float("nan")
+        return float(np.sqrt(self.m2[i] / (self.n[i] - 1)))
+
+    def slope(self, col: str) -> float:
+        """Least-squares slope of a column over the window (oldest -> newest)"""
+        m = self.rows
+        if m < 3:
+            return 0
+        i = COL[col]
+        sx = m * (m - 1) / 2
+        sxx = (m - 1) * m * (2 * m - 1) / 6
+        return float((m * self.sxy[i] - sx * self.sy[i]) / (m * sxx - sx * sx))
+
+
+def ewma_weights(ages: np.ndarray) -> np.ndarray:
+    """Fast and slow EWMA weights, shape (2, len(ages)), for rows `ages` maps old"""
+    return EWMA_DECAY[:, None] ** np.asarray(ages, dtype=np.float64)
+
+
+class _Ewma:
+    """
+    Fast and slow exponentially weighted means of one column over the last
+    HISTORY_SIZE rows: sum(w * x) / sum(w) with w = (1 - alpha) ** age and
+    NaN rows skipped (pandas ewm(alpha, adjust=True) over the same rows).
+    Pushing a row decays both sums and drops the evicted row's term, O(1).
+    """
+
+    __slots__ = ("total", "weight")
+
+    TAIL = EWMA_DECAY ** HISTORY_SIZE
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.total = np.zeros(2)
+        self.weight = np.zeros(2)
+
+    def push(self, value: float, evicted: Optional[float]):
+        """Add the newest value, removing `evicted` (the row leaving the history) if given"""
+        self.total = EWMA_DECAY * self.total
+        self.weight = EWMA_DECAY * self.weight
+        if not np.isnan(value):
+            self.total += value
+            self.weight += 1
+        if evicted is not None and not np.isnan(evicted):
+            self.total -= self.TAIL * evicted
+            self.weight -= self.TAIL
+
+    def fill(self, values: np.ndarray):
+        """Recompute from values, newest first"""
+        valid = ~np.isnan(values)
+        weights = ewma_weights(np.arange(len(values))) * valid
+        self.total = weights @ np.where(valid, values, 0.0)
+        self.weight = weights.sum(axis=1)
+
+    def means(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.weight > 0, self.total / self.weight, np.nan)
+
+
+class PlayerFeatureState:
+    """Ring buffer of recent rows plus incrementally maintained window stats"""
+
+    __slots__ = ("history", "head", "count", "seen", "windows", "ewma", "seeded_at")
+
+    def __init__(self):
+        self.history = np.full((HISTORY_SIZE, len(STAT_COLUMNS)), np.nan)
+        self.head = 0      # Next write position in the ring buffer
+        self.count = 0     # Rows currently held (<= HISTORY_SIZE)
+        self.seen = np.zeros(HISTORY_SIZE, dtype=np.int64)  # Row key hashes, parallel to history
+        self.windows = {w: _WindowStats(w) for w in WINDOWS}
+        self.ewma = _Ewma()
+        # When the buffer was filled from the player's DB history (epoch
+        # seconds); 0 for a state holding only rows ingested since
+        self.seeded_at = 0.0
+
+    def _recent(self, n: int) -> np.ndarray:
+        """Last n rows, newest first"""
+        n = min(n, self.count)
+        idx = (self.head - 1 - np.arange(n)) % HISTORY_SIZE
+        return self.history[idx]
+
+    def find_key(self, key_hash: int) -> Optional[int]:
+        """Ring buffer slot holding the row with this key, if any"""
+        # Until the buffer wraps, rows occupy slots [0, count)
+        slots = np.flatnonzero(self.seen[:self.count] == key_hash)
+        return int(slots[0]) if len(slots) else None
+
+    def replace(self, slot: int, row: np.ndarray) -> bool:
+        """Overwrite a held row (a re-fetched, corrected map); returns False if unchanged"""
+        if np.array_equal(self.history[slot], row, equal_nan=True):
+            return False
+        self.history[slot] = row
+        self.rebuild()
+        return True
+
+    def push(self, row: np.ndarray, key_hash: int = 0):
+        """Ingest a new map row in O(1)"""
+        for size, window in self.windows.items():
+            evicted = None
+            if self.count >= size:
+                evicted = self.history[(self.head - size) % HISTORY_SIZE]
+            window.push(row, evicted)
+        evicted = self.history[self.head, COL["kills"]] if self.count == HISTORY_SIZE else None
+        self.ewma.push(row[COL["kills"]], evicted)
+
+        self.history[self.head] = row
+        self.seen[self.head] = key_hash
+        self.head = (self.head + 1) % HISTORY_SIZE
+        self.count = min(self.count + 1, HISTORY_SIZE)
+
+        # Re-derive the running sums once per buffer cycle so float drift
+        # from add/remove never accumulates (amortized O(1))
+        if self.head == 0:
+            self.rebuild()
+
+    def rebuild(self):
+        """Recompute window stats and EWMAs from the ring buffer"""
+        recent = self._recent(self.count)
+        rows = recent[::-1]  # Oldest first
+        for size, window in self.windows.items():
+            window.reset()
+            for row in rows[-size:]:
+                window.push(row, None)
+        self.ewma.fill(recent[:, COL["kills"]])
+
+    def features(self, player_id: str) -> Dict:
+        """Feature dict with the same keys as FeatureEngineer.get_player_features"""
+        w5 = self.windows[5]
+        w10 = self.windows[10]
+        ewma_fast, ewma_slow = (float(v) for v in self.ewma.means())
+        features = {
+            "player_id": player_id,
+            "last5_avg_kills": w5.avg("kills"),
+            "last5_avg_deaths": w5.avg("deaths"),
+            "last5_avg_assists": w5.avg("assists"),
+            "last5_avg_rating": w5.avg("rating"),
+            "last5_avg_adr": w5.avg("adr"),
+            "last10_avg_kills": w10.avg("kills"),
+            "last10_avg_deaths": w10.avg("deaths"),
+            "last10_avg_assists": w10.avg("assists"),
+            "last10_avg_rating": w10.avg("rating"),
+            "kills_std": w10.std("kills"),
+            "deaths_std": w10.std("deaths"),
+            "assists_std": w10.std("assists"),
+            "rating_std": w10.std("rating"),
+            "kills_trend": w10.slope("kills"),
+            "deaths_trend": w10.slope("deaths"),
+            "assists_trend": w10.slope("assists"),
+            "kills_ewma": ewma_fast,
+            "kills_ewma_trend": ewma_fast - ewma_slow,
+            "matches_count": self.count,
+            "kd_ratio": w10.total("kills") / max(w10.total("deaths"), 1),
+            "avg_hs_pct": w10.avg("headshot_percentage"),
+        }
+        return features
+
+
+def stat_row(stat: dict) -> np.ndarray:
+    """Convert a cs2_player_stats record to a feature row"""
+    row = np.empty(len(STAT_COLUMNS))
+    for i, col in enumerate(STAT_COLUMNS):
+        value = stat.get(col)
+        row[i] = float(value) if value is not None else np.nan
+    return row
+
+
+class OnlineFeatureStore:
+    """
+    Per-player incremental feature state
+
+    Feed rows with `update()` as they are ingested (Database.insert_player_stats
+    does this when constructed with a store) and read features with
+    `get_features()` without touching the database. A player first seen
+    through `update()` is unseeded, and seeded state expires after
+    `max_seed_age` seconds: readers seed it from the DB history (`seed()`)
+    before trusting its features.
+    """
+
+    def __init__(self, max_seed_age: float = SEED_MAX_AGE):
+        self.states: Dict[str, PlayerFeatureState] = {}
+        self.max_seed_age = max_seed_age
+        self.dirty = False
+
+    def __contains__(self, player_id: str) -> bool:
+        return player_id in self.states
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def is_seeded(self, player_id: str) -> bool:
+        state = self.states.get(player_id)
+        return state is not None and time.time() - state.seeded_at < self.max_seed_age
+
+    def update(self, player_id: str, stat: dict, key: str = None) -> bool:
+        """
+        Ingest one map row for a player. A row whose key is already held
+        (a re-fetched match) replaces the earlier values. Returns True if
+        the state changed.
+        """
+        state = self.states.get(player_id)
+        if state is None:
+            state = self.states[player_id] = PlayerFeatureState()
+
+        row = stat_row(stat)
+        key_hash = _row_key(key) if key else 0
+        slot = state.find_key(key_hash) if key_hash else None
+        if slot is not None:
+            changed = state.replace(slot, row)
+        else:
+            state.push(row, key_hash)
+            changed = True
+        self.dirty = self.dirty or changed
+        return changed
+
+    def seed(self, player_id: str, stats: List[dict]):
+        """Initialise a player's state from DB rows (newest first), replacing any ingested rows"""
+        state = PlayerFeatureState()
+        for stat in reversed(stats[:HISTORY_SIZE]):
+            key = f"{stat['match_id']}:{stat.get('map_name')}" if stat.get("match_id") else None
+            state.push(stat_row(stat), _row_key(key) if key else 0)
+        state.seeded_at = time.time()
+        # Published complete, so concurrent readers never see a half-built state
+        self.states[player_id] = state
+        self.dirty = True
+
+    def get_features(self, player_id: str) -> Optional[Dict]:
+        """Current features for a player, or None if no rows were seen"""
+        state = self.states.get(player_id)
+        if state is None or state.count == 0:
+            return None
+        return state.features(player_id)
+
+    def recent_values(self, player_id: str, column: str, n: int = 20) -> np.ndarray:
+        """Last n values of a stat column, newest first"""
+        state = self.states.get(player_id)
+        if state is None or column not in COL:
+            return np.empty(0)
+        return state._recent(n)[:, COL[column]]
+
+    def over_rate(self, player_id: str, column: str, line: float, n: int = 20) -> Optional[float]:
+        """Share of the last n maps where `column` went over `line`"""
+        values = self.recent_values(player_id, column, n)
+        if len(values) == 0:
+            return None
+        # NaN compares False, same as pandas
+        return float(np.mean(values > line))
+
+    # ==================== PERSISTENCE ====================
+    def save(self, path: Path = None):
+        """Persist all states as a compact set of stacked arrays"""
+        path = Path(path or DEFAULT_STATE_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        player_ids = list(self.states)
+        states = [self.states[p] for p in player_ids]
+        np.savez_compressed(
+            path,
+            player_ids=np.array(player_ids, dtype=str),
+            history=np.array([s.history for s in states], dtype=np.float64).reshape(-1, HISTORY_SIZE, len(STAT_COLUMNS)),
+            seen=np.array([s.seen for s in states], dtype=np.int64).reshape(-1, HISTORY_SIZE),
+            head=np.array([s.head for s in states], dtype=np.int16),
+            count=np.array([s.count for s in states], dtype=np.int16),
+            seeded_at=np.array([s.seeded_at for s in states], dtype=np.float64),
+        )
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Path = None) -> "OnlineFeatureStore":
+        """Load persisted states; returns an empty store if none exist"""
+        path = Path(path or DEFAULT_STATE_PATH)
+        store = cls()
+        if not path.exists():
+            return store
+
+        data = np.load(path)
+        for i, player_id in enumerate(data["player_ids"]):
+            state = PlayerFeatureState()
+            state.history = data["history"][i].copy()
+            state.seen = data["seen"][i].copy()
+            state.head = int(data["head"][i])
+            state.count = int(data["count"][i])
+            state.seeded_at = float(data["seeded_at"][i])
+            state.rebuild()
+            store.states[str(player_id)] = state
+
+        return store
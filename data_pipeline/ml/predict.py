@@ -2,6 +2,7 @@
 Generate predictions for upcoming matches
 """
 import sys
+import argparse
 from datetime import datetime
 from typing import List, Dict
 
@@ -11,79 +12,190 @@ import pandas as pd
 sys.path.append('..')
 from database import Database
 from features import FeatureEngineer
-from train import PlayerKillsModel, MODELS_DIR
+from online_features import OnlineFeatureStore
+from stats_cache import PlayerStatsCache
+from registry import ModelRegistry
+from value_bets import PropOddsIndex
+from fingerprints import latest_by_market, market_key, prediction_fingerprint
+from staking import allocate_stakes
+from profiling import span, add_profile_arguments, profiled
+
+
+# Rows per predict_proba call; bounds memory on very large slates
+PREDICT_CHUNK_SIZE = 5000
 
 
 class Predictor:
     """Generate and store predictions"""
     
     def __init__(self):
-        self.db = Database()
-        self.feature_eng = FeatureEngineer(self.db)
+        self.online_store = OnlineFeatureStore.load()
+        self.db = Database(feature_state=self.online_store)
+        self.feature_eng = FeatureEngineer(self.db, online_store=self.online_store)
+        self.registry = ModelRegistry()
         self.kills_model = None
+        self.last_predictions: List[Dict] = []
     
     def load_models(self):
-        """Load trained models"""
-        try:
-            self.kills_model = PlayerKillsModel.load()
-            print(f"Loaded kills model: {self.kills_model.version}")
-        except FileNotFoundError:
-            print("No kills model found - predictions unavailable")
+        """
+        Load (or hot-swap to) the current registered models. Cheap to call
+        repeatedly: the registry only re-reads its manifest when it changes.
+        """
+        version = self.registry.resolve("kills")
+        if version is None:
+            if not self.kills_model:
+                print("No kills model registered - predictions unavailable"
+                      " (train one, or run `python registry.py import` for existing pickles)")
+            return
+        if self.kills_model and self.kills_model.version == version:
+            return
+        
+        previous = self.kills_model.version if self.kills_model else None
+        self.kills_model = self.registry.load("kills", version)
+        if previous:
+            print(f"Swapped kills model: {previous} -> {version}")
+        else:
+            print(f"Loaded kills model: {version}")
     
     def predict_player_props(self, match_id: str = None) -> List[Dict]:
         """
-        Generate predictions for player prop bets
+        Generate predictions for player prop bets.
+        
+        Only new or changed props are scored and stored: a prop whose
+        fingerprint (model version, features, line, odds) matches the latest
+        stored prediction for its market reuses that prediction. Returns
+        predictions for the whole slate, reused ones included.
         """
+        self.load_models()
         if not self.kills_model:
-            self.load_models()
-            if not self.kills_model:
-                return []
+            return []
         
         # Get upcoming props from database
-        props = self._get_upcoming_props(match_id)
+        with span("props"):
+            props = self._get_upcoming_props(match_id)
         
         if not props:
             print("No upcoming props found")
             return []
         
-        predictions = []
+        # Load recent history for every player on the slate in one bulk read
+        player_ids = list({prop['player_id'] for prop in props})
+        with span("stats_cache"):
+            self.feature_eng.stats_cache = PlayerStatsCache.load(self.db, player_ids)
+        
+        # Latest stored prediction per market, for change detection
+        match_ids = sorted({prop['match_id'] for prop in props if prop.get('match_id')})
+        with span("fingerprints"):
+            stored = latest_by_market(self.db.get_prediction_fingerprints(match_ids))
+        
+        # Assemble features for the whole slate; only changed props are scored
+        predictions, changed = [], []
+        with span("features"):
+            for prop in props:
+                features = self.feature_eng.get_player_prop_features(
+                    player_id=prop['player_id'],
+                    prop_type=prop['prop_type'],
+                    line=prop['line']
+                )
+                if not features:
+                    continue
+                
+                fingerprint = prediction_fingerprint(
+                    prop, features, self.kills_model.feature_columns, self.kills_model.version
+                )
+                previous = stored.get(fingerprint.split(":", 1)[0])
+                if previous and previous['fingerprint'] == fingerprint:
+                    predictions.append(self._prediction(
+                        prop, features, float(previous['predicted_value']), fingerprint
+                    ))
+                else:
+                    changed.append((prop, features, fingerprint))
+        
+        new_predictions = []
+        if changed:
+            with span("score"):
+                probas = self._score(pd.DataFrame([features for _, features, _ in changed]))
+            new_predictions = [
+                self._prediction(prop, features, proba, fingerprint)
+                for (prop, features, fingerprint), proba in zip(changed, probas.tolist())
+            ]
+            # Store new predictions with one bulk insert per chunk
+            self.db.insert_predictions(new_predictions)
+        
+        print(f"Scored {len(new_predictions)} new or changed props, "
+              f"reused {len(predictions)} unchanged")
+        
+        predictions.extend(new_predictions)
+        self.last_predictions = predictions
+        
+        return predictions
+    
+    def _prediction(self, prop: Dict, features: Dict, proba: float, fingerprint: str) -> Dict:
+        """Prediction row for a prop"""
+        return {
+            "match_id": prop.get('match_id'),
+            "player_id": prop['player_id'],
+            "prediction_type": f"player_{prop['prop_type']}_over",
+            "predicted_value": float(proba),  # Probability of over
+            "confidence": self._calculate_confidence(proba),
+            "model_version": self.kills_model.version,
+            "features_used": features,
+            "fingerprint": fingerprint
+        }
+    
+    def predict_prop_distributions(self, match_id: str = None) -> List[Dict]:
+        """
+        Count distribution (mean, dispersion) per (match, player, prop type)
+        on the slate, from the registered `<stat>_dist` models. One model
+        evaluation per player prices every line, see distribution.py.
+        """
+        props = self._get_upcoming_props(match_id)
+        if not props:
+            return []
         
+        targets = {}
         for prop in props:
-            # Generate features
-            features = self.feature_eng.get_player_prop_features(
-                player_id=prop['player_id'],
-                prop_type=prop['prop_type'],
-                line=prop['line']
-            )
+            targets.setdefault((prop.get('match_id'), prop['player_id'], prop['prop_type']), prop)
+        
+        distributions = []
+        for stat in sorted({prop_type for _, _, prop_type in targets}):
+            name = f"{stat}_dist"
+            if self.registry.resolve(name) is None:
+                continue
+            model = self.registry.load(name)
             
-            if not features:
+            keys, rows = [], []
+            for key in targets:
+                if key[2] != stat:
+                    continue
+                features = self.feature_eng.get_player_features(key[1])
+                if features:
+                    keys.append(key)
+                    rows.append(features)
+            if not rows:
                 continue
             
-            # Convert to DataFrame for model
-            df = pd.DataFrame([features])
-            X = self.kills_model.scaler.transform(
-                df[self.kills_model.feature_columns].fillna(0)
+            X = pd.DataFrame(rows).reindex(columns=model.feature_columns).fillna(0)
+            means = model.predict_mean(model.scaler.transform(X))
+            distributions.extend(
+                {
+                    "match_id": match, "player_id": player, "prop_type": prop_type,
+                    "mean": float(mean), "dispersion": float(model.dispersion),
+                    "model_version": model.version,
+                }
+                for (match, player, prop_type), mean in zip(keys, means.tolist())
             )
-            
-            # Get prediction
-            pred, proba = self.kills_model.predict(X)
-            
-            prediction = {
-                "match_id": prop.get('match_id'),
-                "player_id": prop['player_id'],
-                "prediction_type": f"player_{prop['prop_type']}_over",
-                "predicted_value": float(proba[0]),  # Probability of over
-                "confidence": self._calculate_confidence(proba[0]),
-                "model_version": self.kills_model.version,
-                "features_used": features
-            }
-            
-            predictions.append(prediction)
-            
-            # Store prediction in database
-            self.db.insert_prediction(prediction)
         
-        return predictions
+        return distributions
+    
+    def _score(self, df: pd.DataFrame) -> np.ndarray:
+        """Over probabilities for a feature frame, PREDICT_CHUNK_SIZE rows per model call"""
+        X = df.reindex(columns=self.kills_model.feature_columns).fillna(0)
+        probas = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), PREDICT_CHUNK_SIZE):
+            chunk = self.kills_model.scaler.transform(X.iloc[start:start + PREDICT_CHUNK_SIZE])
+            probas[start:start + len(chunk)] = self.kills_model.predict_proba(chunk)
+        return probas
     
     def predict_match_winners(self) -> List[Dict]:
         """
@@ -101,7 +213,7 @@ class Predictor:
         return predictions
     
     def _get_upcoming_props(self, match_id: str = None) -> List[Dict]:
-        """Get player props to predict"""
+        """Get player props to predict (latest fetch per market)"""
         # Query props from database
         query = self.db.client.table("cs2_player_props").select(
             "*, player:cs2_players(*), match:cs2_matches(*)"
@@ -111,9 +223,14 @@ class Predictor:
             query = query.eq("match_id", match_id)
         
         # Only get props for upcoming matches
-        result = query.execute()
+        result = query.order("fetched_at", desc=True).execute()
         
-        return result.data
+        # Older fetches of the same market (book and line) are superseded by
+        # the newest prices; alternate lines stay separate
+        latest = {}
+        for prop in result.data:
+            latest.setdefault(market_key(prop), prop)
+        return list(latest.values())
     
     def _calculate_confidence(self, probability: float) -> float:
         """
@@ -124,73 +241,82 @@ class Predictor:
         # Scale to 0-1 range (0.5 distance maps to 1.0 confidence)
         return min(distance * 2, 1.0)
     
-    def get_value_bets(self, min_edge: float = 0.05) -> List[Dict]:
+    def get_value_bets(self, min_edge: float = 0.05, predictions: List[Dict] = None) -> List[Dict]:
         """
-        Find bets where our model probability differs from market odds
+        Find bets where our model probability beats the best market price.
+        Uses the given predictions (default: the last predict_player_props run)
+        and never re-predicts; market prices come from one read of the slate.
         """
-        predictions = self.predict_player_props()
+        if predictions is None:
+            predictions = self.last_predictions
+        if not predictions:
+            return []
         
-        value_bets = []
-        for pred in predictions:
-            # Get corresponding odds from market
-            odds = self._get_market_odds(pred)
-            
-            if not odds:
-                continue
-            
-            # Calculate implied probability from market
-            market_prob = 1 / odds['over_odds']
-            our_prob = pred['predicted_value']
-            
-            # Calculate edge
-            edge = our_prob - market_prob
-            
-            if edge >= min_edge:
-                value_bets.append({
-                    **pred,
-                    "market_odds": odds['over_odds'],
-                    "market_implied_prob": market_prob,
-                    "our_probability": our_prob,
-                    "edge": edge,
-                    "expected_value": (our_prob * odds['over_odds']) - 1
-                })
-        
-        # Sort by edge
-        value_bets.sort(key=lambda x: x['edge'], reverse=True)
-        
-        return value_bets
-    
-    def _get_market_odds(self, prediction: Dict) -> Dict:
-        """Get current market odds for a prediction"""
-        result = self.db.client.table("cs2_player_props").select("*").eq(
-            "player_id", prediction['player_id']
-        ).eq(
-            "match_id", prediction['match_id']
-        ).order("fetched_at", desc=True).limit(1).execute()
-        
-        return result.data[0] if result.data else None
+        match_ids = sorted({p['match_id'] for p in predictions if p.get('match_id')})
+        odds_index = PropOddsIndex.from_database(self.db, match_ids)
+        return odds_index.find_value(predictions, min_edge=min_edge)
+    
+    def get_distribution_value_bets(self, min_edge: float = 0.05, distributions: List[Dict] = None) -> List[Dict]:
+        """Value bets across every offered line (alternates included) from count distributions"""
+        if distributions is None:
+            distributions = self.predict_prop_distributions()
+        if not distributions:
+            return []
+        
+        match_ids = sorted({d['match_id'] for d in distributions if d.get('match_id')})
+        odds_index = PropOddsIndex.from_database(self.db, match_ids)
+        return odds_index.find_value_from_distributions(distributions, min_edge=min_edge)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate CS2 predictions")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    
+    with profiled(args, "predict"):
+        run()
+
+
+def run():
     print(f"Generating predictions at {datetime.now().isoformat()}")
     
     predictor = Predictor()
-    predictor.load_models()
+    with span("load_models"):
+        predictor.load_models()
     
     # Generate prop predictions
-    props = predictor.predict_player_props()
+    with span("predict_props"):
+        props = predictor.predict_player_props()
     print(f"Generated {len(props)} prop predictions")
     
-    # Find value bets
-    value_bets = predictor.get_value_bets(min_edge=0.05)
+    # Find value bets against the predictions just made
+    with span("value_bets"):
+        value_bets = predictor.get_value_bets(min_edge=0.05, predictions=props)
     print(f"Found {len(value_bets)} potential value bets")
     
+    # Joint fractional-Kelly stakes as a share of bankroll
+    with span("staking"):
+        value_bets = allocate_stakes(value_bets)
+    if value_bets:
+        print(f"Slate exposure: {sum(b['stake_fraction'] for b in value_bets):.2%} of bankroll")
+    
     for bet in value_bets[:5]:  # Show top 5
         print(f"\n  Player: {bet.get('player_id')}")
+        print(f"  Bet: {bet['prop_type']} {bet['side']} {bet['line']} @ {bet['market_odds']} ({bet['bookmaker']})")
         print(f"  Our Prob: {bet['our_probability']:.2%}")
-        print(f"  Market: {bet['market_implied_prob']:.2%}")
+        print(f"  Market: {bet['market_implied_prob']:.2%} (fair {bet['market_fair_prob']:.2%}, margin {bet['book_margin']:.2%})")
         print(f"  Edge: {bet['edge']:.2%}")
         print(f"  EV: {bet['expected_value']:.2%}")
+        print(f"  Stake: {bet['stake_fraction']:.2%} of bankroll")
+    
+    # Alternate lines priced from count distributions, where models exist
+    with span("distribution_value_bets"):
+        line_bets = predictor.get_distribution_value_bets(min_edge=0.05)
+    if line_bets:
+        print(f"\nFound {len(line_bets)} value lines from prop distributions")
+        for bet in line_bets[:5]:
+            print(f"  {bet['player_id']} {bet['prop_type']} {bet['side']} {bet['line']} "
+                  f"@ {bet['market_odds']} ({bet['bookmaker']}): edge {bet['edge']:.2%}")
 
 
 if __name__ == "__main__":
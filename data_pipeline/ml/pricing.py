@@ -0,0 +1,226 @@
+"""
+Vig removal and fair prices across bookmakers
+
+Odds snapshots (many matches x bookmakers x outcomes) are grouped into
+markets - one bookmaker's prices for one (match, market type, line) - and
+padded into a (markets x outcomes) matrix, so every de-vig method runs over
+the whole snapshot at once:
+
+    multiplicative  p_i = q_i / sum(q)
+    additive        p_i = q_i - (sum(q) - 1) / n
+    power           p_i = q_i ** k, with k solved so sum(p) = 1
+    shin            Shin (1993) insider-trading model, z solved so sum(p) = 1
+
+where q_i = 1 / odds_i. Consensus fair prices average the books' fair
+probabilities per selection, weighting Pinnacle (the sharp reference) more
+heavily, and per-book margins summarise how much each bookmaker charges.
+
+Only NumPy and pandas are needed.
+"""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+METHODS = ("multiplicative", "additive", "power", "shin")
+DEFAULT_METHOD = "shin"
+
+SHARP_BOOK = "pinnacle"
+# Consensus weight of the sharp book relative to any other bookmaker
+SHARP_WEIGHT = 3.0
+
+# One bookmaker's prices for one market
+MARKET_KEY = ["match_id", "bookmaker", "market_type", "line"]
+
+# Iterations for the vectorized solvers
+POWER_ITERATIONS = 20
+SHIN_ITERATIONS = 50
+SHIN_MAX_Z = 0.5
+
+
+# ==================== DE-VIG METHODS ====================
+def implied_probabilities(odds: np.ndarray) -> np.ndarray:
+    """1 / decimal odds; invalid or missing prices become NaN"""
+    odds = np.asarray(odds, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(odds > 1.0, 1.0 / odds, np.nan)
+
+
+def margins(odds: np.ndarray) -> np.ndarray:
+    """
+    Overround per market (row): sum of implied probabilities - 1, NaN for
+    markets with fewer than two valid prices
+    """
+    q = implied_probabilities(np.atleast_2d(odds))
+    complete = np.sum(~np.isnan(q), axis=1) >= 2
+    return np.where(complete, np.nansum(q, axis=1) - 1.0, np.nan)
+
+
+def _multiplicative(q: np.ndarray) -> np.ndarray:
+    return q / np.nansum(q, axis=1, keepdims=True)
+
+
+def _additive(q: np.ndarray) -> np.ndarray:
+    n = np.sum(~np.isnan(q), axis=1, keepdims=True)
+    p = q - (np.nansum(q, axis=1, keepdims=True) - 1.0) / n
+    # Long shots can go negative under the additive method
+    return np.where(np.isnan(q), np.nan, np.clip(p, 0.0, 1.0))
+
+
+def _power(q: np.ndarray) -> np.ndarray:
+    """Newton's method on f(k) = sum(q^k) - 1, all markets at once"""
+    log_q = np.log(q)
+    k = np.ones((len(q), 1))
+    for _ in range(POWER_ITERATIONS):
+        powered = q ** k
+        f = np.nansum(powered, axis=1, keepdims=True) - 1.0
+        df = np.nansum(powered * log_q, axis=1, keepdims=True)
+        k = np.maximum(k - f / np.where(df == 0, -1.0, df), 1e-6)
+    return q ** k
+
+
+def _shin_probabilities(q_sq: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """Shin probabilities from q_i^2 / sum(q) at insider share z"""
+    return (np.sqrt(z ** 2 + 4.0 * (1.0 - z) * q_sq) - z) / (2.0 * (1.0 - z))
+
+
+def _shin(q: np.ndarray) -> np.ndarray:
+    """Bisection on the insider share z (sum of probabilities falls as z grows)"""
+    q_sq = q ** 2 / np.nansum(q, axis=1, keepdims=True)
+    lo = np.zeros((len(q), 1))
+    hi = np.full((len(q), 1), SHIN_MAX_Z)
+    for _ in range(SHIN_ITERATIONS):
+        z = (lo + hi) / 2.0
+        too_high = np.nansum(_shin_probabilities(q_sq, z), axis=1, keepdims=True) > 1.0
+        lo = np.where(too_high, z, lo)
+        hi = np.where(too_high, hi, z)
+    return _shin_probabilities(q_sq, (lo + hi) / 2.0)
+
+
+_DEVIG = {
+    "multiplicative": _multiplicative,
+    "additive": _additive,
+    "power": _power,
+    "shin": _shin,
+}
+
+
+def devig(odds: np.ndarray, method: str = DEFAULT_METHOD) -> np.ndarray:
+    """
+    Fair probabilities for a (markets x outcomes) odds matrix, NaN-padded
+    for markets with fewer outcomes. Markets with fewer than two valid
+    prices, or no margin to remove, fall back to normalised implied
+    probabilities.
+    """
+    if method not in _DEVIG:
+        raise ValueError(f"Unknown de-vig method: {method}")
+    q = implied_probabilities(np.atleast_2d(odds))
+    fair = np.full_like(q, np.nan)
+
+    valid = np.sum(~np.isnan(q), axis=1) >= 2
+    overround = np.nansum(q, axis=1) > 1.0
+    solve = valid & overround
+    if solve.any():
+        fair[solve] = _DEVIG[method](q[solve])
+    plain = valid & ~overround
+    if plain.any():
+        fair[plain] = _multiplicative(q[plain])
+    return fair
+
+
+# ==================== SNAPSHOTS ====================
+def market_matrix(frame: pd.DataFrame):
+    """
+    Group outcome rows into markets.
+
+    Returns (market_index, outcome_slot, odds_matrix): the market and slot
+    of every row, and the (markets x max outcomes) NaN-padded odds.
+    """
+    market_index = frame.groupby(MARKET_KEY, dropna=False, sort=False).ngroup().to_numpy()
+    slot = frame.groupby(market_index).cumcount().to_numpy()
+
+    n_markets = int(market_index.max()) + 1 if len(market_index) else 0
+    width = int(slot.max()) + 1 if len(slot) else 0
+    odds = np.full((n_markets, width), np.nan)
+    odds[market_index, slot] = frame["odds_decimal"].to_numpy(dtype=np.float64)
+    return market_index, slot, odds
+
+
+def snapshot_frame(rows: List[dict]) -> pd.DataFrame:
+    """Normalise odds rows (cs2_odds or fetcher output) into one frame"""
+    frame = pd.DataFrame(rows)
+    if "match_id" not in frame and "match_external_id" in frame:
+        frame["match_id"] = frame["match_external_id"]
+    for col in MARKET_KEY + ["selection", "odds_decimal"]:
+        if col not in frame:
+            frame[col] = None
+    frame["line"] = pd.to_numeric(frame["line"], errors="coerce").round(2)
+    frame["odds_decimal"] = pd.to_numeric(frame["odds_decimal"], errors="coerce")
+    if "fetched_at" in frame:
+        # Newest price per outcome only
+        frame = frame.sort_values("fetched_at", ascending=False, kind="stable")
+    frame = frame.drop_duplicates(MARKET_KEY + ["selection"])
+    return frame.reset_index(drop=True)
+
+
+def fair_prices(
+    rows: List[dict],
+    methods=METHODS,
+    consensus_method: str = DEFAULT_METHOD,
+    sharp_book: str = SHARP_BOOK,
+    sharp_weight: float = SHARP_WEIGHT
+) -> Dict[str, pd.DataFrame]:
+    """
+    De-vig a whole odds snapshot.
+
+    Returns three frames:
+      outcomes   - every price with its implied probability, market margin
+                   and fair probability per method (`fair_<method>`)
+      consensus  - per (match, market type, line, selection): weighted fair
+                   probability and fair odds across books
+      books      - per bookmaker: markets priced and mean/median margin
+    """
+    frame = snapshot_frame(rows)
+    if frame.empty:
+        empty = pd.DataFrame()
+        return {"outcomes": empty, "consensus": empty, "books": empty}
+
+    market_index, slot, odds = market_matrix(frame)
+    frame["implied"] = implied_probabilities(frame["odds_decimal"].to_numpy())
+    market_margin = margins(odds)
+    frame["margin"] = market_margin[market_index]
+    frame["outcomes_in_market"] = np.sum(~np.isnan(odds), axis=1)[market_index]
+
+    for method in set(methods) | {consensus_method}:
+        frame[f"fair_{method}"] = devig(odds, method)[market_index, slot]
+
+    # Consensus across books, sharp book weighted up
+    fair_col = f"fair_{consensus_method}"
+    priced = frame[frame[fair_col].notna()].copy()
+    priced["is_sharp"] = priced["bookmaker"] == sharp_book
+    priced["weight"] = np.where(priced["is_sharp"], sharp_weight, 1.0)
+    priced["weighted"] = priced[fair_col] * priced["weight"]
+    selection_key = ["match_id", "market_type", "line", "selection"]
+    consensus = priced.groupby(selection_key, dropna=False).agg(
+        weighted=("weighted", "sum"),
+        weight=("weight", "sum"),
+        books=("bookmaker", "nunique"),
+        best_odds=("odds_decimal", "max"),
+        has_sharp=("is_sharp", "max"),
+    ).reset_index()
+    consensus["fair_prob"] = consensus["weighted"] / consensus["weight"]
+    # Renormalise so each consensus market sums to one
+    market_total = consensus.groupby(["match_id", "market_type", "line"], dropna=False)["fair_prob"].transform("sum")
+    consensus["fair_prob"] = consensus["fair_prob"] / market_total
+    consensus["fair_odds"] = 1.0 / consensus["fair_prob"]
+    consensus = consensus.drop(columns=["weighted", "weight"])
+
+    first = frame.groupby(market_index).head(1)
+    books = first.groupby("bookmaker").agg(
+        markets=("margin", "count"),
+        mean_margin=("margin", "mean"),
+        median_margin=("margin", "median"),
+    ).reset_index().sort_values("mean_margin")
+
+    return {"outcomes": frame, "consensus": consensus, "books": books}
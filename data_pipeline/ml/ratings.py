@@ -0,0 +1,259 @@
+"""
+Team strength ratings for match predictions
+
+Elo-style engine that replays finished `cs2_matches` in chronological order,
+records every team's pre-match rating (for leak-free training rows) and keeps
+per-team rating histories for point-in-time lookups. New results are applied
+incrementally with `update()`.
+"""
+from bisect import bisect_left
+from datetime import datetime
+from math import comb
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 24.0
+
+# Series carry more information than a single map
+BEST_OF_WEIGHT = {1: 1.0, 2: 1.1, 3: 1.25, 5: 1.5}
+
+# New teams move faster until they have this many rated matches
+PROVISIONAL_MATCHES = 10
+PROVISIONAL_MULTIPLIER = 2.0
+
+# Extra weight per map of winning margin (2-0 counts more than 2-1)
+MARGIN_WEIGHT = 0.25
+
+
+def parse_timestamp(value) -> float:
+    """ISO timestamp (as returned by PostgREST) -> epoch seconds"""
+    if value is None:
+        return float("nan")
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def match_time(match: dict) -> float:
+    """When a match result became known"""
+    for key in ("ended_at", "started_at", "scheduled_at"):
+        if match.get(key):
+            return parse_timestamp(match[key])
+    return float("nan")
+
+
+def match_outcome(match: dict) -> Optional[float]:
+    """
+    Team 1's series result: 1.0 win, 0.0 loss, 0.5 draw (even formats).
+    Falls back to the score when no winner is recorded; None if unplayed.
+    """
+    team1_id, team2_id = match.get("team1_id"), match.get("team2_id")
+    winner_id = match.get("winner_id")
+    if winner_id and winner_id == team1_id:
+        return 1.0
+    if winner_id and winner_id == team2_id:
+        return 0.0
+    score1 = match.get("team1_score") or 0
+    score2 = match.get("team2_score") or 0
+    if score1 or score2:
+        return 1.0 if score1 > score2 else 0.0 if score2 > score1 else 0.5
+    return None
+
+
+def map_win_probability(rating_diff):
+    """Probability of winning a single map given a rating difference"""
+    return 1.0 / (1.0 + 10.0 ** (-np.asarray(rating_diff, dtype=np.float64) / 400.0))
+
+
+def series_win_probability(p_map, best_of: int = 1):
+    """
+    Probability of winning a best-of-N series from a per-map probability
+    (maps treated as independent). Even formats return the expected share
+    of maps, since they can end in a draw.
+    """
+    p = np.asarray(p_map, dtype=np.float64)
+    if not best_of or best_of <= 1 or best_of % 2 == 0:
+        return p
+    need = best_of // 2 + 1
+    q = 1.0 - p
+    total = np.zeros_like(p)
+    for lost in range(need):
+        total += comb(need - 1 + lost, lost) * p ** need * q ** lost
+    return total
+
+
+def _series_win_probability(p: float, best_of: int) -> float:
+    """Scalar fast path of series_win_probability for the replay loop"""
+    if best_of <= 1 or best_of % 2 == 0:
+        return p
+    if best_of == 3:
+        return p * p * (3.0 - 2.0 * p)
+    need = best_of // 2 + 1
+    q = 1.0 - p
+    return sum(comb(need - 1 + lost, lost) * p ** need * q ** lost for lost in range(need))
+
+
+class TeamRatingEngine:
+    """Sequential Elo ratings with best-of and margin-of-victory handling"""
+
+    def __init__(self, k_factor: float = K_FACTOR, initial_rating: float = INITIAL_RATING):
+        self.k_factor = k_factor
+        self.initial_rating = initial_rating
+        self.index: Dict[str, int] = {}
+        self.ratings: List[float] = []
+        self.matches_played: List[int] = []
+        # Per-team history for point-in-time lookups: times and rating after
+        self.history_times: List[List[float]] = []
+        self.history_ratings: List[List[float]] = []
+        self.last_time = float("-inf")
+        # Match IDs already rated, so a re-read match isn't applied twice
+        self.seen: set = set()
+
+    def _team(self, team_id: str) -> int:
+        i = self.index.get(team_id)
+        if i is None:
+            i = self.index[team_id] = len(self.ratings)
+            self.ratings.append(self.initial_rating)
+            self.matches_played.append(0)
+            self.history_times.append([])
+            self.history_ratings.append([])
+        return i
+
+    # ==================== LOOKUPS ====================
+    def rating(self, team_id: str) -> float:
+        i = self.index.get(team_id)
+        return self.ratings[i] if i is not None else self.initial_rating
+
+    def rating_at(self, team_id: str, timestamp) -> float:
+        """Rating a team had strictly before `timestamp` (ISO string or epoch)"""
+        i = self.index.get(team_id)
+        if i is None:
+            return self.initial_rating
+        ts = timestamp if isinstance(timestamp, (int, float)) else parse_timestamp(timestamp)
+        pos = bisect_left(self.history_times[i], ts)
+        return self.history_ratings[i][pos - 1] if pos > 0 else self.initial_rating
+
+    def matches_before(self, team_id: str, timestamp=None) -> int:
+        i = self.index.get(team_id)
+        if i is None:
+            return 0
+        if timestamp is None:
+            return self.matches_played[i]
+        ts = timestamp if isinstance(timestamp, (int, float)) else parse_timestamp(timestamp)
+        return bisect_left(self.history_times[i], ts)
+
+    def expected(self, team1_id: str, team2_id: str, best_of: int = 1) -> float:
+        """Team 1's series win probability from current ratings"""
+        p_map = map_win_probability(self.rating(team1_id) - self.rating(team2_id))
+        return float(series_win_probability(p_map, best_of))
+
+    # ==================== UPDATES ====================
+    def update(self, match: dict) -> Optional[Tuple[float, float]]:
+        """
+        Apply one newly finished match. Returns the two teams' pre-match
+        ratings, or None if the match can't be rated (missing teams or
+        result) or was already rated. A result older than the last one
+        applied is recorded at the last time, keeping the history ordered.
+        """
+        ts = match_time(match)
+        if ts == ts:
+            ts = max(ts, self.last_time)
+        rated = self._rate(match, ts)
+        return (rated[0], rated[1]) if rated else None
+
+    def _rate(self, match: dict, ts: float = None) -> Optional[tuple]:
+        """Apply a match; returns (rating1, rating2, expected, played1, played2) before it"""
+        team1_id, team2_id = match.get("team1_id"), match.get("team2_id")
+        if not team1_id or not team2_id:
+            return None
+        match_id = match.get("id")
+        if match_id is not None and match_id in self.seen:
+            return None
+
+        actual = match_outcome(match)
+        if actual is None:
+            return None
+        score1 = match.get("team1_score") or 0
+        score2 = match.get("team2_score") or 0
+
+        best_of = match.get("best_of") or 1
+        if best_of % 2 == 0 and score1 + score2 > 0:
+            # Even formats are rated on map share
+            actual = score1 / (score1 + score2)
+
+        i, j = self._team(team1_id), self._team(team2_id)
+        played1, played2 = self.matches_played[i], self.matches_played[j]
+        r1, r2 = self.ratings[i], self.ratings[j]
+        p_map = 1.0 / (1.0 + 10.0 ** ((r2 - r1) / 400.0))
+        expected = _series_win_probability(p_map, best_of)
+
+        k = self.k_factor * BEST_OF_WEIGHT.get(best_of, 1.0)
+        margin = abs(score1 - score2)
+        if margin > 1:
+            k *= 1.0 + MARGIN_WEIGHT * (margin - 1)
+        k1 = k * (PROVISIONAL_MULTIPLIER if played1 < PROVISIONAL_MATCHES else 1.0)
+        k2 = k * (PROVISIONAL_MULTIPLIER if played2 < PROVISIONAL_MATCHES else 1.0)
+
+        self.ratings[i] = r1 + k1 * (actual - expected)
+        self.ratings[j] = r2 - k2 * (actual - expected)
+        self.matches_played[i] = played1 + 1
+        self.matches_played[j] = played2 + 1
+
+        if ts is None:
+            ts = match_time(match)
+        if ts == ts:  # Skip NaN times in the point-in-time history
+            self.history_times[i].append(ts)
+            self.history_ratings[i].append(self.ratings[i])
+            self.history_times[j].append(ts)
+            self.history_ratings[j].append(self.ratings[j])
+            self.last_time = max(self.last_time, ts)
+        if match_id is not None:
+            self.seen.add(match_id)
+
+        return r1, r2, expected, played1, played2
+
+    def replay(self, matches: List[dict]) -> Dict[str, np.ndarray]:
+        """
+        Rate a full match history in chronological order.
+
+        Returns columns aligned with the matches in replay order: match_id,
+        pre-match ratings and match counts for both teams, the pre-match
+        expected series probability, the format and the team 1 result
+        (match_outcome: winner, else score; 0.5 for a drawn even format).
+        Unrated matches are dropped.
+        """
+        times = np.array([match_time(m) for m in matches], dtype=np.float64)
+        order = np.argsort(times, kind="stable")
+
+        match_ids, rows, results, best_of = [], [], [], []
+        for idx in order.tolist():
+            match = matches[idx]
+            rated = self._rate(match, times[idx])
+            if rated is None:
+                continue
+            match_ids.append(match.get("id"))
+            rows.append(rated)
+            results.append(match_outcome(match))
+            best_of.append(match.get("best_of") or 1)
+
+        table = np.array(rows, dtype=np.float64).reshape(-1, 5)
+        return {
+            "match_id": np.array(match_ids, dtype=object),
+            "team1_rating": table[:, 0],
+            "team2_rating": table[:, 1],
+            "expected": table[:, 2],
+            "team1_matches": table[:, 3].astype(np.int64),
+            "team2_matches": table[:, 4].astype(np.int64),
+            "best_of": np.array(best_of, dtype=np.int64),
+            "team1_won": np.array(results),
+        }
+
+    @classmethod
+    def from_database(cls, db, **kwargs) -> "TeamRatingEngine":
+        """Build ratings by replaying every finished match in the database"""
+        engine = cls(**kwargs)
+        engine.replay(list(db.get_finished_matches()))
+        return engine
@@ -0,0 +1,256 @@
+"""
+Versioned model registry
+
+Every trained model is stored under MODELS_DIR as `<version>.pkl` (full
+training object) plus `<version>/` (compiled arrays, see compiled.py), and
+recorded in `manifest.json` with its feature columns, training metrics and
+data window. Each model name has a `current` (champion) version and an
+optional `challenger`, so resolving what to serve is a dict lookup instead
+of a directory scan.
+
+Loaded models are cached per process. The manifest is re-read only when its
+modification time changes, so a long-running predictor picks up a newly
+promoted version on its next call without a restart.
+
+Pickles saved before the registry existed (`kills_v*.pkl` and friends in
+MODELS_DIR) are not served until they are imported into the manifest.
+
+Usage:
+    python registry.py import
+    python registry.py list
+    python registry.py promote kills kills_v20250101_120000
+"""
+import os
+import json
+import argparse
+import importlib
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from compiled import CompiledModel, compile_model
+
+
+MODELS_DIR = Path(__file__).parent / "models"
+MANIFEST_NAME = "manifest.json"
+
+# Training classes for unpickling full models, imported only when needed
+MODEL_CLASSES = {
+    "kills": ("train", "PlayerKillsModel"),
+    "match": ("train", "MatchWinnerModel"),
+    "kills_dist": ("distribution", "PropDistributionModel"),
+    "deaths_dist": ("distribution", "PropDistributionModel"),
+    "assists_dist": ("distribution", "PropDistributionModel"),
+}
+
+# Loaded versions kept in memory per model name (current + previous for rollback)
+CACHED_VERSIONS = 2
+
+
+class ModelRegistry:
+    """Manifest-backed model store with an in-process cache"""
+
+    def __init__(self, root: Path = MODELS_DIR):
+        self.root = Path(root)
+        self.manifest_path = self.root / MANIFEST_NAME
+        self._manifest: Dict = {"models": {}}
+        self._manifest_mtime: Optional[float] = None
+        self._cache: Dict[Tuple[str, str, bool], object] = {}
+        self._lock = threading.Lock()
+
+    # ==================== MANIFEST ====================
+    def manifest(self) -> Dict:
+        """Current manifest, re-read only if the file changed on disk"""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._manifest
+        if mtime != self._manifest_mtime:
+            with open(self.manifest_path) as f:
+                self._manifest = json.load(f)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def _write_manifest(self, manifest: Dict):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        tmp.replace(self.manifest_path)
+        self._manifest = manifest
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+
+    def _model_entry(self, name: str) -> Dict:
+        return self.manifest()["models"].get(name, {})
+
+    def resolve(self, name: str, stage: str = "current") -> Optional[str]:
+        """Version serving as `stage` ("current" or "challenger"), if any"""
+        return self._model_entry(name).get(stage)
+
+    def entry(self, name: str, version: str) -> Optional[Dict]:
+        """Manifest record for one version"""
+        return self._model_entry(name).get("versions", {}).get(version)
+
+    # ==================== WRITES ====================
+    def register(
+        self,
+        name: str,
+        model,
+        metrics: Dict = None,
+        data_window: Dict = None,
+        promote: bool = True
+    ) -> Dict:
+        """
+        Save a trained model's artifacts and record it in the manifest.
+        promote=False registers it as the challenger instead of current.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        artifact = self.root / f"{model.version}.pkl"
+        model.save(artifact)
+
+        compiled = None
+        try:
+            compiled_path = self.root / model.version
+            compile_model(model).save(compiled_path)
+            compiled = compiled_path.name
+        except (TypeError, ValueError) as e:
+            print(f"  Compiled export skipped: {e}")
+
+        record = {
+            "version": model.version,
+            "artifact": artifact.name,
+            "compiled": compiled,
+            "feature_columns": list(model.feature_columns),
+            "metrics": {k: float(v) for k, v in (metrics or {}).items()},
+            "data_window": data_window or {},
+            "created_at": datetime.now().isoformat(),
+        }
+
+        manifest = json.loads(json.dumps(self.manifest()))
+        model_entry = manifest["models"].setdefault(name, {"versions": {}})
+        model_entry["versions"][model.version] = record
+        if promote:
+            model_entry["previous"] = model_entry.get("current")
+            model_entry["current"] = model.version
+            if model_entry.get("challenger") == model.version:
+                model_entry.pop("challenger")
+        else:
+            model_entry["challenger"] = model.version
+        self._write_manifest(manifest)
+
+        print(f"Registered {name} model {model.version}"
+              f" ({'current' if promote else 'challenger'})")
+        return record
+
+    def promote(self, name: str, version: str):
+        """Make `version` the current model for `name`"""
+        if self.entry(name, version) is None:
+            raise KeyError(f"Unknown {name} model version: {version}")
+        manifest = json.loads(json.dumps(self.manifest()))
+        model_entry = manifest["models"][name]
+        model_entry["previous"] = model_entry.get("current")
+        model_entry["current"] = version
+        if model_entry.get("challenger") == version:
+            model_entry.pop("challenger")
+        self._write_manifest(manifest)
+
+    def import_existing(self) -> Dict[str, list]:
+        """
+        Register `<name>_v*.pkl` pickles in the models directory that the
+        manifest doesn't know about. When a model name has no current
+        version, its newest imported version becomes current.
+        """
+        imported = {}
+        for name, (module, cls) in MODEL_CLASSES.items():
+            known = self._model_entry(name).get("versions", {})
+            paths = sorted(p for p in self.root.glob(f"{name}_v*.pkl") if p.stem not in known)
+            if not paths:
+                continue
+            model_cls = getattr(importlib.import_module(module), cls)
+            promote = self.resolve(name) is None
+            for path in paths:
+                model = model_cls.load(path)
+                self.register(name, model, data_window={"imported_from": path.name}, promote=promote)
+                imported.setdefault(name, []).append(model.version)
+        return imported
+
+    # ==================== LOADING ====================
+    def load(
+        self,
+        name: str,
+        version: str = None,
+        stage: str = "current",
+        compiled: bool = True
+    ):
+        """
+        Load a registered model, from the in-process cache when possible.
+
+        compiled=True returns the memory-mapped CompiledModel when the version
+        has one; compiled=False (or no export) unpickles the training object.
+        Raises FileNotFoundError when nothing is registered.
+        """
+        version = version or self.resolve(name, stage)
+        record = self.entry(name, version) if version else None
+        if record is None:
+            raise FileNotFoundError(f"No registered {name} model ({version or stage})")
+
+        use_compiled = compiled and bool(record.get("compiled"))
+        key = (name, version, use_compiled)
+        with self._lock:
+            model = self._cache.get(key)
+            if model is None:
+                if use_compiled:
+                    model = CompiledModel.load(self.root / record["compiled"], mmap_mode="r")
+                else:
+                    module, cls = MODEL_CLASSES[name]
+                    model_cls = getattr(importlib.import_module(module), cls)
+                    model = model_cls.load(self.root / record["artifact"])
+                self._cache[key] = model
+                self._evict(name)
+            return model
+
+    def _evict(self, name: str):
+        """Drop the oldest cached versions of `name` beyond CACHED_VERSIONS"""
+        keys = [k for k in self._cache if k[0] == name]
+        versions = sorted({k[1] for k in keys})
+        keep = set(versions[-CACHED_VERSIONS:]) | {self.resolve(name)}
+        for k in keys:
+            if k[1] not in keep:
+                del self._cache[k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and promote registered models")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List registered versions")
+    sub.add_parser("import", help="Register model pickles saved before the manifest existed")
+    promote = sub.add_parser("promote", help="Make a version current")
+    promote.add_argument("name")
+    promote.add_argument("version")
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    if args.command == "promote":
+        registry.promote(args.name, args.version)
+        print(f"{args.name}: current -> {args.version}")
+        return
+    if args.command == "import":
+        imported = registry.import_existing()
+        if not imported:
+            print("No unregistered model pickles found")
+        for name, versions in imported.items():
+            print(f"{name}: imported {len(versions)}, current -> {registry.resolve(name)}")
+        return
+
+    for name, model_entry in registry.manifest()["models"].items():
+        print(f"{name}:")
+        for version, record in sorted(model_entry.get("versions", {}).items()):
+            tags = [stage for stage in ("current", "challenger", "previous")
+                    if model_entry.get(stage) == version]
+            metrics = ", ".join(f"{k}={v:.4f}" for k, v in record["metrics"].items())
+            print(f"  {version} {'[' + ','.join(tags) + ']' if tags else ''} {metrics}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Cross-bookmaker best-line and arbitrage scanner
+
+`BestPriceBook` keeps every bookmaker's latest price per (match, market,
+selection, line) in memory, plus the best price on offer, and is updated
+incrementally as odds arrive. `update` returns the outcome groups whose
+prices moved, so `scan` only re-checks those groups. A live poll is applied
+with `apply_snapshot`, which also removes prices the poll no longer quotes:
+
+    arbitrage  best prices across books over a complete set of outcomes
+               imply less than 100%
+    middles    an over and an under (or two opposing handicaps) at
+               different lines where both legs can win
+    stale      a book's price beats Pinnacle's de-vigged fair price,
+               typically a line that hasn't followed Pinnacle's last move
+
+Usage:
+    python scanner.py                       # one scan of upcoming odds in cs2_odds
+    python scanner.py --live --interval 10  # poll OddsPapi live odds
+"""
+import sys
+import time
+import argparse
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from pricing import devig, SHARP_BOOK
+
+sys.path.append('..')
+from database import Database
+from fetchers import OddsPapiFetcher
+
+
+# Markets whose two selections carry opposite-signed lines (team A -1.5 / team B +1.5)
+SPREAD_MARKETS = ("spreads", "handicap", "map_handicap")
+# Over/under markets
+TOTAL_MARKETS = ("totals", "total_maps", "total_rounds")
+OVER, UNDER = "over", "under"
+
+# Flag arbitrage at any guaranteed profit
+MIN_ARB_PROFIT = 0.0
+# Largest loss (per unit returned) accepted when the middle misses
+MAX_MIDDLE_COST = 0.05
+# Minimum expected edge of a price over Pinnacle's fair price
+STALE_EDGE = 0.02
+
+# (match, market, selection, line)
+PriceKey = Tuple[str, str, str, Optional[float]]
+# (match, market, line); spread lines are unsigned so both sides share a group
+GroupKey = Tuple[str, str, Optional[float]]
+
+
+def _line(value) -> Optional[float]:
+    """Lines compared at DECIMAL(6,2) precision; None for lineless markets"""
+    if value is None:
+        return None
+    value = float(value)
+    return None if value != value else round(value, 2)
+
+
+class BestPriceBook:
+    """In-memory prices per bookmaker and best price per market selection"""
+
+    def __init__(self, sharp_book: str = SHARP_BOOK):
+        self.sharp_book = sharp_book
+        # key -> {bookmaker: (odds, fetched_at)}
+        self.prices: Dict[PriceKey, Dict[str, Tuple[float, str]]] = {}
+        # key -> (best odds, bookmaker)
+        self.best: Dict[PriceKey, Tuple[float, str]] = {}
+        self.groups: Dict[GroupKey, Set[PriceKey]] = {}
+        self.markets: Dict[Tuple[str, str], Set[GroupKey]] = {}
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    @staticmethod
+    def group_key(key: PriceKey) -> GroupKey:
+        match, market, _, line = key
+        if market in SPREAD_MARKETS and line is not None:
+            line = abs(line)
+        return (match, market, line)
+
+    # ==================== UPDATES ====================
+    @staticmethod
+    def _quote(row: dict) -> Optional[Tuple[PriceKey, str, float, str]]:
+        """(key, bookmaker, odds, fetched_at) of an odds row, or None if it quotes no price"""
+        match = row.get("match_id") or row.get("match_external_id")
+        odds = row.get("odds_decimal")
+        if match is None or odds is None:
+            return None
+        odds = float(odds)
+        if odds <= 1.0:
+            return None
+        key = (match, row.get("market_type"), row.get("selection"), _line(row.get("line")))
+        return key, row.get("bookmaker"), odds, row.get("fetched_at") or ""
+
+    def update(self, rows: Iterable[dict]) -> Set[GroupKey]:
+        """
+        Apply odds rows (cs2_odds or fetcher output, in any order) and return
+        the groups whose prices changed
+        """
+        touched = set()
+        for row in rows:
+            quote = self._quote(row)
+            if quote is None:
+                continue
+            key, book, odds, fetched_at = quote
+
+            books = self.prices.get(key)
+            if books is None:
+                books = self.prices[key] = {}
+                group = self.group_key(key)
+                self.groups.setdefault(group, set()).add(key)
+                self.markets.setdefault(group[:2], set()).add(group)
+
+            previous = books.get(book)
+            if previous is not None:
+                if fetched_at < previous[1]:
+                    # Older than the price already held
+                    continue
+                if previous[0] == odds:
+                    books[book] = (odds, fetched_at)
+                    continue
+            books[book] = (odds, fetched_at)
+
+            best = self.best.get(key)
+            if best is None or odds >= best[0]:
+                self.best[key] = (odds, book)
+            elif best[1] == book:
+                # The best price shortened; another book may now lead
+                self.best[key] = max((o, b) for b, (o, _) in books.items())
+            touched.add(self.group_key(key))
+
+        return touched
+
+    def apply_snapshot(self, rows: Iterable[dict]) -> Set[GroupKey]:
+        """
+        Apply one complete poll and return the groups whose prices changed.
+        Prices the poll no longer quotes (pulled or suspended by their book)
+        are removed, and matches missing from it are dropped. A failed
+        fetch returns no rows and so clears the book: with no current
+        prices there is nothing safe to flag.
+        """
+        rows = list(rows)
+        touched = self.update(rows)
+
+        quoted = {(quote[0], quote[1]) for quote in map(self._quote, rows) if quote is not None}
+        polled = {key[0] for key, _ in quoted}
+        for match in {key[0] for key in self.prices} - polled:
+            self.drop_match(match)
+        for key in [key for key in self.prices if key[0] in polled]:
+            for book in [book for book in self.prices[key] if (key, book) not in quoted]:
+                touched.add(self._remove(key, book))
+        return touched
+
+    def _remove(self, key: PriceKey, book: str) -> GroupKey:
+        """Remove one book's price for a selection; returns its group"""
+        books = self.prices[key]
+        del books[book]
+        group = self.group_key(key)
+        if books:
+            if self.best[key][1] == book:
+                self.best[key] = max((o, b) for b, (o, _) in books.items())
+            return group
+
+        del self.prices[key]
+        del self.best[key]
+        keys = self.groups[group]
+        keys.discard(key)
+        if not keys:
+            del self.groups[group]
+            groups = self.markets[group[:2]]
+            groups.discard(group)
+            if not groups:
+                del self.markets[group[:2]]
+        return group
+
+    def drop_match(self, match_id: str):
+        """Forget a match (settled, or suspended in-play)"""
+        for market_key in [m for m in self.markets if m[0] == match_id]:
+            for group in self.markets.pop(market_key):
+                for key in self.groups.pop(group, ()):
+                    self.prices.pop(key, None)
+                    self.best.pop(key, None)
+
+    # ==================== SCANNING ====================
+    def outcome_sets(self, group: GroupKey) -> List[Tuple[PriceKey, ...]]:
+        """Mutually exclusive, exhaustive selections within a group"""
+        keys = self.groups.get(group, ())
+        if group[1] not in SPREAD_MARKETS or group[2] is None:
+            return [tuple(sorted(keys, key=lambda k: str(k[2])))] if len(keys) >= 2 else []
+
+        # Handicaps pair one side's line with the other side's opposite line
+        sets = []
+        for a in keys:
+            for b in keys:
+                if a[2] == b[2] or a[3] != -b[3]:
+                    continue
+                if a[3] < 0 or (a[3] == 0 and str(a[2]) < str(b[2])):
+                    sets.append((a, b))
+        return sets
+
+    def scan(self, groups: Iterable[GroupKey] = None) -> Dict[str, List[Dict]]:
+        """Arbitrage, middles and stale lines within the given groups (default all)"""
+        groups = list(self.groups) if groups is None else list(groups)
+
+        arbitrage, sharp_sets = [], []
+        for group in groups:
+            for outcomes in self.outcome_sets(group):
+                best = [self.best[key] for key in outcomes]
+                inverse = sum(1.0 / odds for odds, _ in best)
+                profit = 1.0 / inverse - 1.0
+                if profit > MIN_ARB_PROFIT:
+                    arbitrage.append({
+                        "match_id": group[0],
+                        "market_type": group[1],
+                        "profit": profit,
+                        "legs": [
+                            {
+                                "selection": key[2],
+                                "line": key[3],
+                                "bookmaker": book,
+                                "odds": odds,
+                                # Share of the total stake on this leg
+                                "stake": (1.0 / odds) / inverse,
+                            }
+                            for key, (odds, book) in zip(outcomes, best)
+                        ],
+                    })
+                if all(self.sharp_book in self.prices[key] for key in outcomes):
+                    sharp_sets.append(outcomes)
+
+        return {
+            "arbitrage": sorted(arbitrage, key=lambda a: -a["profit"]),
+            "middles": self._middles({group[:2] for group in groups}),
+            "stale": self._stale(sharp_sets),
+        }
+
+    def _stale(self, outcome_sets: List[Tuple[PriceKey, ...]]) -> List[Dict]:
+        """Prices beating the sharp book's fair price, de-vigged in one pass"""
+        if not outcome_sets:
+            return []
+
+        width = max(len(outcomes) for outcomes in outcome_sets)
+        sharp_odds = np.full((len(outcome_sets), width), np.nan)
+        for i, outcomes in enumerate(outcome_sets):
+            for j, key in enumerate(outcomes):
+                sharp_odds[i, j] = self.prices[key][self.sharp_book][0]
+        fair = devig(sharp_odds)
+
+        stale = []
+        for i, outcomes in enumerate(outcome_sets):
+            for j, key in enumerate(outcomes):
+                fair_prob = float(fair[i, j])
+                if not fair_prob > 0:
+                    continue
+                sharp_updated = self.prices[key][self.sharp_book][1]
+                for book, (odds, fetched_at) in self.prices[key].items():
+                    edge = odds * fair_prob - 1.0
+                    if book == self.sharp_book or edge < STALE_EDGE:
+                        continue
+                    stale.append({
+                        "match_id": key[0],
+                        "market_type": key[1],
+                        "selection": key[2],
+                        "line": key[3],
+                        "bookmaker": book,
+                        "odds": odds,
+                        "sharp_odds": float(sharp_odds[i, j]),
+                        "fair_odds": 1.0 / fair_prob,
+                        "edge": edge,
+                        # Not refreshed since the sharp book last moved
+                        "lagging": fetched_at < sharp_updated,
+                    })
+        return sorted(stale, key=lambda s: -s["edge"])
+
+    def _middles(self, match_markets: Set[Tuple[str, str]]) -> List[Dict]:
+        middles = []
+        for match_market in match_markets:
+            market = match_market[1]
+            if market not in TOTAL_MARKETS and market not in SPREAD_MARKETS:
+                continue
+            keys = [key for group in self.markets.get(match_market, ()) for key in self.groups[group]
+                    if key[3] is not None]
+
+            if market in TOTAL_MARKETS:
+                overs = [k for k in keys if str(k[2]).lower() == OVER]
+                unders = [k for k in keys if str(k[2]).lower() == UNDER]
+                # Over the lower line and under the higher line both win in between
+                pairs = [(o, u, u[3] - o[3]) for o in overs for u in unders if o[3] < u[3]]
+            else:
+                # Opposing handicaps whose lines sum above zero overlap
+                pairs = [(a, b, a[3] + b[3]) for a in keys for b in keys
+                         if str(a[2]) < str(b[2]) and a[3] + b[3] > 0]
+
+            for a, b, width in pairs:
+                (odds_a, book_a), (odds_b, book_b) = self.best[a], self.best[b]
+                cost = 1.0 / odds_a + 1.0 / odds_b - 1.0
+                if cost > MAX_MIDDLE_COST:
+                    continue
+                middles.append({
+                    "match_id": match_market[0],
+                    "market_type": market,
+                    "width": width,
+                    "cost": cost,
+                    "legs": [
+                        {"selection": a[2], "line": a[3], "bookmaker": book_a, "odds": odds_a},
+                        {"selection": b[2], "line": b[3], "bookmaker": book_b, "odds": odds_b},
+                    ],
+                })
+        return sorted(middles, key=lambda m: (m["cost"], -m["width"]))
+
+
+def _report(flags: Dict[str, List[Dict]], book: BestPriceBook, elapsed: float, limit: int = 5):
+    print(f"{len(book)} selections, scanned in {elapsed * 1000:.1f}ms: "
+          f"{len(flags['arbitrage'])} arbitrage, {len(flags['middles'])} middles, "
+          f"{len(flags['stale'])} stale")
+
+    for arb in flags["arbitrage"][:limit]:
+        legs = ", ".join(f"{l['selection']} @ {l['odds']} ({l['bookmaker']}, {l['stake']:.1%})" for l in arb["legs"])
+        print(f"  ARB {arb['match_id']} {arb['market_type']}: {arb['profit']:.2%} - {legs}")
+    for middle in flags["middles"][:limit]:
+        legs = ", ".join(f"{l['selection']} {l['line']} @ {l['odds']} ({l['bookmaker']})" for l in middle["legs"])
+        print(f"  MIDDLE {middle['match_id']} {middle['market_type']}: width {middle['width']}, "
+              f"cost {middle['cost']:.2%} - {legs}")
+    for line in flags["stale"][:limit]:
+        lag = " (lagging)" if line["lagging"] else ""
+        print(f"  STALE {line['match_id']} {line['market_type']} {line['selection']} {line['line'] or ''} "
+              f"@ {line['odds']} ({line['bookmaker']}) vs fair {line['fair_odds']:.3f}: "
+              f"{line['edge']:.2%}{lag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-bookmaker line scanner")
+    parser.add_argument("--live", action="store_true", help="Poll OddsPapi live odds")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between polls")
+    args = parser.parse_args()
+
+    book = BestPriceBook()
+
+    if not args.live:
+        rows = list(Database().get_latest_odds())
+        started = time.perf_counter()
+        touched = book.update(rows)
+        _report(book.scan(touched), book, time.perf_counter() - started)
+        return
+
+    fetcher = OddsPapiFetcher()
+    try:
+        while True:
+            rows = fetcher.fetch_cs2_odds("live")
+            started = time.perf_counter()
+            # Each poll is every live price on offer
+            touched = book.apply_snapshot(rows)
+            _report(book.scan(touched), book, time.perf_counter() - started)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fetcher.close()
+
+
+if __name__ == "__main__":
+    main()
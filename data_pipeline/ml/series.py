@@ -0,0 +1,314 @@
+"""
+Monte Carlo series simulator for BO1/BO2/BO3/BO5 markets
+
+Per-map win probabilities (team Elo from ratings.py, adjusted by each
+team's time-decayed record on the map from team_index.py) drive a
+veto-aware simulation of every upcoming match at once:
+
+    veto      coin toss for who starts, then the format's ban/pick order
+              over the map pool; each team picks its strongest remaining
+              map and bans its weakest, judged through per-simulation noise
+              so vetoes vary the way real ones do
+    maps      the picked maps and the decider are played in order until
+              the series is decided; a per-simulation strength shock
+              correlates map results within a series (form on the day)
+
+Vetoes and shocks are drawn as VETO_SCENARIOS scenarios per match; each of
+the n_sims series replays a random scenario, so every draw for a chunk of
+matches is one batched NumPy operation and 100k series per match across a
+slate take well under a second. The score distribution per match prices
+match winner, correct score, map handicaps and total maps.
+
+Usage:
+    python series.py --sims 100000
+"""
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ratings import TeamRatingEngine
+from team_index import TeamStrengthIndex, MAP_HALF_LIFE_DAYS, _read
+
+sys.path.append('..')
+from database import Database
+
+
+# Active duty pool, by normalised map name (see map_key)
+MAP_POOL = ("ancient", "anubis", "dust2", "inferno", "mirage", "nuke", "train")
+
+DEFAULT_SIMULATIONS = 100_000
+
+# Logit shift per unit of (shrunk) map win-rate edge
+MAP_EDGE_WEIGHT = 2.0
+# Pseudo-maps of 50% record blended into each team's map record
+MAP_PRIOR_WEIGHT = 5.0
+# Noise on each team's map preferences during the veto (logit scale)
+VETO_NOISE = 0.35
+# Per-simulation series strength shock (logit scale)
+SERIES_SHOCK_SD = 0.25
+
+# Veto and series-shock draws per match; each simulated series replays one
+# at random, so the veto costs the same however many series are simulated
+VETO_SCENARIOS = 8192
+
+# Simulated series (matches x simulations) per batch, bounding memory
+CHUNK_ROWS = 2_000_000
+
+BAN, PICK = 0, 1
+TEAM_A, TEAM_B = 0, 1
+
+
+def map_key(name: str) -> str:
+    """'de_mirage', 'Mirage' and 'mirage' all map to 'mirage'"""
+    key = str(name).strip().lower().replace(" ", "")
+    return key[3:] if key.startswith("de_") else key
+
+
+def veto_steps(best_of: int, pool_size: int = len(MAP_POOL)) -> List[Tuple[int, int]]:
+    """(action, team) per veto step; the last remaining map is the decider"""
+    if best_of == 2:
+        return [(BAN, TEAM_A), (BAN, TEAM_B), (PICK, TEAM_A), (PICK, TEAM_B)]
+
+    steps = [(BAN, TEAM_A), (BAN, TEAM_B)] if best_of > 1 else []
+    picks = max(best_of - 1, 0)
+    steps += [(PICK, TEAM_A if i % 2 == 0 else TEAM_B) for i in range(picks)]
+    # Alternate bans until one map is left
+    while pool_size - len(steps) > 1:
+        steps.append((BAN, TEAM_A if len(steps) % 2 == 0 else TEAM_B))
+    if pool_size - len(steps) != 1:
+        raise ValueError(f"A pool of {pool_size} maps cannot host a BO{best_of} veto")
+    return steps
+
+
+def _logit(p: np.ndarray) -> np.ndarray:
+    p = np.clip(p, 1e-6, 1 - 1e-6)
+    return np.log(p / (1.0 - p))
+
+
+# ==================== MAP PROBABILITIES ====================
+def map_win_matrix(
+    ratings: TeamRatingEngine,
+    index: TeamStrengthIndex,
+    matches: List[dict],
+    now: float,
+    pool: Tuple[str, ...] = MAP_POOL
+) -> np.ndarray:
+    """Team 1's win probability on each pool map, (matches x maps)"""
+    # Raw map names as stored in the index, per team and normalised name
+    names: Dict[str, Dict[str, str]] = {}
+
+    def shrunk_edge(team_id: str, key: str) -> float:
+        raw = names.setdefault(team_id, {
+            map_key(n): n for n in index.team_maps.get(team_id, ())
+        }).get(key)
+        if raw is None:
+            return 0.0
+        win_rate, _, _, weight = _read(index.maps.get((team_id, raw)), now, MAP_HALF_LIFE_DAYS)
+        return (win_rate - 0.5) * weight / (weight + MAP_PRIOR_WEIGHT)
+
+    logits = np.empty((len(matches), len(pool)))
+    for i, match in enumerate(matches):
+        team1, team2 = match["team1_id"], match["team2_id"]
+        base = (ratings.rating(team1) - ratings.rating(team2)) * np.log(10.0) / 400.0
+        for j, key in enumerate(pool):
+            logits[i, j] = base + MAP_EDGE_WEIGHT * (shrunk_edge(team1, key) - shrunk_edge(team2, key))
+    return 1.0 / (1.0 + np.exp(-logits))
+
+
+# ==================== SIMULATION ====================
+class SeriesSimulator:
+    """Batched veto and series simulation over many matches"""
+
+    def __init__(
+        self,
+        n_sims: int = DEFAULT_SIMULATIONS,
+        seed: Optional[int] = None,
+        veto_noise: float = VETO_NOISE,
+        series_shock: float = SERIES_SHOCK_SD
+    ):
+        self.n_sims = n_sims
+        self.rng = np.random.default_rng(seed)
+        self.veto_noise = veto_noise
+        self.series_shock = series_shock
+
+    def score_distribution(self, map_probs: np.ndarray, best_of: int) -> np.ndarray:
+        """
+        Probability of each final score for matches of one format:
+        (matches x (maps_to_win + 1) x (maps_to_win + 1)), indexed
+        [match, team1 maps, team2 maps]
+        """
+        map_probs = np.atleast_2d(map_probs)
+        n_matches, pool_size = map_probs.shape
+        steps = veto_steps(best_of, pool_size)
+        need = 2 if best_of == 2 else best_of // 2 + 1
+        size = need + 1
+
+        counts = np.zeros((n_matches, size * size))
+        per_chunk = max(CHUNK_ROWS // self.n_sims, 1)
+        for start in range(0, n_matches, per_chunk):
+            chunk = map_probs[start:start + per_chunk]
+            played = self._scenarios(chunk, best_of, steps)
+            scores = self._play(played, need)
+            rows = np.repeat(np.arange(len(chunk)), self.n_sims)
+            counts[start:start + len(chunk)] = np.bincount(
+                rows * size * size + scores, minlength=len(chunk) * size * size
+            ).reshape(len(chunk), -1)
+
+        return (counts / self.n_sims).reshape(n_matches, size, size)
+
+    def _scenarios(self, map_probs: np.ndarray, best_of: int, steps: List[Tuple[int, int]]) -> np.ndarray:
+        """
+        Team 1's win probability on each map played, in order, for
+        VETO_SCENARIOS vetoes and series shocks per match:
+        (matches x scenarios x maps)
+        """
+        n_matches, pool_size = map_probs.shape
+        n = n_matches * VETO_SCENARIOS
+        logit = np.repeat(_logit(map_probs).astype(np.float32), VETO_SCENARIOS, axis=0)
+
+        # Each team's noisy view of its own strength per map
+        noise = self.rng.standard_normal((2, n, pool_size), dtype=np.float32) * self.veto_noise
+        view1, view2 = logit + noise[0], -logit + noise[1]
+        # Coin toss for who starts the veto
+        a_is_team1 = (self.rng.random(n, dtype=np.float32) < 0.5)[:, None]
+        views = {TEAM_A: np.where(a_is_team1, view1, view2), TEAM_B: np.where(a_is_team1, view2, view1)}
+
+        taken = np.zeros((n, pool_size), dtype=np.float32)
+        rows = np.arange(n)
+        played = []
+        for action, team in steps:
+            # Picks take the strongest map, bans remove the weakest
+            view = views[team] if action == PICK else -views[team]
+            choice = np.argmax(view - taken, axis=1)
+            taken[rows, choice] = np.inf
+            if action == PICK:
+                played.append(choice)
+        if best_of != 2:
+            played.append(np.argmin(taken, axis=1))
+        played = np.stack(played, axis=1)
+
+        # Series shock shared by all maps of a simulated series
+        shock = self.rng.standard_normal((n, 1), dtype=np.float32) * self.series_shock
+        map_logit = np.take_along_axis(logit, played, axis=1) + shock
+        return (1.0 / (1.0 + np.exp(-map_logit))).reshape(n_matches, VETO_SCENARIOS, -1)
+
+    def _play(self, scenarios: np.ndarray, need: int) -> np.ndarray:
+        """Final score code (team1 * (need + 1) + team2) per simulated series"""
+        n_matches, n_scenarios, n_maps = scenarios.shape
+        drawn = self.rng.integers(0, n_scenarios, size=(n_matches, self.n_sims))
+        p = np.take_along_axis(scenarios, drawn[:, :, None], axis=1).reshape(-1, n_maps)
+        team1_wins = self.rng.random(p.shape, dtype=np.float32) < p
+
+        # Maps are played until either team reaches `need`
+        won1 = np.zeros(len(p), dtype=np.int64)
+        won2 = np.zeros(len(p), dtype=np.int64)
+        for k in range(n_maps):
+            live = (won1 < need) & (won2 < need)
+            won1 += team1_wins[:, k] & live
+            won2 += ~team1_wins[:, k] & live
+        return won1 * (need + 1) + won2
+
+
+# ==================== MARKETS ====================
+def series_markets(scores: np.ndarray, best_of: int) -> Dict:
+    """
+    Fair probabilities for one match's score distribution
+    ([team1 maps, team2 maps] -> probability)
+    """
+    size = scores.shape[0]
+    team1_maps, team2_maps = np.indices(scores.shape)
+    margin = team1_maps - team2_maps
+    maps_played = team1_maps + team2_maps
+    nonzero = scores > 0
+
+    correct_score = {
+        f"{a}-{b}": float(scores[a, b])
+        for a, b in zip(*np.nonzero(nonzero))
+    }
+    markets = {
+        "team1_win": float(scores[margin > 0].sum()),
+        "team2_win": float(scores[margin < 0].sum()),
+        "correct_score": correct_score,
+        "handicap": {},
+        "total_maps": {},
+    }
+    if best_of == 2:
+        markets["draw"] = float(scores[margin == 0].sum())
+
+    # Team 1 map handicaps at every half line the format allows
+    max_margin = size - 1
+    for line in np.arange(-max_margin + 0.5, max_margin, 1.0):
+        markets["handicap"][f"{line:+.1f}"] = float(scores[margin + line > 0].sum())
+
+    # Over probabilities for total maps
+    if best_of > 2:
+        min_maps, max_maps = best_of // 2 + 1, best_of
+        for line in np.arange(min_maps + 0.5, max_maps, 1.0):
+            markets["total_maps"][f"{line:.1f}"] = float(scores[nonzero & (maps_played > line)].sum())
+
+    return markets
+
+
+def price_slate(
+    matches: List[dict],
+    map_probs: np.ndarray,
+    simulator: SeriesSimulator = None
+) -> List[Dict]:
+    """Series markets for every match, one batched simulation per format"""
+    simulator = simulator or SeriesSimulator()
+    best_of = np.array([m.get("best_of") or 3 for m in matches])
+
+    results: List[Optional[Dict]] = [None] * len(matches)
+    for fmt in np.unique(best_of):
+        idx = np.flatnonzero(best_of == fmt)
+        scores = simulator.score_distribution(map_probs[idx], int(fmt))
+        for i, dist in zip(idx, scores):
+            results[i] = {
+                "match_id": matches[i].get("id"),
+                "best_of": int(fmt),
+                **series_markets(dist, int(fmt)),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Price series markets for upcoming matches")
+    parser.add_argument("--sims", type=int, default=DEFAULT_SIMULATIONS)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    db = Database()
+    history = list(db.get_finished_matches(include_raw=True))
+    ratings, index = TeamRatingEngine(), TeamStrengthIndex()
+    ratings.replay(history)
+    index.replay(history)
+
+    matches = [m for m in db.get_upcoming_matches() if m.get("team1_id") and m.get("team2_id")]
+    if not matches:
+        print("No upcoming matches")
+        return
+
+    now = datetime.now(timezone.utc).timestamp()
+    started = time.perf_counter()
+    priced = price_slate(matches, map_win_matrix(ratings, index, matches, now),
+                         SeriesSimulator(args.sims, args.seed))
+    print(f"Simulated {len(matches)} matches x {args.sims} series in {time.perf_counter() - started:.2f}s")
+
+    for match, prices in zip(matches, priced):
+        team1 = (match.get("team1") or {}).get("name", match["team1_id"])
+        team2 = (match.get("team2") or {}).get("name", match["team2_id"])
+        scores = ", ".join(f"{s} {p:.1%}" for s, p in prices["correct_score"].items())
+        print(f"\n{team1} vs {team2} (BO{prices['best_of']}): "
+              f"{prices['team1_win']:.1%} / {prices['team2_win']:.1%}")
+        print(f"  Correct score: {scores}")
+        if prices["total_maps"]:
+            totals = ", ".join(f"over {line} {p:.1%}" for line, p in prices["total_maps"].items())
+            print(f"  Total maps: {totals}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""
+Local prediction service
+
+Long-lived HTTP server (localhost only) that keeps the Supabase client,
+online feature state, ratings and models warm between requests. Concurrent
+prop and match requests are coalesced into micro-batches, so the model is
+called once per batch rather than once per request. State that the sync
+updates in other processes is refreshed every --refresh-seconds: the online
+feature state when its file changed, and the ratings and team index by
+folding in matches written as finished since the last refresh. Players
+seeded from the DB are reseeded once their seed is older than that.
+
+Endpoints:
+    POST /predict/prop   {"player_id", "prop_type", "line"}
+    POST /predict/match  {"team1_id", "team2_id", "best_of"}
+    POST /predict/slate  {"match_id"}  (optional; full predict_player_props run)
+    GET  /metrics        request counts, p50/p99 latency, batch sizes
+    GET  /health
+
+Usage:
+    python service.py --port 8765 --refresh-seconds 300
+"""
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.append('..')
+from predict import Predictor
+from online_features import OnlineFeatureStore, DEFAULT_STATE_PATH
+from ratings import TeamRatingEngine
+from team_index import TeamStrengthIndex
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Micro-batching: flush when this many requests are queued or the oldest
+# has waited this long
+MAX_BATCH_SIZE = 256
+MAX_BATCH_WAIT = 0.002
+
+# Latency samples kept per endpoint for percentiles
+LATENCY_WINDOW = 10000
+
+REQUEST_TIMEOUT = 30.0
+
+# Seconds between checks for newer feature state and match results (also
+# how long a player's seeded feature state is served before a reseed)
+REFRESH_SECONDS = 300.0
+
+
+class BadRequest(Exception):
+    """Request body missing a field or holding an unusable value (HTTP 400)"""
+
+
+class NotFound(Exception):
+    """Nothing to predict from for the requested entity (HTTP 404)"""
+
+
+def _require(body: Dict, *fields: str) -> Dict:
+    """Check the body is a JSON object holding `fields`"""
+    if not isinstance(body, dict):
+        raise BadRequest("body must be a JSON object")
+    missing = [f for f in fields if body.get(f) in (None, "")]
+    if missing:
+        raise BadRequest(f"missing {', '.join(missing)}")
+    return body
+
+
+class LatencyTracker:
+    """Rolling request latencies per endpoint"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, np.ndarray] = {}
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, ok: bool = True):
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = np.empty(self.window)
+                self._counts[endpoint] = self._errors[endpoint] = 0
+            samples[self._counts[endpoint] % self.window] = seconds * 1000.0
+            self._counts[endpoint] += 1
+            if not ok:
+                self._errors[endpoint] += 1
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            result = {}
+            for endpoint, samples in self._samples.items():
+                count = self._counts[endpoint]
+                recent = samples[:min(count, self.window)]
+                p50, p99 = np.percentile(recent, [50, 99])
+                result[endpoint] = {
+                    "requests": count,
+                    "errors": self._errors[endpoint],
+                    "p50_ms": round(float(p50), 3),
+                    "p99_ms": round(float(p99), 3),
+                    "max_ms": round(float(recent.max()), 3),
+                }
+            return result
+
+
+class _Pending:
+    __slots__ = ("item", "done", "result", "error")
+
+    def __init__(self, item):
+        self.item = item
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[Exception] = None
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads and scores them together.
+    `score_batch` takes a list of items and returns one result per item.
+    """
+
+    def __init__(
+        self,
+        score_batch: Callable[[List], List],
+        max_batch: int = MAX_BATCH_SIZE,
+        max_wait: float = MAX_BATCH_WAIT
+    ):
+        self.score_batch = score_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, item, timeout: float = REQUEST_TIMEOUT):
+        """Queue an item and block until its batch has been scored"""
+        pending = _Pending(item)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Prediction batch timed out")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                results = self.score_batch([p.item for p in batch])
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                self.batches += 1
+                self.items += len(batch)
+                for pending in batch:
+                    pending.done.set()
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+def _matrix(model, rows: List[Dict]):
+    """Scaled feature matrix for a batch of feature dicts (missing -> 0)"""
+    X = np.array(
+        [[row.get(col) for col in model.feature_columns] for row in rows],
+        dtype=np.float64
+    )
+    X = np.nan_to_num(X, nan=0.0)
+    if hasattr(model.scaler, "feature_names_in_"):
+        # sklearn scalers fitted on a frame expect one back
+        X = pd.DataFrame(X, columns=model.feature_columns)
+    return model.scaler.transform(X)
+
+
+class PredictionService:
+    """Warm predictor state plus batched scoring for the HTTP handler"""
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS):
+        self.predictor = Predictor()
+        self.predictor.online_store.max_seed_age = refresh_seconds
+        self.predictor.load_models()
+        self.match_model = None
+        self.latency = LatencyTracker()
+        # Slates swap in a bulk stats cache; one at a time
+        self._slate_lock = threading.Lock()
+        self._ratings_lock = threading.Lock()
+        self._ratings_loaded = False
+        self._ratings_watermark: Optional[str] = None
+        self.refresh_seconds = refresh_seconds
+        self._refresh_lock = threading.Lock()
+        self._refreshed_at = time.monotonic()
+        self._state_mtime = _mtime(DEFAULT_STATE_PATH)
+        self.prop_batcher = MicroBatcher(self._score_props)
+        self.match_batcher = MicroBatcher(self._score_matches)
+
+    # ==================== BATCH SCORING ====================
+    # Each batch returns (probability, model version) pairs from one model
+    # object, so a hot swap mid-request cannot mislabel a response
+    def _score_props(self, rows: List[Dict]) -> List[Tuple[float, str]]:
+        # Cheap when nothing changed; picks up newly promoted versions
+        self.predictor.load_models()
+        model = self.predictor.kills_model
+        if model is None:
+            raise RuntimeError("No kills model registered")
+        return [(p, model.version) for p in model.predict_proba(_matrix(model, rows)).tolist()]
+
+    def _score_matches(self, rows: List[Dict]) -> List[Tuple[float, str]]:
+        version = self.predictor.registry.resolve("match")
+        if version is None:
+            raise RuntimeError("No match model registered")
+        model = self.match_model
+        if model is None or model.version != version:
+            model = self.match_model = self.predictor.registry.load("match", version)
+        return [(p, model.version) for p in model.predict_proba(_matrix(model, rows)).tolist()]
+
+    # ==================== REFRESH ====================
+    def refresh(self, force: bool = False):
+        """
+        Reload state other processes update, at most every refresh_seconds:
+        the online feature state when the sync saved a newer file, and the
+        ratings and team index (if loaded) with newly finished matches.
+        One request thread refreshes; the others keep using the old state.
+        """
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._refreshed_at = time.monotonic()
+            feature_eng = self.predictor.feature_eng
+
+            mtime = _mtime(DEFAULT_STATE_PATH)
+            if mtime != self._state_mtime:
+                store = OnlineFeatureStore.load()
+                store.max_seed_age = self.refresh_seconds
+                self.predictor.online_store = self.predictor.db.feature_state = feature_eng.online_store = store
+                self._state_mtime = mtime
+            # A slate's bulk cache is a snapshot from when the slate ran
+            feature_eng.stats_cache = None
+
+            if self._ratings_loaded:
+                self._update_ratings()
+        finally:
+            self._refresh_lock.release()
+
+    def _load_ratings(self):
+        """Replay finished matches into fresh rating and index objects, then swap them in"""
+        matches = list(self.predictor.db.get_finished_matches(include_raw=True))
+        ratings, index = TeamRatingEngine(), TeamStrengthIndex()
+        ratings.replay(matches)
+        index.replay(matches)
+        self._ratings_watermark = max((m["updated_at"] for m in matches if m.get("updated_at")), default=None)
+        self.predictor.feature_eng.ratings = ratings
+        self.predictor.feature_eng.team_index = index
+
+    def _update_ratings(self):
+        """Fold matches finished (or written) since the last load into the live ratings and index"""
+        if self._ratings_watermark is None:
+            self._load_ratings()
+            return
+        matches = list(self.predictor.db.get_finished_matches(
+            include_raw=True, updated_since=self._ratings_watermark
+        ))
+        feature_eng = self.predictor.feature_eng
+        # Both skip matches they have already seen (the watermark is inclusive)
+        for match in matches:
+            feature_eng.ratings.update(match)
+            feature_eng.team_index.add_match(match)
+        self._ratings_watermark = max(
+            [self._ratings_watermark] + [m["updated_at"] for m in matches if m.get("updated_at")]
+        )
+
+    def _ensure_ratings(self):
+        """Replay match history on first use (refresh() keeps it current)"""
+        if self._ratings_loaded:
+            return
+        with self._ratings_lock:
+            if not self._ratings_loaded:
+                self._load_ratings()
+                self._ratings_loaded = True
+
+    # ==================== REQUESTS ====================
+    def predict_prop(self, body: Dict) -> Dict:
+        _require(body, "player_id", "line")
+        player_id, prop_type = body["player_id"], body.get("prop_type", "kills")
+        try:
+            line = float(body["line"])
+        except (TypeError, ValueError):
+            raise BadRequest(f"line must be a number, got {body['line']!r}")
+        self.refresh()
+        # No lock: the DB client is thread-safe and online state is only
+        # published once fully seeded
+        features = self.predictor.feature_eng.get_player_prop_features(
+            player_id=player_id, prop_type=prop_type, line=line
+        )
+        if not features:
+            raise NotFound(f"No stats for player {player_id}")
+
+        proba, version = self.prop_batcher.submit(features)
+        return {
+            "player_id": player_id,
+            "prop_type": prop_type,
+            "line": line,
+            "over_probability": proba,
+            "under_probability": 1.0 - proba,
+            "model_version": version,
+        }
+
+    def predict_match(self, body: Dict) -> Dict:
+        _require(body, "team1_id", "team2_id")
+        self.refresh()
+        self._ensure_ratings()
+        features = self.predictor.feature_eng.get_match_features(
+            body["team1_id"], body["team2_id"],
+            match_id=body.get("match_id"), best_of=body.get("best_of")
+        )
+        proba, version = self.match_batcher.submit(features)
+        return {
+            "team1_id": body["team1_id"],
+            "team2_id": body["team2_id"],
+            "team1_win_probability": proba,
+            "elo_win_probability": features.get("elo_win_prob"),
+            "model_version": version,
+        }
+
+    def predict_slate(self, body: Dict) -> Dict:
+        _require(body)
+        self.refresh()
+        with self._slate_lock:
+            try:
+                predictions = self.predictor.predict_player_props(body.get("match_id"))
+            finally:
+                # Single prop requests go back to online state / the DB
+                self.predictor.feature_eng.stats_cache = None
+        return {"count": len(predictions), "predictions": predictions}
+
+    def metrics(self) -> Dict:
+        return {
+            "latency": self.latency.summary(),
+            "prop_batches": self.prop_batcher.stats(),
+            "match_batches": self.match_batcher.stats(),
+            "kills_model": self.predictor.kills_model.version if self.predictor.kills_model else None,
+        }
+
+
+def _mtime(path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for bursts of concurrent clients (socketserver's default is 5)
+    request_queue_size = 128
+
+
+def make_handler(service: PredictionService):
+    routes = {
+        "/predict/prop": service.predict_prop,
+        "/predict/match": service.predict_match,
+        "/predict/slate": service.predict_slate,
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, payload: Dict):
+            data = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                self._send(200, service.metrics())
+            else:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            route = routes.get(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b"{}"
+            if route is None:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+                return
+
+            started = time.perf_counter()
+            ok = False
+            try:
+                result = route(json.loads(raw or b"{}"))
+                ok = True
+                self._send(200, result)
+            except (BadRequest, json.JSONDecodeError) as e:
+                self._send(400, {"error": f"Bad request: {e}"})
+            except NotFound as e:
+                self._send(404, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+            finally:
+                service.latency.record(self.path, time.perf_counter() - started, ok)
+
+        def log_message(self, format, *args):
+            # Per-request logging would dominate latency at high rates
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local CS2 prediction service")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--refresh-seconds", type=float, default=REFRESH_SECONDS,
+                        help="How often to pick up newer feature state and match results")
+    args = parser.parse_args()
+
+    print("Warming prediction service...")
+    service = PredictionService(refresh_seconds=args.refresh_seconds)
+    server = PredictionServer((args.host, args.port), make_handler(service))
+    print(f"Serving predictions on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
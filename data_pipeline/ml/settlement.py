@@ -0,0 +1,139 @@
+"""
+Prediction settlement
+
+Finds unsettled predictions whose matches have finished, computes their
+outcomes in bulk and writes them back with set-based updates:
+
+    player_<stat>_over  actual_result = match total of the stat (per-map
+                        stats summed); correct when the over/under call
+                        (predicted_value >= 0.5) matches; a push is settled
+                        with was_correct left empty
+    match_winner        actual_result = 1 if team1 won; predicted_value is
+                        team1's win probability
+
+Each chunk is settled by the settle_cs2_predictions function, which also
+folds the chunk into cs2_model_performance (running settled/correct counts,
+log-loss and Brier sums per model version), so a run costs one read of
+unsettled predictions, one stats read per 200 matches and one write per
+1000 predictions.
+
+Only matches written in the last SETTLE_GRACE_DAYS are considered: a
+prediction whose player stats never arrive (or whose match is never
+decided) drops out of the read after that, instead of being re-read on
+every run. A full sync that rewrites an old match gives its predictions
+another chance.
+
+Usage:
+    python settlement.py
+"""
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.append('..')
+from database import Database
+
+
+PROB_CLIP = 1e-6
+
+# Days after a match's last write during which its predictions are retried
+SETTLE_GRACE_DAYS = 7
+
+
+def compute_settlements(predictions: List[dict], stats: List[dict]) -> List[Dict]:
+    """Settlement rows for predictions whose outcome is known"""
+    if not predictions:
+        return []
+
+    preds = pd.DataFrame(predictions)
+    match = pd.json_normalize(preds["match"].tolist())
+    preds["team1_id"] = match.get("team1_id")
+    preds["winner_id"] = match.get("winner_id")
+    preds["p"] = pd.to_numeric(preds["predicted_value"], errors="coerce")
+    preds["line"] = pd.to_numeric(preds["line"], errors="coerce")
+    preds["prop_type"] = preds["prop_type"].fillna(
+        preds["prediction_type"].str.extract(r"^player_(\w+)_over$")[0]
+    )
+
+    # Player props: match totals of each stat
+    totals = pd.DataFrame(stats, columns=["match_id", "player_id", "kills", "deaths", "assists"])
+    totals = totals.groupby(["match_id", "player_id"], as_index=False)[["kills", "deaths", "assists"]].sum()
+    totals = totals.melt(["match_id", "player_id"], var_name="prop_type", value_name="actual")
+    props = preds[preds["player_id"].notna()].merge(totals, on=["match_id", "player_id", "prop_type"], how="inner")
+    props = props[props["line"].notna()]
+    props["outcome"] = np.where(props["actual"] == props["line"], np.nan,
+                                (props["actual"] > props["line"]).astype(np.float64))
+
+    # Match winner: team1 won?
+    winners = preds[(preds["prediction_type"] == "match_winner") & preds["winner_id"].notna()].copy()
+    winners["actual"] = (winners["winner_id"] == winners["team1_id"]).astype(np.float64)
+    winners["outcome"] = winners["actual"]
+
+    settled = pd.concat([props, winners], ignore_index=True)
+    settled = settled[settled["p"].notna()]
+    if settled.empty:
+        return []
+
+    p = np.clip(settled["p"].to_numpy(dtype=np.float64), PROB_CLIP, 1 - PROB_CLIP)
+    y = settled["outcome"].to_numpy(dtype=np.float64)
+    decided = ~np.isnan(y)
+    correct = (p >= 0.5) == (y == 1.0)
+    with np.errstate(invalid="ignore"):
+        log_loss = -(y * np.log(p) + (1 - y) * np.log(1 - p))
+        brier = (p - y) ** 2
+
+    return [
+        {
+            "id": pid,
+            "actual_result": float(actual),
+            "was_correct": bool(ok) if dec else None,
+            "log_loss": float(ll) if dec else None,
+            "brier": float(b) if dec else None,
+        }
+        for pid, actual, ok, dec, ll, b in zip(
+            settled["id"], settled["actual"], correct, decided, log_loss, brier
+        )
+    ]
+
+
+def settle(db: Database, grace_days: int = SETTLE_GRACE_DAYS) -> int:
+    """Settle finished, unsettled predictions on recently written matches; returns rows settled"""
+    since = (datetime.now(timezone.utc) - timedelta(days=grace_days)).isoformat()
+    predictions = db.get_unsettled_predictions(updated_since=since)
+    if not predictions:
+        print("  No predictions to settle")
+        return 0
+
+    match_ids = sorted({p["match_id"] for p in predictions if p.get("player_id") and p.get("match_id")})
+    stats = list(db.get_player_match_stats(match_ids)) if match_ids else []
+    settlements = compute_settlements(predictions, stats)
+    settled = db.settle_predictions(settlements)
+
+    print(f"  Settled {settled} of {len(predictions)} finished predictions "
+          f"({len(predictions) - len(settlements)} without results yet)")
+    return settled
+
+
+def print_performance(db: Database):
+    for row in db.get_model_performance():
+        scored = row.get("scored") or 0
+        if not scored:
+            continue
+        print(f"  {row['model_version']} {row['prediction_type']}: {scored} scored, "
+              f"accuracy {row['correct'] / scored:.2%}, "
+              f"log loss {row['log_loss_sum'] / scored:.4f}, "
+              f"Brier {row['brier_sum'] / scored:.4f}")
+
+
+def main():
+    print("=== Prediction Settlement ===")
+    db = Database()
+    settle(db)
+    print_performance(db)
+
+
+if __name__ == "__main__":
+    main()
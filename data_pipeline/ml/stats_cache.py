@@ -0,0 +1,241 @@
+"""
+Compact array-backed cache of recent player stats
+
+All players' recent map rows live in a handful of contiguous typed NumPy
+columns, grouped by player (newest first) and addressed through an offsets
+array. Features for a full slate are computed with segment reductions over
+those columns instead of per-player DataFrames.
+"""
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from online_features import ewma_weights
+
+
+# Column name -> storage dtype. float32 holds the counts exactly and keeps
+# missing values as NaN, so they are skipped like pandas does instead of
+# counting as zeros.
+CACHE_COLUMNS = {
+    "kills": np.float32,
+    "deaths": np.float32,
+    "assists": np.float32,
+    "adr": np.float32,
+    "rating": np.float32,
+    "headshot_percentage": np.float32,
+}
+
+# Rows kept per player (matches FeatureEngineer's limit=30)
+ROWS_PER_PLAYER = 30
+
+
+def typed_column(name: str, values: Iterable) -> np.ndarray:
+    """Stat values (None for missing) as the cache's storage dtype, NaN for missing"""
+    return np.array([np.nan if v is None else v for v in values], dtype=CACHE_COLUMNS[name])
+
+
+class PlayerStatsCache:
+    """
+    In-memory stat history for many players.
+
+    Rows for player i are `offsets[i]:offsets[i + 1]` in every column,
+    newest first.
+    """
+
+    def __init__(self, player_ids: List[str], offsets: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.player_ids = list(player_ids)
+        self.index = {p: i for i, p in enumerate(self.player_ids)}
+        self.offsets = offsets
+        self.columns = columns
+        self.counts = np.diff(offsets)
+        # Owning player index for every row, used by the segment reductions
+        self.owner = np.repeat(np.arange(len(self.player_ids)), self.counts)
+        # Position of each row within its player's history (0 = newest)
+        self.position = np.arange(len(self.owner)) - np.repeat(offsets[:-1], self.counts)
+        self._features = None
+
+    def __contains__(self, player_id: str) -> bool:
+        return player_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.player_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self.columns.values()) + self.offsets.nbytes
+
+    # ==================== BUILDING ====================
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict], per_player: int = ROWS_PER_PLAYER) -> "PlayerStatsCache":
+        """
+        Build from stat rows ordered by player, newest first (the order
+        Database.get_recent_player_stats_bulk returns). Extra rows beyond
+        `per_player` are dropped as they stream in.
+        """
+        player_ids: List[str] = []
+        counts: List[int] = []
+        buffers = {name: [] for name in CACHE_COLUMNS}
+
+        current = None
+        for row in rows:
+            player_id = row["player_id"]
+            if player_id != current:
+                current = player_id
+                player_ids.append(player_id)
+                counts.append(0)
+            if counts[-1] >= per_player:
+                continue
+            counts[-1] += 1
+            for name, values in buffers.items():
+                values.append(row.get(name))
+
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        columns = {name: typed_column(name, buffers.pop(name)) for name in CACHE_COLUMNS}
+        return cls(player_ids, offsets, columns)
+
+    @classmethod
+    def before_rows(
+        cls,
+        keys: List[str],
+        columns: Dict[str, np.ndarray],
+        rows: np.ndarray,
+        positions: np.ndarray,
+        per_player: int = ROWS_PER_PLAYER
+    ) -> "PlayerStatsCache":
+        """
+        One entry per target row, holding the (up to `per_player`) rows
+        before it, newest first, so compute_features() gives the features
+        the serving paths had just before that row (for training).
+
+        `columns` hold every row grouped by player, oldest first; `rows` are
+        the targets' row numbers and `positions` their earlier row counts
+        within the player.
+        """
+        counts = np.minimum(positions, per_player)
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        step = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+        source = np.repeat(rows, counts) - 1 - step
+        return cls(keys, offsets, {name: col[source] for name, col in columns.items()})
+
+    @classmethod
+    def load(cls, db, player_ids: List[str] = None, per_player: int = ROWS_PER_PLAYER) -> "PlayerStatsCache":
+        """Bulk-load recent history for the given players (or all players)"""
+        rows = db.get_recent_player_stats_bulk(player_ids, columns=list(CACHE_COLUMNS), per_player=per_player)
+        return cls.from_rows(rows, per_player=per_player)
+
+    # ==================== ACCESS ====================
+    def player_slice(self, player_id: str) -> Optional[Dict[str, np.ndarray]]:
+        """Views (no copies) of a player's rows, newest first"""
+        i = self.index.get(player_id)
+        if i is None:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return {name: col[start:end] for name, col in self.columns.items()}
+
+    def over_rate(self, player_id: str, column: str, line: float, n: int = 20) -> Optional[float]:
+        """Share of the last n maps where `column` went over `line`"""
+        rows = self.player_slice(player_id)
+        if not rows or column not in rows or len(rows[column]) == 0:
+            return None
+        return float(np.mean(rows[column][:n] > line))
+
+    # ==================== FEATURES ====================
+    def _window_sum(self, values: np.ndarray, window: int):
+        """Per-player sum and count of non-NaN values in the newest `window` rows"""
+        valid = (self.position < window) & ~np.isnan(values)
+        n = len(self.player_ids)
+        total = np.bincount(self.owner, weights=np.where(valid, values, 0.0), minlength=n)
+        count = np.bincount(self.owner, weights=valid, minlength=n)
+        return total, count
+
+    def _window_mean(self, name: str, window: int) -> np.ndarray:
+        total, count = self._window_sum(self.columns[name].astype(np.float64), window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return total / count
+
+    def _window_std(self, name: str, window: int) -> np.ndarray:
+        """Sample standard deviation (ddof=1, same as pandas)"""
+        values = self.columns[name].astype(np.float64)
+        total, count = self._window_sum(values, window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+            dev = values - mean[self.owner]
+            sq, _ = self._window_sum(dev * dev, window)
+            std = np.sqrt(sq / (count - 1))
+        std[count < 2] = np.nan
+        return std
+
+    def _window_slope(self, name: str, window: int) -> np.ndarray:
+        """Least-squares slope over the newest `window` rows (oldest -> newest)"""
+        values = self.columns[name].astype(np.float64)
+        m = np.minimum(self.counts, window).astype(np.float64)
+        # x = 0 for the oldest row in the window, m - 1 for the newest
+        x = m[self.owner] - 1 - self.position
+        sy, _ = self._window_sum(values, window)
+        sxy, _ = self._window_sum(x * values, window)
+        sx = m * (m - 1) / 2
+        sxx = (m - 1) * m * (2 * m - 1) / 6
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = (m * sxy - sx * sy) / (m * sxx - sx * sx)
+        slope[m < 3] = 0
+        return slope
+
+    def _ewma(self, name: str) -> np.ndarray:
+        """Fast and slow EWMAs over each player's rows, shape (2, players)"""
+        values = self.columns[name].astype(np.float64)
+        valid = ~np.isnan(values)
+        weights = ewma_weights(self.position) * valid
+        n = len(self.player_ids)
+        total = [np.bincount(self.owner, weights=w * np.where(valid, values, 0.0), minlength=n) for w in weights]
+        weight = [np.bincount(self.owner, weights=w, minlength=n) for w in weights]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.array(total) / np.array(weight)
+
+    def compute_features(self) -> Dict[str, np.ndarray]:
+        """
+        Player features for every cached player at once, as columns aligned
+        with `self.player_ids` (same keys as FeatureEngineer.get_player_features)
+        """
+        kills10, _ = self._window_sum(self.columns["kills"].astype(np.float64), 10)
+        deaths10, _ = self._window_sum(self.columns["deaths"].astype(np.float64), 10)
+        ewma_fast, ewma_slow = self._ewma("kills")
+
+        return {
+            "last5_avg_kills": self._window_mean("kills", 5),
+            "last5_avg_deaths": self._window_mean("deaths", 5),
+            "last5_avg_assists": self._window_mean("assists", 5),
+            "last5_avg_rating": self._window_mean("rating", 5),
+            "last5_avg_adr": self._window_mean("adr", 5),
+            "last10_avg_kills": self._window_mean("kills", 10),
+            "last10_avg_deaths": self._window_mean("deaths", 10),
+            "last10_avg_assists": self._window_mean("assists", 10),
+            "last10_avg_rating": self._window_mean("rating", 10),
+            "kills_std": self._window_std("kills", 10),
+            "deaths_std": self._window_std("deaths", 10),
+            "assists_std": self._window_std("assists", 10),
+            "rating_std": self._window_std("rating", 10),
+            "kills_trend": self._window_slope("kills", 10),
+            "deaths_trend": self._window_slope("deaths", 10),
+            "assists_trend": self._window_slope("assists", 10),
+            "kills_ewma": ewma_fast,
+            "kills_ewma_trend": ewma_fast - ewma_slow,
+            "matches_count": self.counts.copy(),
+            "kd_ratio": kills10 / np.maximum(deaths10, 1),
+            "avg_hs_pct": self._window_mean("headshot_percentage", 10),
+        }
+
+    def get_player_features(self, player_id: str) -> Optional[Dict]:
+        """Feature dict for a single player"""
+        i = self.index.get(player_id)
+        if i is None or self.counts[i] == 0:
+            return None
+        if self._features is None:
+            self._features = self.compute_features()
+        features = {"player_id": player_id}
+        for name, values in self._features.items():
+            value = values[i]
+            features[name] = int(value) if name == "matches_count" else float(value)
+        return features
@@ -0,0 +1,267 @@
+"""
+Precomputed head-to-head, form and map-pool index for match features
+
+Aggregates are kept per unordered team pair, per team and per (team, map)
+as exponentially time-decayed sums. Adding a finished match is O(maps) and
+every lookup is O(1), so features for a whole slate come from dict reads
+instead of scans over cs2_matches / cs2_player_stats.
+
+Every update also keeps a snapshot of the aggregate, so lookups with
+`as_of` see only results from before that time (like
+TeamRatingEngine.rating_at) and training rows don't leak later matches.
+"""
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ratings import match_time, match_outcome
+
+
+DAY = 86400.0
+
+# Half-lives for the time decay
+H2H_HALF_LIFE_DAYS = 365.0
+FORM_HALF_LIFE_DAYS = 30.0
+MAP_HALF_LIFE_DAYS = 120.0
+
+# Aggregate slots: decayed wins, losses, map diff, round diff, weight, last update time
+WINS, LOSSES, MAP_DIFF, ROUND_DIFF, WEIGHT, UPDATED = range(6)
+
+
+def _decay(agg: List[float], now: float, half_life: float) -> float:
+    """Decay factor from an aggregate's last update to `now`"""
+    if now <= agg[UPDATED]:
+        return 1.0
+    return 0.5 ** ((now - agg[UPDATED]) / (half_life * DAY))
+
+
+def _add(agg: List[float], now: float, half_life: float, won: float, map_diff: float, round_diff: float):
+    factor = _decay(agg, now, half_life)
+    agg[WINS] = agg[WINS] * factor + won
+    agg[LOSSES] = agg[LOSSES] * factor + (1.0 - won)
+    agg[MAP_DIFF] = agg[MAP_DIFF] * factor + map_diff
+    agg[ROUND_DIFF] = agg[ROUND_DIFF] * factor + round_diff
+    agg[WEIGHT] = agg[WEIGHT] * factor + 1.0
+    agg[UPDATED] = max(agg[UPDATED], now)
+
+
+def _read(agg: Optional[List[float]], now: float, half_life: float) -> Tuple[float, float, float, float]:
+    """(win rate, avg map diff, avg round diff, decayed sample weight)"""
+    if agg is None or agg[WEIGHT] == 0:
+        return 0.5, 0.0, 0.0, 0.0
+    weight = agg[WEIGHT] * _decay(agg, now, half_life)
+    # Ratios are unaffected by the common decay factor
+    return (
+        agg[WINS] / agg[WEIGHT],
+        agg[MAP_DIFF] / agg[WEIGHT],
+        agg[ROUND_DIFF] / agg[WEIGHT],
+        weight,
+    )
+
+
+def extract_maps(match: dict) -> List[Tuple[str, float, float]]:
+    """
+    Per-map results from a match's raw_data as (map_name, team1_won, round_diff).
+    Handles PandaScore `games` and Abios `matches` shapes; maps without a name
+    or winner are skipped.
+    """
+    raw = match.get("raw_data") or {}
+
+    # Source team IDs in team1/team2 order
+    team_ids = [str(o.get("opponent", {}).get("id")) for o in raw.get("opponents", [])]
+    if not team_ids:
+        team_ids = [str((r.get("team") or {}).get("id")) for r in raw.get("rosters", [])]
+    if len(team_ids) < 2:
+        return []
+
+    maps = []
+    for game in raw.get("games") or raw.get("matches") or []:
+        map_name = (game.get("map") or {}).get("name")
+        winner = game.get("winner") or {}
+        winner_id = str(winner.get("id")) if isinstance(winner, dict) else str(winner)
+        if not map_name or winner_id not in team_ids[:2]:
+            continue
+
+        rounds = {}
+        for result in game.get("results") or []:
+            rounds[str(result.get("team_id"))] = result.get("score") or 0
+        round_diff = rounds.get(team_ids[0], 0) - rounds.get(team_ids[1], 0)
+
+        maps.append((map_name, 1.0 if winner_id == team_ids[0] else 0.0, float(round_diff)))
+
+    return maps
+
+
+class TeamStrengthIndex:
+    """Time-decayed head-to-head, recent form and map-pool aggregates"""
+
+    def __init__(self):
+        # (team_a, team_b) with team_a < team_b -> aggregate from team_a's side
+        self.pairs: Dict[Tuple[str, str], List[float]] = {}
+        self.form: Dict[str, List[float]] = {}
+        self.maps: Dict[Tuple[str, str], List[float]] = {}
+        # Maps each team has played, for map pool comparisons
+        self.team_maps: Dict[str, set] = {}
+        # (table, key) -> (update times, aggregate after each update)
+        self.history: Dict[tuple, Tuple[List[float], List[List[float]]]] = {}
+        # Match IDs already folded in, so a re-read match isn't counted twice
+        self.seen: set = set()
+
+    @staticmethod
+    def _new() -> List[float]:
+        return [0.0, 0.0, 0.0, 0.0, 0.0, float("-inf")]
+
+    def _get(self, table: str, key, as_of: float = None) -> Optional[List[float]]:
+        """Current aggregate, or the one from the last update strictly before `as_of`"""
+        if as_of is None:
+            return getattr(self, table).get(key)
+        times, aggs = self.history.get((table, key), ((), ()))
+        pos = bisect_left(times, as_of)
+        return aggs[pos - 1] if pos > 0 else None
+
+    # ==================== UPDATES ====================
+    def _update(self, table: str, key, now: float, half_life: float, *values):
+        agg = getattr(self, table).setdefault(key, self._new())
+        _add(agg, now, half_life, *values)
+        times, aggs = self.history.setdefault((table, key), ([], []))
+        pos = bisect_right(times, now)
+        times.insert(pos, now)
+        aggs.insert(pos, list(agg))
+
+    def add_match(self, match: dict, ts: float = None) -> bool:
+        """Fold one finished match into the index (once per match ID)"""
+        team1_id, team2_id = match.get("team1_id"), match.get("team2_id")
+        if not team1_id or not team2_id:
+            return False
+        match_id = match.get("id")
+        if match_id is not None and match_id in self.seen:
+            return False
+
+        won = match_outcome(match)
+        if won is None:
+            return False
+        score1 = match.get("team1_score") or 0
+        score2 = match.get("team2_score") or 0
+
+        now = match_time(match) if ts is None else ts
+        if now != now:
+            return False
+
+        maps = extract_maps(match)
+        map_diff = float(score1 - score2)
+        round_diff = sum(rd for _, _, rd in maps)
+
+        # Head-to-head, stored from the lower ID's perspective
+        if team1_id < team2_id:
+            key, sign, pair_won = (team1_id, team2_id), 1.0, won
+        else:
+            key, sign, pair_won = (team2_id, team1_id), -1.0, 1.0 - won
+        self._update("pairs", key, now, H2H_HALF_LIFE_DAYS,
+                     pair_won, sign * map_diff, sign * round_diff)
+
+        self._update("form", team1_id, now, FORM_HALF_LIFE_DAYS,
+                     won, map_diff, round_diff)
+        self._update("form", team2_id, now, FORM_HALF_LIFE_DAYS,
+                     1.0 - won, -map_diff, -round_diff)
+
+        for map_name, map_won, map_rounds in maps:
+            self._update("maps", (team1_id, map_name), now, MAP_HALF_LIFE_DAYS,
+                         map_won, 2 * map_won - 1, map_rounds)
+            self._update("maps", (team2_id, map_name), now, MAP_HALF_LIFE_DAYS,
+                         1.0 - map_won, 1 - 2 * map_won, -map_rounds)
+            self.team_maps.setdefault(team1_id, set()).add(map_name)
+            self.team_maps.setdefault(team2_id, set()).add(map_name)
+
+        if match_id is not None:
+            self.seen.add(match_id)
+        return True
+
+    # ==================== LOOKUPS ====================
+    # `as_of` limits a lookup to results from strictly before that time
+    def head_to_head(self, team1_id: str, team2_id: str, now: float, as_of: float = None) -> Dict:
+        """Decayed head-to-head record from team 1's perspective"""
+        if team1_id < team2_id:
+            win_rate, map_diff, round_diff, weight = _read(self._get("pairs", (team1_id, team2_id), as_of), now, H2H_HALF_LIFE_DAYS)
+        else:
+            win_rate, map_diff, round_diff, weight = _read(self._get("pairs", (team2_id, team1_id), as_of), now, H2H_HALF_LIFE_DAYS)
+            win_rate, map_diff, round_diff = 1.0 - win_rate, -map_diff, -round_diff
+        return {
+            "h2h_win_rate": win_rate,
+            "h2h_map_diff": map_diff,
+            "h2h_round_diff": round_diff,
+            "h2h_weight": weight,
+        }
+
+    def recent_form(self, team_id: str, now: float, as_of: float = None) -> Dict:
+        win_rate, map_diff, round_diff, weight = _read(self._get("form", team_id, as_of), now, FORM_HALF_LIFE_DAYS)
+        return {"win_rate": win_rate, "map_diff": map_diff, "round_diff": round_diff, "weight": weight}
+
+    def map_strength(self, team_id: str, map_name: str, now: float, as_of: float = None) -> Dict:
+        win_rate, _, round_diff, weight = _read(self._get("maps", (team_id, map_name), as_of), now, MAP_HALF_LIFE_DAYS)
+        return {"win_rate": win_rate, "round_diff": round_diff, "weight": weight}
+
+    def map_pool_diff(self, team1_id: str, team2_id: str, now: float, as_of: float = None) -> float:
+        """Mean map win-rate edge of team 1 over the maps either team plays"""
+        pool = self.team_maps.get(team1_id, set()) | self.team_maps.get(team2_id, set())
+        edges = []
+        for m in pool:
+            agg1 = self._get("maps", (team1_id, m), as_of)
+            agg2 = self._get("maps", (team2_id, m), as_of)
+            if agg1 is None and agg2 is None:
+                continue  # Neither team had played the map yet
+            edges.append(_read(agg1, now, MAP_HALF_LIFE_DAYS)[0] - _read(agg2, now, MAP_HALF_LIFE_DAYS)[0])
+        return sum(edges) / len(edges) if edges else 0.0
+
+    def match_features(self, team1_id: str, team2_id: str, now: float, as_of: float = None) -> Dict:
+        """All index features for one pairing"""
+        form1 = self.recent_form(team1_id, now, as_of)
+        form2 = self.recent_form(team2_id, now, as_of)
+        return {
+            **self.head_to_head(team1_id, team2_id, now, as_of),
+            "team1_form": form1["win_rate"],
+            "team2_form": form2["win_rate"],
+            "form_diff": form1["win_rate"] - form2["win_rate"],
+            "form_round_diff": form1["round_diff"] - form2["round_diff"],
+            "map_pool_diff": self.map_pool_diff(team1_id, team2_id, now, as_of),
+        }
+
+    def slate_features(self, matches: Iterable[dict], now: float) -> List[Dict]:
+        """Features for every upcoming match on a slate"""
+        return [
+            {"match_id": m.get("id"), **self.match_features(m["team1_id"], m["team2_id"], now)}
+            for m in matches if m.get("team1_id") and m.get("team2_id")
+        ]
+
+    # ==================== BUILDING ====================
+    def replay(self, matches: List[dict]) -> Dict[str, np.ndarray]:
+        """
+        Build the index from match history in chronological order, returning
+        each match's pre-match features (for leak-free training rows)
+        """
+        times = np.array([match_time(m) for m in matches], dtype=np.float64)
+        order = np.argsort(times, kind="stable")
+
+        times = times.tolist()
+
+        match_ids, rows = [], []
+        for idx in order.tolist():
+            match, ts = matches[idx], times[idx]
+            if not match.get("team1_id") or not match.get("team2_id") or ts != ts:
+                continue
+            features = self.match_features(match["team1_id"], match["team2_id"], ts)
+            if self.add_match(match, ts):
+                match_ids.append(match.get("id"))
+                rows.append(features)
+
+        columns = {"match_id": np.array(match_ids, dtype=object)}
+        for name in (rows[0] if rows else {}):
+            columns[name] = np.array([r[name] for r in rows], dtype=np.float64)
+        return columns
+
+    @classmethod
+    def from_database(cls, db) -> "TeamStrengthIndex":
+        """Build the index with one pass over finished matches"""
+        index = cls()
+        index.replay(list(db.get_finished_matches(include_raw=True)))
+        return index
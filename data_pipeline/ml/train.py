@@ -10,20 +10,33 @@ from pathlib import Path
 
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_auc_score
-from xgboost import XGBClassifier
-from lightgbm import LGBMClassifier
 
 sys.path.append('..')
 from database import Database
 from features import FeatureEngineer
+from ratings import TeamRatingEngine
+from team_index import TeamStrengthIndex
+from tuning import make_estimator, tune, walk_forward_cv, load_best_params
+from training_cache import TrainingMatrixCache, CACHE_DIR
+from stats_cache import PlayerStatsCache, CACHE_COLUMNS, typed_column
+from config import SUPABASE_URL
+from registry import ModelRegistry, MODELS_DIR
+from distribution import PropDistributionModel, STATS
+from profiling import span, add_profile_arguments, profiled
 
 
-# Model directory
-MODELS_DIR = Path(__file__).parent / "models"
-MODELS_DIR.mkdir(exist_ok=True)
+# Boosting rounds added per incremental (warm-start) update
+INCREMENTAL_ROUNDS = 25
+
+# Earlier maps a player needs before a map becomes a training row
+MIN_HISTORY = 3
+
+# Training rows assembled per PlayerStatsCache.before_rows batch
+TRAINING_CHUNK_ROWS = 100_000
+
+# Identifying columns of a training row, ahead of its features and labels
+TRAINING_KEYS = ['id', 'player_id', 'match_id', 'map_name', 'scheduled_at', 'created_at',
+                 'line', 'actual_kills', 'went_over']
 
 
 class PlayerKillsModel:
@@ -31,13 +44,23 @@ class PlayerKillsModel:
     Predict if a player will go over/under a kills line
     """
     
-    def __init__(self):
-        self.model = XGBClassifier(
-            n_estimators=100,
-            max_depth=5,
-            learning_rate=0.1,
-            objective='binary:logistic',
-            random_state=42
+    # Used when no tuned config exists (see tuning.py)
+    DEFAULT_CONFIG = {
+        "model": "xgboost",
+        "params": {"max_depth": 5, "learning_rate": 0.1},
+        "n_estimators": 100,
+    }
+    
+    def __init__(self, config: dict = None):
+        # sklearn is imported here rather than at module load, like the
+        # estimators in tuning.make_estimator
+        from sklearn.preprocessing import StandardScaler
+        
+        self.config = config or self.DEFAULT_CONFIG
+        self.model = make_estimator(
+            self.config["model"],
+            self.config["params"],
+            n_estimators=self.config["n_estimators"]
         )
         self.scaler = StandardScaler()
         self.feature_columns = [
@@ -45,18 +68,22 @@ class PlayerKillsModel:
             'kills_std', 'kills_trend', 'kd_ratio',
             'line', 'line_vs_avg', 'matches_count'
         ]
-        self.version = f"kills_v{datetime.now().strftime('%Y%m%d')}"
+        self.version = f"kills_v{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    def prepare_features(self, df: pd.DataFrame) -> np.ndarray:
-        """Extract and scale features"""
+    def prepare_features(self, df: pd.DataFrame, fit: bool = True) -> np.ndarray:
+        """Extract and scale features (fit=False reuses the existing scaler)"""
         X = df[self.feature_columns].fillna(0)
-        return self.scaler.fit_transform(X)
+        return self.scaler.fit_transform(X) if fit else self.scaler.transform(X)
     
-    def train(self, X: np.ndarray, y: np.ndarray):
-        """Train the model"""
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
+    def train(self, X: np.ndarray, y: np.ndarray, cv_threads_per_worker: int = 2):
+        """
+        Train the model on time-ordered rows, holding out the most recent 20%
+        """
+        from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_auc_score
+        
+        split = int(len(X) * 0.8)
+        X_train, X_test = X[:split], X[split:]
+        y_train, y_test = y[:split], y[split:]
         
         self.model.fit(X_train, y_train)
         
@@ -75,29 +102,60 @@ class PlayerKillsModel:
         for metric, value in metrics.items():
             print(f"  {metric}: {value:.4f}")
         
-        # Cross-validation
-        cv_scores = cross_val_score(self.model, X, y, cv=5, scoring='roc_auc')
-        print(f"  CV ROC-AUC: {cv_scores.mean():.4f} (+/- {cv_scores.std() * 2:.4f})")
+        # Walk-forward cross-validation (folds fitted in parallel)
+        cv = walk_forward_cv(
+            X, y, self.config["model"], self.config["params"],
+            threads_per_worker=cv_threads_per_worker
+        )
+        cv_scores = np.array([r["roc_auc"] for r in cv])
+        print(f"  CV ROC-AUC: {np.nanmean(cv_scores):.4f} (+/- {np.nanstd(cv_scores) * 2:.4f})")
+        metrics["cv_roc_auc"] = float(np.nanmean(cv_scores))
         
         return metrics
     
+    def train_incremental(self, X: np.ndarray, y: np.ndarray, rounds: int = INCREMENTAL_ROUNDS):
+        """
+        Continue boosting from the current booster on newly labeled rows.
+        X must be scaled with the existing scaler (prepare_features(fit=False)).
+        """
+        from sklearn.metrics import roc_auc_score
+        
+        if len(np.unique(y)) > 1:
+            _, proba = self.predict(X)
+            print(f"  ROC-AUC on new rows before update: {roc_auc_score(y, proba):.4f}")
+        
+        model = make_estimator(self.config["model"], self.config["params"], n_estimators=rounds)
+        if self.config["model"] == "xgboost":
+            model.fit(X, y, xgb_model=self.model.get_booster())
+        else:
+            model.fit(X, y, init_model=self.model.booster_)
+        
+        self.model = model
+        self.version = f"kills_v{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        print(f"  Added {rounds} boosting rounds on {len(X)} new rows")
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probability of the over for scaled rows"""
+        return self.model.predict_proba(X)[:, 1]
+    
     def predict(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
-        """Return predictions and probabilities"""
-        preds = self.model.predict(X)
-        probas = self.model.predict_proba(X)[:, 1]
-        return preds, probas
+        """Return predictions and probabilities (labels derived from one scoring pass)"""
+        probas = self.predict_proba(X)
+        return (probas > 0.5).astype(np.int64), probas
     
     def save(self, path: Path = None):
         """Save model to disk"""
         if path is None:
             path = MODELS_DIR / f"{self.version}.pkl"
         
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
         with open(path, 'wb') as f:
             pickle.dump({
                 'model': self.model,
                 'scaler': self.scaler,
                 'feature_columns': self.feature_columns,
-                'version': self.version
+                'version': self.version,
+                'config': self.config
             }, f)
         
         print(f"Model saved to {path}")
@@ -115,7 +173,7 @@ class PlayerKillsModel:
         with open(path, 'rb') as f:
             data = pickle.load(f)
         
-        instance = cls()
+        instance = cls(data.get('config'))
         instance.model = data['model']
         instance.scaler = data['scaler']
         instance.feature_columns = data['feature_columns']
@@ -130,6 +188,9 @@ class MatchWinnerModel:
     """
     
     def __init__(self):
+        from lightgbm import LGBMClassifier
+        from sklearn.preprocessing import StandardScaler
+        
         self.model = LGBMClassifier(
             n_estimators=100,
             max_depth=6,
@@ -138,74 +199,375 @@ class MatchWinnerModel:
             random_state=42
         )
         self.scaler = StandardScaler()
-        self.version = f"match_v{datetime.now().strftime('%Y%m%d')}"
+        self.feature_columns = [
+            'team1_rating', 'team2_rating', 'rating_diff', 'elo_win_prob',
+            'team1_matches', 'team2_matches', 'best_of',
+            'h2h_win_rate', 'h2h_round_diff', 'h2h_weight',
+            'form_diff', 'form_round_diff', 'map_pool_diff'
+        ]
+        self.version = f"match_v{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    # Similar structure to PlayerKillsModel...
-    # Would include team-level features
+    def prepare_features(self, df: pd.DataFrame) -> np.ndarray:
+        """Extract and scale features"""
+        X = df[self.feature_columns].fillna(0)
+        return self.scaler.fit_transform(X)
+    
+    def train(self, X: np.ndarray, y: np.ndarray):
+        """Train the model, holding out the most recent 20% of matches"""
+        from sklearn.metrics import accuracy_score, roc_auc_score
+        
+        split = int(len(X) * 0.8)
+        X_train, X_test = X[:split], X[split:]
+        y_train, y_test = y[:split], y[split:]
+        
+        self.model.fit(X_train, y_train)
+        
+        y_pred = self.model.predict(X_test)
+        y_proba = self.model.predict_proba(X_test)[:, 1]
+        
+        metrics = {
+            "accuracy": accuracy_score(y_test, y_pred),
+            "roc_auc": roc_auc_score(y_test, y_proba),
+        }
+        
+        print(f"Model Performance:")
+        for metric, value in metrics.items():
+            print(f"  {metric}: {value:.4f}")
+        
+        return metrics
+    
+    def predict(self, X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return predictions and team 1 win probabilities"""
+        preds = self.model.predict(X)
+        probas = self.model.predict_proba(X)[:, 1]
+        return preds, probas
+    
+    def save(self, path: Path = None):
+        """Save model to disk"""
+        if path is None:
+            path = MODELS_DIR / f"{self.version}.pkl"
+        
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump({
+                'model': self.model,
+                'scaler': self.scaler,
+                'feature_columns': self.feature_columns,
+                'version': self.version
+            }, f)
+        
+        print(f"Model saved to {path}")
+    
+    @classmethod
+    def load(cls, path: Path = None):
+        """Load model from disk"""
+        if path is None:
+            models = list(MODELS_DIR.glob("match_v*.pkl"))
+            if not models:
+                raise FileNotFoundError("No trained match models found")
+            path = max(models, key=lambda p: p.stem)
+        
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        
+        instance = cls()
+        instance.model = data['model']
+        instance.scaler = data['scaler']
+        instance.feature_columns = data['feature_columns']
+        instance.version = data['version']
+        
+        return instance
 
 
-def build_training_dataset(db: Database, feature_eng: FeatureEngineer) -> pd.DataFrame:
+def build_training_dataset(
+    db: Database, 
+    feature_eng: FeatureEngineer, 
+    since: str = None
+) -> pd.DataFrame:
     """
-    Build training dataset from historical data
+    Build the per-map training dataset from ingested player stats.
+    
+    Each row is one player-map with the features the serving paths had
+    just before it (its player's previous maps, see
+    PlayerStatsCache.before_rows), a line near the player's recent kills
+    average and the labels (actual_<stat>, went_over). Maps with fewer
+    than MIN_HISTORY earlier maps are skipped.
+    since: only rows ingested (created_at) at or after this timestamp,
+    for incremental builds; their history is still read for the features
     """
     print("Building training dataset...")
     
-    # Get completed matches with player stats
-    # This would need to:
-    # 1. Query historical matches
-    # 2. Get player stats for each match
-    # 3. Get the betting lines that were available
-    # 4. Create labels (did they go over/under?)
+    player_ids = None
+    if since is not None:
+        player_ids = {r["player_id"] for r in db.get_player_stats_history(since=since, columns=[])}
+        if not player_ids:
+            return pd.DataFrame(columns=TRAINING_KEYS)
+    
+    rows = list(db.get_player_stats_history(player_ids, columns=list(CACHE_COLUMNS)))
+    if not rows:
+        return pd.DataFrame(columns=TRAINING_KEYS)
+    
+    # Each player's maps in play order, oldest first
+    df = pd.DataFrame(rows)
+    df['scheduled_at'] = df['scheduled_at'].fillna(df['created_at'])
+    df = df.sort_values(['player_id', 'scheduled_at', 'created_at', 'id']).reset_index(drop=True)
+    positions = df.groupby('player_id', sort=False).cumcount().to_numpy()
+    
+    targets = positions >= MIN_HISTORY
+    if since is not None:
+        targets &= (pd.to_datetime(df['created_at'], utc=True) >= pd.Timestamp(since)).to_numpy()
+    targets = np.flatnonzero(targets)
+    
+    columns = {name: typed_column(name, df[name].where(df[name].notna(), None)) for name in CACHE_COLUMNS}
+    frames = []
+    for start in range(0, len(targets), TRAINING_CHUNK_ROWS):
+        chunk = targets[start:start + TRAINING_CHUNK_ROWS]
+        history = PlayerStatsCache.before_rows(
+            df['id'].iloc[chunk].tolist(), columns, chunk, positions[chunk]
+        )
+        frames.append(pd.DataFrame(history.compute_features(), index=chunk))
+    features = pd.concat(frames) if frames else pd.DataFrame()
+    
+    out = df.loc[targets, TRAINING_KEYS[:6]].join(features)
+    for stat in ('kills', 'deaths', 'assists'):
+        out[f'actual_{stat}'] = df.loc[targets, stat]
+    out['line'] = np.floor(out['last10_avg_kills']) + 0.5
+    out['line_vs_avg'] = out['line'] - out['last10_avg_kills']
+    out['went_over'] = (out['actual_kills'] > out['line']).astype(int)
+    
+    print(f"  {len(out)} player-map rows from {df['player_id'].nunique()} players")
+    return out.reset_index(drop=True)
+
+
+def build_match_training_dataset(db: Database) -> pd.DataFrame:
+    """
+    Build match winner training data by replaying all finished matches.
+    Each row carries the ratings and index features both teams had
+    *before* the match.
+    """
+    print("Replaying match history for team ratings...")
+    
+    matches = list(db.get_finished_matches(include_raw=True))
+    
+    engine = TeamRatingEngine()
+    df = pd.DataFrame(engine.replay(matches))
+    df['rating_diff'] = df['team1_rating'] - df['team2_rating']
+    df = df.rename(columns={'expected': 'elo_win_prob'})
+    # Drawn even formats count towards ratings but have no winner to label
+    df = df[df['team1_won'] != 0.5].reset_index(drop=True)
+    
+    index_features = pd.DataFrame(TeamStrengthIndex().replay(matches))
+    if len(index_features):
+        df = df.merge(index_features, on='match_id', how='left')
+    
+    print(f"  Rated {len(df)} matches across {len(engine.index)} teams")
+    return df
+
+
+def train_kills_model(
+    db: Database,
+    feature_eng: FeatureEngineer,
+    args,
+    registry: ModelRegistry = None,
+    cache_dir: Path = CACHE_DIR
+):
+    """
+    Train the kills model from the cached training matrix.
+    
+    Only rows ingested since the cache watermark are assembled from the
+    database. With --incremental the previous booster is warm-started on
+    those rows; a full refit over the whole cached matrix runs otherwise,
+    and periodically even in incremental mode. `registry` and `cache_dir`
+    default to the production locations (the benchmark passes its own).
+    """
+    registry = registry or ModelRegistry()
+    model = PlayerKillsModel(load_best_params())
+    cache = TrainingMatrixCache("kills", model.feature_columns, source=SUPABASE_URL, cache_dir=cache_dir)
+    
+    # Build training data (only rows ingested since the watermark when the
+    # cache is usable; the overlap read again is de-duplicated by row ID)
+    rebuilt = not cache.valid or args.rebuild_cache
+    since = None if rebuilt else cache.read_since
+    with span("features"):
+        df = build_training_dataset(db, feature_eng, since=since)
+    df = df.dropna(subset=['actual_kills'])
+    if not rebuilt:
+        df = df[~df['id'].isin(cache.recent_ids)]
+    # Rows must be time-ordered for walk-forward validation
+    df = df.sort_values('scheduled_at').reset_index(drop=True)
     
-    # Placeholder - in production, this queries real data
-    # For now, return empty DataFrame with expected columns
+    X_new = df.reindex(columns=model.feature_columns).fillna(0).to_numpy(dtype=np.float32)
+    y_new = df['went_over'].to_numpy(dtype=np.float32)
+    ingested = pd.to_datetime(df['created_at'], utc=True)
+    watermark = ingested.max().isoformat() if len(df) else cache.watermark
+    row_ids = list(zip(df['id'], ingested.map(pd.Timestamp.isoformat)))
     
-    columns = [
-        'player_id', 'match_id', 'line',
-        'last5_avg_kills', 'last10_avg_kills',
-        'kills_std', 'kills_trend', 'kd_ratio',
-        'line_vs_avg', 'matches_count',
-        'actual_kills', 'went_over'  # Labels
-    ]
+    if rebuilt:
+        start = str(df['scheduled_at'].iloc[0]) if len(df) else None
+        cache.rebuild(X_new, y_new, watermark, start=start, rows=row_ids)
+    else:
+        cache.append(X_new, y_new, watermark, rows=row_ids)
+        print(f"  Appended {len(df)} new rows to cached matrix ({cache.rows} total)")
     
-    return pd.DataFrame(columns=columns)
+    if cache.rows < 100:
+        print("Insufficient training data. Need at least 100 samples.")
+        print("Make sure to run the data pipeline first to collect historical data.")
+        return
+    
+    # A rebuilt cache holds the whole history: warm-starting on it would
+    # add a second pass of trees over rows the previous model already saw
+    if args.incremental and rebuilt:
+        print("Training cache rebuilt - running full rebuild")
+    elif args.incremental and not cache.needs_full_rebuild():
+        try:
+            previous = registry.load("kills", compiled=False)
+        except FileNotFoundError:
+            previous = None
+        
+        if previous is not None and previous.feature_columns == model.feature_columns:
+            if len(df) == 0:
+                print("No newly labeled rows - model unchanged")
+                return
+            print("Incremental update (warm start)")
+            base_version = previous.version
+            with span("train"):
+                previous.train_incremental(previous.prepare_features(df, fit=False), y_new)
+            cache.mark_incremental()
+            if args.save_model:
+                registry.register(
+                    "kills", previous,
+                    data_window={**cache.data_window(), "warm_start_from": base_version},
+                    promote=not args.challenger
+                )
+            return
+        
+        print("No compatible previous model - running full rebuild")
+    
+    print(f"Full rebuild on {cache.rows} cached rows")
+    X_raw, y = cache.load()
+    X = model.prepare_features(pd.DataFrame(np.asarray(X_raw), columns=model.feature_columns))
+    y = np.asarray(y).astype(int)
+    
+    if args.tune:
+        with span("tune"):
+            tuned = PlayerKillsModel(tune(X, y, threads_per_worker=args.threads_per_worker))
+        tuned.scaler = model.scaler
+        model = tuned
+    
+    with span("train"):
+        metrics = model.train(X, y, cv_threads_per_worker=args.threads_per_worker)
+    cache.mark_full()
+    
+    if args.save_model:
+        registry.register(
+            "kills", model, metrics=metrics,
+            data_window=cache.data_window(), promote=not args.challenger
+        )
+
+
+def train_distribution_model(
+    db: Database,
+    feature_eng: FeatureEngineer,
+    args,
+    stat: str = "kills",
+    df: pd.DataFrame = None
+):
+    """
+    Train the count-distribution model for a prop stat on one row per
+    player-map (lines are not inputs). `df` reuses an already built
+    training dataset.
+    """
+    if df is None:
+        with span("features"):
+            df = build_training_dataset(db, feature_eng)
+    target = f"actual_{stat}"
+    if target not in df.columns:
+        print(f"No {target} labels in the training dataset")
+        return
+    
+    df = df.dropna(subset=[target]).drop_duplicates(['player_id', 'match_id', 'map_name'])
+    df = df.sort_values('scheduled_at').reset_index(drop=True)
+    if len(df) < 100:
+        print("Insufficient training data. Need at least 100 player-matches.")
+        return
+    
+    model = PropDistributionModel(stat)
+    X = model.prepare_features(df)
+    y = df[target].to_numpy(dtype=np.float64)
+    with span("train"):
+        metrics = model.train(X, y)
+    
+    if args.save_model:
+        ModelRegistry().register(
+            f"{stat}_dist", model, metrics=metrics,
+            data_window={
+                "start": str(df['scheduled_at'].iloc[0]),
+                "end": str(df['scheduled_at'].iloc[-1]),
+                "rows": len(df),
+            },
+            promote=not args.challenger
+        )
 
 
 def main():
     parser = argparse.ArgumentParser(description="Train CS2 ML Models")
     parser.add_argument("--save-model", action="store_true", help="Save trained model")
-    parser.add_argument("--model", choices=["kills", "match", "all"], default="all")
+    parser.add_argument("--model", choices=["kills", "match", "dist", "all"], default="all")
+    parser.add_argument("--tune", action="store_true", help="Run walk-forward hyperparameter search for the kills model")
+    parser.add_argument("--threads-per-worker", type=int, default=2, help="Native threads per tuning/CV worker process")
+    parser.add_argument("--incremental", action="store_true", help="Warm-start the kills model on newly labeled rows")
+    parser.add_argument("--rebuild-cache", action="store_true", help="Reassemble the cached training matrix from scratch")
+    parser.add_argument("--challenger", action="store_true", help="Register saved models as challenger instead of promoting them")
+    add_profile_arguments(parser)
     args = parser.parse_args()
     
+    with profiled(args, "train"):
+        run(args)
+
+
+def run(args):
     print(f"Starting model training at {datetime.now().isoformat()}")
     
     db = Database()
     feature_eng = FeatureEngineer(db)
     
-    # Build training data
-    df = build_training_dataset(db, feature_eng)
-    
-    if len(df) < 100:
-        print("Insufficient training data. Need at least 100 samples.")
-        print("Make sure to run the data pipeline first to collect historical data.")
-        return
-    
     if args.model in ["kills", "all"]:
         print("\n=== Training Player Kills Model ===")
-        model = PlayerKillsModel()
-        
-        X = model.prepare_features(df)
-        y = df['went_over'].values
-        
-        metrics = model.train(X, y)
-        
-        if args.save_model:
-            model.save()
+        with span("kills"):
+            train_kills_model(db, feature_eng, args)
+    
+    if args.model in ["dist", "all"]:
+        with span("dist features"):
+            dist_df = build_training_dataset(db, feature_eng)
+        for stat in STATS:
+            print(f"\n=== Training {stat.title()} Distribution Model ===")
+            with span(f"{stat}_dist"):
+                train_distribution_model(db, feature_eng, args, stat=stat, df=dist_df)
     
     if args.model in ["match", "all"]:
         print("\n=== Training Match Winner Model ===")
-        # Similar training for match model
-        pass
+        with span("match features"):
+            match_df = build_match_training_dataset(db)
+        
+        if len(match_df) < 100:
+            print("Insufficient match history. Need at least 100 rated matches.")
+        else:
+            match_model = MatchWinnerModel()
+            X = match_model.prepare_features(match_df)
+            y = match_df['team1_won'].values
+            
+            with span("match train"):
+                metrics = match_model.train(X, y)
+            
+            if args.save_model:
+                ModelRegistry().register(
+                    "match", match_model, metrics=metrics,
+                    data_window={
+                        "rows": len(match_df),
+                        "matches": int(match_df['match_id'].nunique()),
+                    },
+                    promote=not args.challenger
+                )
     
     print(f"\nTraining completed at {datetime.now().isoformat()}")
 
@@ -0,0 +1,189 @@
+"""
+On-disk cache of assembled training matrices
+
+Raw (unscaled) feature rows and labels are stored as flat binary files that
+are memory-mapped on load, plus a small JSON manifest. The cache is keyed by
+a data version derived from the feature columns and the data source (the
+Supabase project), so a feature change or another database forces a
+rebuild, while normal retraining only appends rows ingested since the last
+watermark. The watermark is read back with an overlap, and the IDs of the
+rows inside that overlap are kept so they are not appended twice.
+"""
+import json
+import hashlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+CACHE_DIR = Path(__file__).parent / "cache"
+
+# Bump when feature definitions change without the column names changing
+FEATURE_VERSION = 1
+
+# Full refit after this many incremental updates, or this many days
+FULL_REBUILD_EVERY = 4
+FULL_REBUILD_DAYS = 28
+
+# Rows ingested this long before the watermark are read again (a transaction
+# committing late can carry an earlier created_at)
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+
+def data_version(feature_columns: List[str], source: str = None) -> str:
+    """Stable key for a feature layout read from one data source"""
+    key = json.dumps({"columns": list(feature_columns), "version": FEATURE_VERSION, "source": source})
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def _parse(timestamp: str) -> datetime:
+    return datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+
+
+class TrainingMatrixCache:
+    """Append-only, memory-mapped X/y store for one model"""
+
+    def __init__(self, name: str, feature_columns: List[str], source: str = None, cache_dir: Path = CACHE_DIR):
+        self.dir = Path(cache_dir) / name
+        self.feature_columns = list(feature_columns)
+        self.version = data_version(feature_columns, source)
+        self.meta_path = self.dir / "meta.json"
+        self.x_path = self.dir / "X.f32"
+        self.y_path = self.dir / "y.f32"
+        self.meta = self._read_meta()
+
+    def _read_meta(self) -> Optional[dict]:
+        if not self.meta_path.exists():
+            return None
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        return meta if meta.get("data_version") == self.version else None
+
+    def _write_meta(self):
+        tmp = self.meta_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f, indent=2)
+        tmp.replace(self.meta_path)
+
+    @property
+    def valid(self) -> bool:
+        """Cache exists and matches the current feature layout"""
+        return self.meta is not None
+
+    @property
+    def rows(self) -> int:
+        return self.meta["rows"] if self.meta else 0
+
+    @property
+    def watermark(self) -> Optional[str]:
+        """Ingest time (created_at) of the newest row in the cache"""
+        return self.meta.get("watermark") if self.meta else None
+
+    @property
+    def read_since(self) -> Optional[str]:
+        """Lower bound (inclusive) for reading rows to append: the watermark minus the overlap"""
+        if not self.watermark:
+            return None
+        return (_parse(self.watermark) - WATERMARK_OVERLAP).isoformat()
+
+    @property
+    def recent_ids(self) -> set:
+        """IDs of cached rows ingested within the overlap before the watermark"""
+        return set(self.meta.get("recent", {})) if self.meta else set()
+
+    def _keep_recent(self, rows: Dict[str, str]) -> Dict[str, str]:
+        """The id -> created_at entries inside the overlap before the watermark"""
+        if not self.watermark:
+            return {}
+        cutoff = _parse(self.watermark) - WATERMARK_OVERLAP
+        return {row_id: created_at for row_id, created_at in rows.items() if _parse(created_at) >= cutoff}
+
+    def data_window(self) -> dict:
+        """Span of labeled data in the cache, for the model registry"""
+        if not self.meta:
+            return {}
+        return {"start": self.meta.get("start"), "end": self.watermark, "rows": self.rows}
+
+    def needs_full_rebuild(self) -> bool:
+        """Whether the periodic full refit is due"""
+        if not self.meta:
+            return True
+        if self.meta["incremental_updates"] >= FULL_REBUILD_EVERY:
+            return True
+        last_full = datetime.fromisoformat(self.meta["full_build_at"])
+        return (datetime.now() - last_full).days >= FULL_REBUILD_DAYS
+
+    # ==================== WRITES ====================
+    def rebuild(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        watermark: str = None,
+        start: str = None,
+        rows: List[Tuple[str, str]] = ()
+    ):
+        """
+        Replace the cache with a freshly assembled matrix; `rows` are the
+        (id, created_at) of its rows, for de-duplicating the next append
+        """
+        self.dir.mkdir(parents=True, exist_ok=True)
+        np.ascontiguousarray(X, dtype=np.float32).tofile(self.x_path)
+        np.ascontiguousarray(y, dtype=np.float32).tofile(self.y_path)
+        self.meta = {
+            "data_version": self.version,
+            "feature_columns": self.feature_columns,
+            "rows": int(len(X)),
+            "start": start,
+            "watermark": watermark,
+            "full_build_at": datetime.now().isoformat(),
+            "incremental_updates": 0,
+        }
+        self.meta["recent"] = self._keep_recent(dict(rows))
+        self._write_meta()
+
+    def append(self, X: np.ndarray, y: np.ndarray, watermark: str = None, rows: List[Tuple[str, str]] = ()):
+        """Append newly labeled rows (no-op for an empty batch); `rows` as for rebuild()"""
+        if not self.valid:
+            raise RuntimeError("Training cache is missing or stale; rebuild it first")
+        if len(X) == 0:
+            return
+
+        row_bytes = len(self.feature_columns) * 4
+        # Drop any partial write left behind by an interrupted append
+        for path, size, data in (
+            (self.x_path, self.rows * row_bytes, X),
+            (self.y_path, self.rows * 4, y),
+        ):
+            with open(path, "r+b") as f:
+                f.truncate(size)
+                f.seek(0, 2)
+                f.write(np.ascontiguousarray(data, dtype=np.float32).tobytes())
+
+        self.meta["rows"] += int(len(X))
+        if watermark and (not self.watermark or _parse(watermark) >= _parse(self.watermark)):
+            self.meta["watermark"] = watermark
+        self.meta["recent"] = self._keep_recent({**self.meta.get("recent", {}), **dict(rows)})
+        self._write_meta()
+
+    def mark_incremental(self):
+        """Record an incremental model update against this cache"""
+        self.meta["incremental_updates"] += 1
+        self._write_meta()
+
+    def mark_full(self):
+        """Record a full refit against this cache"""
+        self.meta["incremental_updates"] = 0
+        self.meta["full_build_at"] = datetime.now().isoformat()
+        self._write_meta()
+
+    # ==================== READS ====================
+    def load(self, start: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """Memory-mapped (X, y) from row `start` onward"""
+        if not self.valid or self.rows == 0:
+            return np.empty((0, len(self.feature_columns)), np.float32), np.empty(0, np.float32)
+        X = np.memmap(self.x_path, dtype=np.float32, mode="r",
+                      shape=(self.rows, len(self.feature_columns)))
+        y = np.memmap(self.y_path, dtype=np.float32, mode="r", shape=(self.rows,))
+        return X[start:], y[start:]
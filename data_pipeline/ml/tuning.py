@@ -0,0 +1,270 @@
+"""
+Walk-forward validation and hyperparameter search for the kills model
+
+Rows must be in chronological order. Every (candidate, fold) pair is fitted
+in a process pool; each worker is capped to a fixed number of threads so the
+pool uses all cores without oversubscribing them, and boosters early-stop on
+a validation slice taken from the end of each training window.
+"""
+import os
+import json
+import time
+from itertools import product
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+
+
+MODELS_DIR = Path(__file__).parent / "models"
+BEST_PARAMS_PATH = MODELS_DIR / "kills_best_params.json"
+
+# Search space per booster; every combination is evaluated on every fold
+PARAM_GRID = {
+    "xgboost": {
+        "max_depth": [3, 5, 7],
+        "learning_rate": [0.03, 0.1],
+        "subsample": [0.8, 1.0],
+        "min_child_weight": [1, 5],
+    },
+    "lightgbm": {
+        "num_leaves": [15, 31, 63],
+        "learning_rate": [0.03, 0.1],
+        "subsample": [0.8, 1.0],
+        "min_child_samples": [10, 40],
+    },
+}
+
+MAX_ESTIMATORS = 1000
+EARLY_STOPPING_ROUNDS = 50
+
+# Share of each training window held out for early stopping
+VALIDATION_FRACTION = 0.15
+
+# Shared by all tasks in a worker, set once by the pool initializer
+_X: Optional[np.ndarray] = None
+_Y: Optional[np.ndarray] = None
+_THREADS = 1
+
+
+def walk_forward_splits(
+    n_samples: int,
+    n_splits: int = 5,
+    min_train_fraction: float = 0.5,
+    gap: int = 0
+) -> List[Tuple[int, int, int]]:
+    """
+    Expanding-window splits over time-ordered rows as (train_end, test_start,
+    test_end): train on [0, train_end), test on [test_start, test_end).
+    `gap` rows are skipped between train and test to avoid leakage from
+    matches played close together.
+    """
+    start = int(n_samples * min_train_fraction)
+    fold_size = (n_samples - start) // n_splits
+    if fold_size < 1:
+        raise ValueError(f"Not enough rows ({n_samples}) for {n_splits} walk-forward folds")
+
+    splits = []
+    for k in range(n_splits):
+        test_start = start + k * fold_size
+        test_end = n_samples if k == n_splits - 1 else test_start + fold_size
+        splits.append((max(test_start - gap, 1), test_start, test_end))
+    return splits
+
+
+def candidates(kinds: List[str] = None) -> Iterator[Tuple[str, Dict]]:
+    """All (model kind, params) combinations from PARAM_GRID"""
+    for kind in kinds or list(PARAM_GRID):
+        grid = PARAM_GRID[kind]
+        for values in product(*grid.values()):
+            yield kind, dict(zip(grid.keys(), values))
+
+
+def make_estimator(kind: str, params: Dict, n_jobs: int = None, n_estimators: int = MAX_ESTIMATORS):
+    """Build an unfitted classifier for a search candidate"""
+    if kind == "xgboost":
+        from xgboost import XGBClassifier
+        return XGBClassifier(
+            n_estimators=n_estimators,
+            objective="binary:logistic",
+            eval_metric="logloss",
+            random_state=42,
+            n_jobs=n_jobs,
+            **params
+        )
+    if kind == "lightgbm":
+        from lightgbm import LGBMClassifier
+        return LGBMClassifier(
+            n_estimators=n_estimators,
+            objective="binary",
+            subsample_freq=1,
+            random_state=42,
+            n_jobs=n_jobs,
+            verbose=-1,
+            **params
+        )
+    raise ValueError(f"Unknown model kind: {kind}")
+
+
+def fit_early_stopping(model, kind: str, X: np.ndarray, y: np.ndarray) -> int:
+    """Fit on the head of (X, y), early-stopping on its tail; returns best iteration count"""
+    n_val = max(int(len(X) * VALIDATION_FRACTION), 1)
+    X_fit, y_fit = X[:-n_val], y[:-n_val]
+    X_val, y_val = X[-n_val:], y[-n_val:]
+
+    if kind == "xgboost":
+        model.set_params(early_stopping_rounds=EARLY_STOPPING_ROUNDS)
+        model.fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False)
+        return int(model.best_iteration) + 1
+
+    from lightgbm import early_stopping
+    model.fit(
+        X_fit, y_fit,
+        eval_set=[(X_val, y_val)],
+        callbacks=[early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)]
+    )
+    return int(model.best_iteration_ or model.n_estimators)
+
+
+def _init_worker(X: np.ndarray, y: np.ndarray, threads: int):
+    """Pool initializer: cap native thread pools and receive the data once"""
+    global _X, _Y, _THREADS
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    _X, _Y, _THREADS = X, y, threads
+
+
+def _evaluate(task: Tuple[str, Dict, int, Tuple[int, int, int]]) -> Dict:
+    """Fit one candidate on one fold and score it on the fold's test slice"""
+    from sklearn.metrics import roc_auc_score, log_loss
+
+    kind, params, fold, (train_end, test_start, test_end) = task
+    X_train, y_train = _X[:train_end], _Y[:train_end]
+    X_test, y_test = _X[test_start:test_end], _Y[test_start:test_end]
+
+    started = time.perf_counter()
+    model = make_estimator(kind, params, n_jobs=_THREADS)
+    best_iteration = fit_early_stopping(model, kind, X_train, y_train)
+    proba = model.predict_proba(X_test)[:, 1]
+
+    return {
+        "model": kind,
+        "params": json.dumps(params, sort_keys=True),
+        "fold": fold,
+        "train_rows": train_end,
+        "test_rows": test_end - test_start,
+        "roc_auc": roc_auc_score(y_test, proba) if len(np.unique(y_test)) > 1 else np.nan,
+        "log_loss": log_loss(y_test, proba, labels=[0, 1]),
+        "best_iteration": best_iteration,
+        "fit_seconds": time.perf_counter() - started,
+    }
+
+
+def _pool_size(threads_per_worker: int, max_workers: int = None) -> int:
+    workers = max((os.cpu_count() or 1) // threads_per_worker, 1)
+    return min(workers, max_workers) if max_workers else workers
+
+
+def run_tasks(
+    X: np.ndarray,
+    y: np.ndarray,
+    tasks: List[Tuple],
+    threads_per_worker: int = 2,
+    max_workers: int = None
+) -> List[Dict]:
+    """Evaluate (kind, params, fold, split) tasks in a process pool"""
+    # Spawn rather than fork: OpenMP runtimes already initialised in the
+    # parent are not fork-safe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=_pool_size(threads_per_worker, max_workers),
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(X, y, threads_per_worker)
+    ) as pool:
+        return list(pool.map(_evaluate, tasks))
+
+
+def walk_forward_cv(
+    X: np.ndarray,
+    y: np.ndarray,
+    kind: str,
+    params: Dict,
+    n_splits: int = 5,
+    threads_per_worker: int = 2
+) -> List[Dict]:
+    """Walk-forward scores for a single configuration, folds in parallel"""
+    splits = walk_forward_splits(len(X), n_splits)
+    tasks = [(kind, params, fold, split) for fold, split in enumerate(splits)]
+    return run_tasks(X, y, tasks, threads_per_worker)
+
+
+def tune(
+    X: np.ndarray,
+    y: np.ndarray,
+    kinds: List[str] = None,
+    n_splits: int = 5,
+    threads_per_worker: int = 2,
+    max_workers: int = None,
+    results_path: Path = None,
+    best_path: Path = BEST_PARAMS_PATH
+) -> Dict:
+    """
+    Grid search over PARAM_GRID with walk-forward folds.
+
+    Writes every (candidate, fold) result as CSV and the winning config
+    (lowest mean log loss) as JSON, and returns the winning config.
+    """
+    import pandas as pd
+
+    splits = walk_forward_splits(len(X), n_splits)
+    tasks = [
+        (kind, params, fold, split)
+        for kind, params in candidates(kinds)
+        for fold, split in enumerate(splits)
+    ]
+    print(f"Tuning: {len(tasks)} fits ({len(tasks) // len(splits)} candidates x {len(splits)} folds)")
+
+    started = time.perf_counter()
+    results = pd.DataFrame(run_tasks(X, y, tasks, threads_per_worker, max_workers))
+    print(f"  Completed in {time.perf_counter() - started:.1f}s")
+
+    summary = results.groupby(["model", "params"]).agg(
+        roc_auc=("roc_auc", "mean"),
+        log_loss=("log_loss", "mean"),
+        best_iteration=("best_iteration", "median"),
+    ).reset_index().sort_values("log_loss")
+
+    MODELS_DIR.mkdir(exist_ok=True)
+    if results_path is None:
+        results_path = MODELS_DIR / f"kills_tuning_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+    results.to_csv(results_path, index=False)
+
+    top = summary.iloc[0]
+    best = {
+        "model": top["model"],
+        "params": json.loads(top["params"]),
+        "n_estimators": int(top["best_iteration"]),
+        "cv_roc_auc": float(top["roc_auc"]),
+        "cv_log_loss": float(top["log_loss"]),
+        "n_splits": len(splits),
+        "rows": int(len(X)),
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(best_path, "w") as f:
+        json.dump(best, f, indent=2)
+
+    print(f"  Best: {best['model']} {best['params']} "
+          f"(log loss {best['cv_log_loss']:.4f}, ROC-AUC {best['cv_roc_auc']:.4f})")
+    print(f"  Results written to {results_path}")
+    return best
+
+
+def load_best_params(path: Path = BEST_PARAMS_PATH) -> Optional[Dict]:
+    """Winning config from the last tuning run, if any"""
+    if not Path(path).exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,170 @@
+"""
+Value-bet detection for player props
+
+`PropOddsIndex` holds the latest over/under prices per (match, player,
+prop_type, bookmaker, line), loaded with a single streamed read of
+cs2_player_props. Existing predictions are joined against it as frames, so
+edge and EV are computed for every bookmaker at once and only the best
+price per opportunity (prediction + side) is returned. Count distributions
+(distribution.py) are priced against every line on offer, so alternate
+lines need no extra model calls. Each price also carries the bookmaker's
+own over/under pair with the margin removed (pricing.py), so the edge over
+the fair market price is reported alongside the edge over the raw price.
+"""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from distribution import line_probabilities
+from pricing import devig, margins
+
+
+# Identifies one market price; the newest fetch wins
+ODDS_KEY = ["match_id", "player_id", "prop_type", "bookmaker", "line"]
+
+# Predictions are matched to prices on everything except the bookmaker
+JOIN_KEY = ["match_id", "player_id", "prop_type", "line"]
+
+ODDS_COLUMNS = ODDS_KEY + ["over_odds", "under_odds", "fetched_at"]
+
+
+def _round_line(values) -> np.ndarray:
+    """Lines come back from PostgREST as floats; compare them at DECIMAL(6,2) precision"""
+    return np.round(pd.to_numeric(values, errors="coerce").astype(np.float64), 2)
+
+
+class PropOddsIndex:
+    """Latest prop prices for a slate, keyed by ODDS_KEY"""
+
+    def __init__(self, rows: List[dict]):
+        frame = pd.DataFrame(rows, columns=ODDS_COLUMNS)
+        frame["line"] = _round_line(frame["line"])
+        for col in ("over_odds", "under_odds"):
+            frame[col] = pd.to_numeric(frame[col], errors="coerce")
+        self.frame = (
+            frame.sort_values("fetched_at", ascending=False, kind="stable")
+            .drop_duplicates(ODDS_KEY)
+            .reset_index(drop=True)
+        )
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    @classmethod
+    def from_database(cls, db, match_ids: List[str] = None) -> "PropOddsIndex":
+        """Build the index with one streamed read of upcoming prop lines"""
+        return cls(list(db.get_latest_player_props(match_ids)))
+
+    def find_value(self, predictions: List[Dict], min_edge: float = 0.05) -> List[Dict]:
+        """
+        Best-priced over/under opportunity per prediction with edge >= min_edge,
+        sorted by edge. Predictions are player prop predictions as produced by
+        Predictor.predict_player_props (line and prop_type in features_used).
+        """
+        if not predictions or self.frame.empty:
+            return []
+
+        features = [p.get("features_used") or {} for p in predictions]
+        preds = pd.DataFrame({
+            "pred_idx": np.arange(len(predictions)),
+            "match_id": [p.get("match_id") for p in predictions],
+            "player_id": [p.get("player_id") for p in predictions],
+            "prop_type": [f.get("prop_type") for f in features],
+            "line": _round_line([f.get("line") for f in features]),
+            "p_over": [float(p["predicted_value"]) for p in predictions],
+        })
+
+        joined = preds.merge(self.frame, on=JOIN_KEY, how="inner")
+        joined["p_under"] = 1.0 - joined["p_over"]
+        joined["p_push"] = 0.0
+        return self._best_opportunities(joined, predictions, min_edge)
+
+    def find_value_from_distributions(self, distributions: List[Dict], min_edge: float = 0.05) -> List[Dict]:
+        """
+        Like find_value, but from count distributions (see distribution.py):
+        every line any bookmaker offers for the player and stat is priced
+        from the distribution, alternate lines included. Each distribution
+        is a dict with match_id, player_id, prop_type, mean and dispersion.
+        """
+        if not distributions or self.frame.empty:
+            return []
+
+        dists = pd.DataFrame({
+            "pred_idx": np.arange(len(distributions)),
+            "match_id": [d.get("match_id") for d in distributions],
+            "player_id": [d.get("player_id") for d in distributions],
+            "prop_type": [d.get("prop_type") for d in distributions],
+            "mean": [float(d["mean"]) for d in distributions],
+            "dispersion": [float(d["dispersion"]) for d in distributions],
+        })
+        joined = dists.merge(self.frame, on=["match_id", "player_id", "prop_type"], how="inner")
+        joined = joined[joined["line"].notna()].reset_index(drop=True)
+        if joined.empty:
+            return []
+
+        probs = line_probabilities(joined["mean"].to_numpy(), joined["dispersion"].to_numpy(),
+                                   joined["line"].to_numpy())
+        joined["p_over"], joined["p_under"], joined["p_push"] = probs["over"], probs["under"], probs["push"]
+        # One opportunity per distribution, side and line
+        return self._best_opportunities(joined, distributions, min_edge, per_line=True)
+
+    def _best_opportunities(
+        self,
+        joined: pd.DataFrame,
+        sources: List[Dict],
+        min_edge: float,
+        per_line: bool = False
+    ) -> List[Dict]:
+        """Best price per opportunity from (source, bookmaker) rows carrying side probabilities"""
+        if joined.empty:
+            return []
+
+        # Each book's own over/under pair with its margin removed
+        pair = joined[["over_odds", "under_odds"]].to_numpy(dtype=np.float64)
+        fair = devig(pair)
+        joined = joined.assign(fair_over=fair[:, 0], fair_under=fair[:, 1], margin=margins(pair))
+
+        # One row per (source, bookmaker, side)
+        sides = pd.concat([
+            joined.assign(side="over", odds=joined["over_odds"], prob=joined["p_over"], fair=joined["fair_over"]),
+            joined.assign(side="under", odds=joined["under_odds"], prob=joined["p_under"], fair=joined["fair_under"]),
+        ], ignore_index=True)
+        sides = sides[sides["odds"] > 1.0]
+        if sides.empty:
+            return []
+
+        sides["implied"] = 1.0 / sides["odds"]
+        # A push refunds the stake
+        sides["ev"] = sides["prob"] * sides["odds"] + sides["p_push"] - 1.0
+        sides["edge"] = sides["prob"] - sides["implied"] * (1.0 - sides["p_push"])
+        # One-sided prices have no pair to de-vig; fall back to the raw price
+        sides["fair"] = sides["fair"].fillna(sides["implied"])
+        sides["fair_edge"] = sides["prob"] - sides["fair"] * (1.0 - sides["p_push"])
+        opportunity = ["pred_idx", "side"] + (["line"] if per_line else [])
+        sides["books"] = sides.groupby(opportunity)["bookmaker"].transform("nunique")
+
+        # Highest price per opportunity is also the highest edge and EV
+        best = sides.sort_values("odds", ascending=False, kind="stable").drop_duplicates(opportunity)
+        best = best[best["edge"] >= min_edge].sort_values("edge", ascending=False, kind="stable")
+
+        return [
+            {
+                **sources[row.pred_idx],
+                "prop_type": row.prop_type,
+                "line": float(row.line),
+                "side": row.side,
+                "bookmaker": row.bookmaker,
+                "books_compared": int(row.books),
+                "market_odds": float(row.odds),
+                "market_implied_prob": float(row.implied),
+                "market_fair_prob": float(row.fair),
+                "book_margin": float(row.margin),
+                "our_probability": float(row.prob),
+                "push_probability": float(row.p_push),
+                "edge": float(row.edge),
+                "fair_edge": float(row.fair_edge),
+                "expected_value": float(row.ev),
+            }
+            for row in best.itertuples(index=False)
+        ]
@@ -0,0 +1,211 @@
+"""
+Dependency-aware stage executor for the sync pipeline
+
+A sync is a DAG of stages. Each stage lists the stages it needs, which
+follow the foreign keys (teams before players and matches, matches before
+odds and settlement), and the executor starts every stage as soon as its
+dependencies have finished, on a thread pool, so independent stages of one
+source and whole sources overlap. A failed stage skips the stages that
+depend on it; stages marked `always` (per-source fetch logging) run once
+their dependencies are done whatever the outcome.
+
+    stages = select_stages(all_stages, ["pandascore.*", "odds.insert"])
+    timings = run_stages(stages, max_workers=4)
+    print_timings(timings)
+
+Dependencies outside a selection are treated as met, so a subgraph can be
+run on its own; `select_stages` adds the upstream stages of a selection
+unless with_deps=False. The same rule lets `resume_stages` drop the stages
+a checkpoint (checkpoint.py) records as completed by an interrupted run.
+"""
+import time
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from instrumentation import METRICS
+from profiling import span
+
+
+DEFAULT_WORKERS = 4
+
+
+class Stage:
+    """
+    A named unit of work; `func` returns the number of records it handled (or None).
+    checkpoint=False marks stages whose output only lives in memory (fetches
+    feeding a write stage): they are never recorded as completed and rerun
+    on resume unless everything they feed has completed.
+    """
+
+    def __init__(self, name: str, func: Callable[[], Optional[int]], deps: Iterable[str] = (),
+                 always: bool = False, checkpoint: bool = True):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.always = always
+        self.checkpoint = checkpoint and not always
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={list(self.deps)})"
+
+
+def validate(stages: List[Stage]):
+    """Raise ValueError for duplicate names, unknown dependencies or cycles"""
+    by_name = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Duplicate stage {stage.name}")
+        by_name[stage.name] = stage
+    for stage in stages:
+        unknown = [d for d in stage.deps if d not in by_name]
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown stage(s) {', '.join(unknown)}")
+
+    state: Dict[str, int] = {}  # 1 visiting, 2 done
+
+    def visit(name: str, path: List[str]):
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        state[name] = 1
+        for dep in by_name[name].deps:
+            visit(dep, path + [name])
+        state[name] = 2
+
+    for stage in stages:
+        visit(stage.name, [])
+
+
+def select_stages(stages: List[Stage], patterns: List[str], with_deps: bool = True) -> List[Stage]:
+    """
+    Stages matching any glob pattern (plus their upstream stages), in
+    definition order. `always` stages downstream of a selected stage are
+    added too, so a source that runs any stage still logs its run.
+    """
+    by_name = {s.name: s for s in stages}
+    selected = {s.name for s in stages if any(fnmatch.fnmatchcase(s.name, p) for p in patterns)}
+    unmatched = [p for p in patterns if not any(fnmatch.fnmatchcase(s.name, p) for s in stages)]
+    if unmatched:
+        raise ValueError(f"No stages match {', '.join(unmatched)}")
+
+    if with_deps:
+        queue = list(selected)
+        while queue:
+            for dep in by_name[queue.pop()].deps:
+                if dep not in selected:
+                    selected.add(dep)
+                    queue.append(dep)
+    selected |= {s.name for s in stages if s.always and selected.intersection(s.deps)}
+    return [s for s in stages if s.name in selected]
+
+
+def resume_stages(stages: List[Stage], completed: Iterable[str]) -> Tuple[List[Stage], List[str]]:
+    """
+    Drop the stages an interrupted run completed; returns (stages to run,
+    names dropped). Uncheckpointed stages are dropped once every stage they
+    feed is, and `always` stages once all of their dependencies are.
+    """
+    dropped = {s.name for s in stages if s.checkpoint and s.name in set(completed)}
+    progress = True
+    while progress:
+        progress = False
+        for stage in stages:
+            if stage.name in dropped or stage.checkpoint:
+                continue
+            if stage.always:
+                drop = all(d in dropped for d in stage.deps)
+            else:
+                fed = [s.name for s in stages if stage.name in s.deps and not s.always]
+                drop = bool(fed) and all(name in dropped for name in fed)
+            if drop:
+                dropped.add(stage.name)
+                progress = True
+    return [s for s in stages if s.name not in dropped], [s.name for s in stages if s.name in dropped]
+
+
+def _run_stage(stage: Stage, origin: float, checkpoint=None) -> Dict:
+    started = time.perf_counter()
+    timing = {"status": "success", "start": round(started - origin, 4), "records": None, "error": None}
+    try:
+        timing["records"] = stage.func()
+    except Exception as e:
+        timing["status"] = "failed"
+        timing["error"] = str(e)
+        print(f"  [{stage.name}] ERROR: {e}")
+    timing["seconds"] = round(time.perf_counter() - started, 4)
+    if checkpoint is not None and stage.checkpoint and timing["status"] == "success":
+        checkpoint.complete_stage(stage.name, timing["records"])
+    METRICS.record_stage(stage.name, timing["seconds"], failed=timing["status"] == "failed")
+    return timing
+
+
+def run_stages(stages: List[Stage], max_workers: int = DEFAULT_WORKERS, checkpoint=None) -> Dict[str, Dict]:
+    """
+    Run stages as their dependencies complete; returns per-stage timings
+    (status, start offset and seconds, records, error) in completion order.
+    max_workers=1 runs stages one at a time on the calling thread, inside
+    profiling spans. Completed stages are recorded in `checkpoint` (a
+    checkpoint.Checkpoint) when one is given.
+    """
+    names = {s.name for s in stages}
+    deps = {s.name: [d for d in s.deps if d in names] for s in stages}
+    pending = list(stages)
+    timings: Dict[str, Dict] = {}
+    origin = time.perf_counter()
+
+    def ready() -> List[Stage]:
+        """Pop the stages whose dependencies are done, recording skips as they cascade"""
+        runnable, progress = [], True
+        while progress:
+            progress = False
+            for stage in list(pending):
+                if not all(d in timings for d in deps[stage.name]):
+                    continue
+                pending.remove(stage)
+                progress = True
+                failed = [d for d in deps[stage.name] if timings[d]["status"] != "success"]
+                if failed and not stage.always:
+                    timings[stage.name] = {"status": "skipped", "start": None, "seconds": 0.0,
+                                           "records": None, "error": f"{failed[0]} {timings[failed[0]]['status']}"}
+                else:
+                    runnable.append(stage)
+        return runnable
+
+    if max_workers <= 1:
+        while pending:
+            runnable = ready()
+            if not runnable and pending:
+                raise ValueError(f"Dependency cycle among {', '.join(s.name for s in pending)}")
+            for stage in runnable:
+                with span(stage.name):
+                    timings[stage.name] = _run_stage(stage, origin, checkpoint)
+        return timings
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+        running = {}
+        while pending or running:
+            for stage in ready():
+                running[pool.submit(_run_stage, stage, origin, checkpoint)] = stage.name
+            if not running:
+                if pending:
+                    raise ValueError(f"Dependency cycle among {', '.join(s.name for s in pending)}")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                timings[running.pop(future)] = future.result()
+    return timings
+
+
+def print_timings(timings: Dict[str, Dict], wall_seconds: float = None):
+    """Per-stage table; stage-seconds over wall time is the overlap achieved"""
+    print(f"\n{'stage':<24} {'status':<8} {'start s':>8} {'seconds':>8} {'records':>8}")
+    for name, t in sorted(timings.items(), key=lambda kv: (kv[1]["start"] is None, kv[1]["start"] or 0)):
+        start = f"{t['start']:.2f}" if t["start"] is not None else "-"
+        records = t["records"] if t["records"] is not None else "-"
+        print(f"{name:<24} {t['status']:<8} {start:>8} {t['seconds']:>8.2f} {records:>8}")
+    if wall_seconds:
+        busy = sum(t["seconds"] for t in timings.values())
+        print(f"{len(timings)} stages, {busy:.2f}s of stage time in {wall_seconds:.2f}s "
+              f"({busy / wall_seconds:.1f}x overlap)")
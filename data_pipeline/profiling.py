@@ -0,0 +1,201 @@
+"""
+Built-in profiling for pipeline, training and prediction runs
+
+Stages are marked with tracing spans:
+
+    with span("features"):
+        ...
+
+While profiling is off, `span` returns a shared no-op context manager, so
+instrumented code pays one flag check per span. With `--profile` a
+`Profiler` enables the spans and either
+
+    sample    (default) a background thread samples the main thread's
+              stack every few milliseconds; stacks are prefixed with the
+              active span path and written as folded stacks
+              (<prefix>.folded) for flamegraph.pl, speedscope or inferno
+    cprofile  deterministic cProfile; writes <prefix>.prof for pstats,
+              snakeviz or gprof2dot
+
+and in both modes writes a per-stage timing table (<prefix>.stages.txt,
+also printed): calls, total and self time per span path.
+"""
+import os
+import sys
+import time
+import cProfile
+import threading
+import argparse
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+PROFILE_DIR = "profiles"
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+_enabled = False
+_main_thread = threading.main_thread().ident
+# Active span names on the main thread, outermost first
+_stack: List[str] = []
+# span path -> [calls, total seconds, seconds in child spans]
+_spans: Dict[Tuple[str, ...], List[float]] = {}
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        _stack.append(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        path = tuple(_stack)
+        _stack.pop()
+        stats = _spans.setdefault(path, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        if len(path) > 1:
+            _spans.setdefault(path[:-1], [0, 0.0, 0.0])[2] += elapsed
+        return False
+
+
+def span(name: str):
+    """Tracing span around a stage; a no-op unless a Profiler is running"""
+    if not _enabled or threading.get_ident() != _main_thread:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def stage_table(total: float = None) -> str:
+    """Per-stage timing table, children indented under their parent span"""
+    total = total or sum(stats[1] for path, stats in _spans.items() if len(path) == 1) or 1.0
+    lines = [f"{'stage':<48} {'calls':>7} {'total s':>9} {'self s':>9} {'mean ms':>9} {'%':>6}"]
+
+    def walk(parent: Tuple[str, ...]):
+        children = [p for p in _spans if len(p) == len(parent) + 1 and p[:-1] == parent]
+        for path in sorted(children, key=lambda p: -_spans[p][1]):
+            calls, seconds, child = _spans[path]
+            name = "  " * (len(path) - 1) + path[-1]
+            lines.append(f"{name[:48]:<48} {int(calls):>7} {seconds:>9.3f} {seconds - child:>9.3f} "
+                         f"{seconds / max(calls, 1) * 1000:>9.1f} {seconds / total:>6.1%}")
+            walk(path)
+
+    walk(())
+    return "\n".join(lines)
+
+
+# ==================== PROFILER ====================
+class Profiler:
+    """Enables spans and captures a sampling or deterministic profile"""
+
+    def __init__(self, prefix: str, mode: str = "sample", interval: float = SAMPLE_INTERVAL):
+        self.prefix = prefix
+        self.mode = mode
+        self.interval = interval
+        # Folded stack -> sampled milliseconds
+        self.stacks: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._profile: Optional[cProfile.Profile] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def start(self):
+        global _enabled
+        _spans.clear()
+        _enabled = True
+        self.started = time.perf_counter()
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        global _enabled
+        elapsed = time.perf_counter() - self.started
+        if self._profile is not None:
+            self._profile.disable()
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        _enabled = False
+
+        os.makedirs(os.path.dirname(self.prefix) or ".", exist_ok=True)
+        written = []
+        if self._profile is not None:
+            self._profile.dump_stats(f"{self.prefix}.prof")
+            written.append(f"{self.prefix}.prof")
+        else:
+            with open(f"{self.prefix}.folded", "w") as f:
+                for stack, ms in sorted(self.stacks.items()):
+                    f.write(f"{stack} {ms}\n")
+            written.append(f"{self.prefix}.folded")
+
+        table = stage_table(elapsed)
+        with open(f"{self.prefix}.stages.txt", "w") as f:
+            f.write(table + "\n")
+        written.append(f"{self.prefix}.stages.txt")
+
+        print(f"\n=== Profile ({elapsed:.2f}s) ===")
+        print(table)
+        print(f"Wrote {', '.join(written)}")
+
+    def _sample(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(_main_thread)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            # Weight by elapsed time: samples are delayed while the main thread holds the GIL
+            stack = ";".join([f"[{name}]" for name in list(_stack)] + frames[::-1])
+            self.stacks[stack] = self.stacks.get(stack, 0) + max(int(round((now - last) * 1000)), 1)
+            last = now
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--profile", nargs="?", const="", default=None, metavar="PREFIX",
+                        help=f"Profile the run; outputs go to PREFIX.* (default {PROFILE_DIR}/<script>-<time>)")
+    parser.add_argument("--profile-mode", choices=["sample", "cprofile"], default="sample",
+                        help="Stack sampling (flamegraph folded stacks) or deterministic cProfile")
+
+
+def profiled(args: argparse.Namespace, name: str):
+    """A running Profiler when --profile was given, otherwise a no-op context"""
+    if args.profile is None:
+        return nullcontext()
+    prefix = args.profile or os.path.join(PROFILE_DIR, f"{name}-{datetime.now():%Y%m%d-%H%M%S}")
+    return Profiler(prefix, mode=args.profile_mode)
@@ -73,6 +73,7 @@ CREATE INDEX idx_cs2_matches_external ON public.cs2_matches(external_id);
 CREATE INDEX idx_cs2_matches_status ON public.cs2_matches(status);
 CREATE INDEX idx_cs2_matches_scheduled ON public.cs2_matches(scheduled_at);
 CREATE INDEX idx_cs2_matches_teams ON public.cs2_matches(team1_id, team2_id);
+CREATE INDEX idx_cs2_matches_updated ON public.cs2_matches(updated_at) WHERE status = 'finished';
 
 -- =============================================
 -- CS2 PLAYER STATS TABLE (per match)
@@ -104,6 +105,22 @@ CREATE TABLE public.cs2_player_stats (
 CREATE INDEX idx_cs2_player_stats_player ON public.cs2_player_stats(player_id);
 CREATE INDEX idx_cs2_player_stats_match ON public.cs2_player_stats(match_id);
 CREATE INDEX idx_cs2_player_stats_created ON public.cs2_player_stats(created_at);
+CREATE INDEX idx_cs2_player_stats_recent ON public.cs2_player_stats(player_id, created_at DESC, id DESC);
+
+-- Each player's newest `per_player` stats rows (all players when
+-- player_ids is NULL), so bulk feature reads never stream whole careers.
+-- Ties on created_at are broken by id, matching the readers' ordering.
+CREATE OR REPLACE FUNCTION public.recent_cs2_player_stats(player_ids UUID[] DEFAULT NULL, per_player INTEGER DEFAULT 30)
+RETURNS SETOF public.cs2_player_stats AS $$
+    SELECT s.*
+    FROM public.cs2_player_stats s
+    JOIN (
+        SELECT id, row_number() OVER (PARTITION BY player_id ORDER BY created_at DESC, id DESC) AS recency
+        FROM public.cs2_player_stats
+        WHERE player_ids IS NULL OR player_id = ANY(player_ids)
+    ) ranked ON ranked.id = s.id
+    WHERE ranked.recency <= per_player;
+$$ LANGUAGE sql STABLE;
 
 -- =============================================
 -- CS2 ODDS TABLE
@@ -161,6 +178,7 @@ CREATE TABLE public.cs2_predictions (
     confidence DECIMAL(5,4), -- Model confidence 0-1
     model_version TEXT NOT NULL,
     features_used JSONB, -- Store feature snapshot for analysis
+    fingerprint TEXT, -- '<market>:<inputs>' hash; unchanged props are not re-predicted
     actual_result DECIMAL(8,3), -- Filled after match
     was_correct BOOLEAN, -- Filled after match
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
@@ -171,6 +189,67 @@ CREATE INDEX idx_cs2_predictions_match ON public.cs2_predictions(match_id);
 CREATE INDEX idx_cs2_predictions_player ON public.cs2_predictions(player_id);
 CREATE INDEX idx_cs2_predictions_type ON public.cs2_predictions(prediction_type);
 CREATE INDEX idx_cs2_predictions_model ON public.cs2_predictions(model_version);
+CREATE INDEX idx_cs2_predictions_fingerprint ON public.cs2_predictions(match_id, created_at DESC) WHERE fingerprint IS NOT NULL;
+CREATE INDEX idx_cs2_predictions_unsettled ON public.cs2_predictions(match_id) WHERE evaluated_at IS NULL;
+
+-- =============================================
+-- MODEL PERFORMANCE (running totals over settled predictions)
+-- =============================================
+CREATE TABLE public.cs2_model_performance (
+    model_version TEXT NOT NULL,
+    prediction_type TEXT NOT NULL,
+    settled INTEGER DEFAULT 0, -- Predictions settled, pushes included
+    scored INTEGER DEFAULT 0, -- Settled with a decided outcome
+    correct INTEGER DEFAULT 0,
+    log_loss_sum DOUBLE PRECISION DEFAULT 0,
+    brier_sum DOUBLE PRECISION DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (model_version, prediction_type)
+);
+
+-- Settle a batch of predictions in one statement and fold them into the
+-- running totals. `settlements` is a JSON array of
+-- {id, actual_result, was_correct, log_loss, brier}; already-settled rows
+-- are skipped, so a retried batch is never counted twice.
+CREATE OR REPLACE FUNCTION public.settle_cs2_predictions(settlements JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    settled_count INTEGER;
+BEGIN
+    WITH batch AS (
+        SELECT * FROM jsonb_to_recordset(settlements) AS x(
+            id UUID, actual_result DECIMAL(8,3), was_correct BOOLEAN,
+            log_loss DOUBLE PRECISION, brier DOUBLE PRECISION
+        )
+    ),
+    updated AS (
+        UPDATE public.cs2_predictions p
+        SET actual_result = batch.actual_result,
+            was_correct = batch.was_correct,
+            evaluated_at = NOW()
+        FROM batch
+        WHERE p.id = batch.id AND p.evaluated_at IS NULL
+        RETURNING p.model_version, p.prediction_type, batch.was_correct, batch.log_loss, batch.brier
+    ),
+    totals AS (
+        INSERT INTO public.cs2_model_performance AS m
+            (model_version, prediction_type, settled, scored, correct, log_loss_sum, brier_sum, updated_at)
+        SELECT model_version, prediction_type, COUNT(*), COUNT(was_correct),
+               COUNT(*) FILTER (WHERE was_correct), COALESCE(SUM(log_loss), 0), COALESCE(SUM(brier), 0), NOW()
+        FROM updated
+        GROUP BY model_version, prediction_type
+        ON CONFLICT (model_version, prediction_type) DO UPDATE SET
+            settled = m.settled + EXCLUDED.settled,
+            scored = m.scored + EXCLUDED.scored,
+            correct = m.correct + EXCLUDED.correct,
+            log_loss_sum = m.log_loss_sum + EXCLUDED.log_loss_sum,
+            brier_sum = m.brier_sum + EXCLUDED.brier_sum,
+            updated_at = NOW()
+    )
+    SELECT COUNT(*) INTO settled_count FROM updated;
+    RETURN settled_count;
+END;
+$$ LANGUAGE plpgsql;
 
 -- =============================================
 -- DATA FETCH LOG TABLE (for monitoring)
@@ -185,6 +264,7 @@ CREATE TABLE public.data_fetch_log (
     records_updated INTEGER DEFAULT 0,
     error_message TEXT,
     duration_ms INTEGER,
+    metrics JSONB, -- per-endpoint request latency/bytes/retries/sleep, per-method write rows and time
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
@@ -242,6 +322,7 @@ ALTER TABLE public.cs2_odds ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.cs2_player_props ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.cs2_predictions ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.cs2_player_aggregates ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.cs2_model_performance ENABLE ROW LEVEL SECURITY;
 
 -- Authenticated users can read CS2 data
 CREATE POLICY "Authenticated users can read teams" ON public.cs2_teams FOR SELECT TO authenticated USING (true);
@@ -252,6 +333,7 @@ CREATE POLICY "Authenticated users can read odds" ON public.cs2_odds FOR SELECT
 CREATE POLICY "Authenticated users can read props" ON public.cs2_player_props FOR SELECT TO authenticated USING (true);
 CREATE POLICY "Authenticated users can read predictions" ON public.cs2_predictions FOR SELECT TO authenticated USING (true);
 CREATE POLICY "Authenticated users can read aggregates" ON public.cs2_player_aggregates FOR SELECT TO authenticated USING (true);
+CREATE POLICY "Authenticated users can read model performance" ON public.cs2_model_performance FOR SELECT TO authenticated USING (true);
 
 -- =============================================
 -- USEFUL VIEWS FOR ML
@@ -275,3 +357,23 @@ LEFT JOIN public.cs2_teams t ON p.team_id = t.id
 LEFT JOIN public.cs2_player_aggregates agg_5 ON p.id = agg_5.player_id AND agg_5.time_period = 'last_5'
 LEFT JOIN public.cs2_player_aggregates agg_10 ON p.id = agg_10.player_id AND agg_10.time_period = 'last_10'
 LEFT JOIN public.cs2_player_aggregates agg_30 ON p.id = agg_30.player_id AND agg_30.time_period = 'last_30_days';
+
+-- =============================================
+-- MIGRATIONS (bring a database created from an earlier version of this
+-- file up to date; every statement is a no-op on a fresh install). The
+-- CREATE OR REPLACE FUNCTION definitions above are rerun as they are.
+-- =============================================
+
+-- Per-run request and write metrics (Database.log_fetch writes this column)
+ALTER TABLE public.data_fetch_log ADD COLUMN IF NOT EXISTS metrics JSONB;
+
+-- Prediction change detection (ml/predict.py reuses a market's latest
+-- prediction while its fingerprint is unchanged)
+ALTER TABLE public.cs2_predictions ADD COLUMN IF NOT EXISTS fingerprint TEXT;
+CREATE INDEX IF NOT EXISTS idx_cs2_predictions_fingerprint ON public.cs2_predictions(match_id, created_at DESC) WHERE fingerprint IS NOT NULL;
+
+-- Settlement reads only recently written finished matches
+CREATE INDEX IF NOT EXISTS idx_cs2_matches_updated ON public.cs2_matches(updated_at) WHERE status = 'finished';
+
+-- Per-player recent stats (recent_cs2_player_stats)
+CREATE INDEX IF NOT EXISTS idx_cs2_player_stats_recent ON public.cs2_player_stats(player_id, created_at DESC, id DESC);